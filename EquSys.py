@@ -1,13 +1,24 @@
 import timeit
+from collections import OrderedDict
+from functools import reduce
+from math import gcd
 
 import sympy
 import numpy
-from part1_output import Output
-from equations_util import create_dataframe_part2
-import timeit
 
 import equations_util
+from equations_util import IterationHistory
 from part1_output import Output
+from sparse_util import CSRMatrix, is_sparse
+from matrix_analysis import analyze_matrix
+from binary_io import MappedMatrix
+import shared_jacobi
+from instrumentation import instrument_or_null
+
+try:
+    from gmpy2 import mpz as _integer
+except ImportError:
+    _integer = int
 
 
 def _eliminate(system: sympy.Matrix, i, j):
@@ -21,7 +32,8 @@ def _eliminate(system: sympy.Matrix, i, j):
     """
     n = system.shape[1]
     c = system[j, i] / system[i, i]
-    for k in range(0, n):
+    # columns before i are already eliminated in both rows
+    for k in range(i, n):
         system[j, k] -= c * system[i, k]
     return system
 
@@ -35,7 +47,7 @@ def _back_sub(tri_mat: sympy.Matrix, index_map=None):
     n = tri_mat.shape[0]
     x = sympy.zeros(n, 1)
     if index_map is None:
-        index_map = numpy.array(range(n), dtype=numpy.int)
+        index_map = numpy.array(range(n), dtype=int)
     for i in range(n - 1, -1, -1):
         s = 0
         for j in range(i + 1, n):
@@ -55,7 +67,7 @@ def _forward_sub(a: sympy.Matrix, b:sympy.Matrix, index_map=None):
     n = a.shape[0]
     y = sympy.zeros(n, 1)
     if index_map is None:
-        index_map = numpy.array(range(n), dtype=numpy.int)
+        index_map = numpy.array(range(n), dtype=int)
     y[index_map[0]] = b[index_map[0]]
     for i in range(1, n):
         sum = b[index_map[i]]
@@ -85,7 +97,9 @@ def gauss(system: sympy.Matrix, symbol_list: list):
     output = Output()
     output.title = "Gaussian-Elimination"
     system = system.as_mutable()
+    original = system[:, :]
     n = system.shape[0]
+    perm = numpy.arange(n)
     begin = timeit.default_timer()
     # iterate over columns
     for i in range(0, n):
@@ -93,16 +107,61 @@ def gauss(system: sympy.Matrix, symbol_list: list):
         max_ind = _get_max_elem(system, i)
         # swap current row with the row found to have the maximum element
         system.row_swap(max_ind, i)
+        perm[[i, max_ind]] = perm[[max_ind, i]]
         # forward elimination, iterate over remaining rows and eliminate
         for j in range(i + 1, n):
+            factor = system[j, i] / system[i, i]
             _eliminate(system, i, j)
+            # keep the factor in the eliminated position (the L factor)
+            system[j, i] = factor
     # perform back substitution.
+    x = _back_sub(system)
     end = timeit.default_timer()
     output.execution_time = abs(end - begin)
-    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, _back_sub(system)))
+    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, x))
+    _solution_diagnostics(output, original, x, lambda: (system[:, :n], perm))
     return output
 
 
+def gauss_batch(systems):
+    """
+    Performs gauss elimination with partial pivoting on many independent
+    systems of linear equations of the same size at once, every step is
+    broadcast over the whole batch.
+    :param systems: a [k, n, n + 1] array of augmented matrices.
+    :return: a [k, n] array containing the solutions (NaN rows for singular
+    systems) and a [k] boolean array flagging the singular systems.
+    """
+    s = numpy.array(systems, dtype=numpy.float64)
+    if s.ndim != 3 or s.shape[2] != s.shape[1] + 1:
+        raise ValueError("Expected a [k, n, n + 1] array of augmented matrices")
+    k, n = s.shape[0], s.shape[1]
+    batch = numpy.arange(k)
+    # a pivot below this relative size is treated as zero
+    tolerance = n * numpy.finfo(numpy.float64).eps * numpy.abs(s[:, :, :n]).max(axis=(1, 2))
+    singular = numpy.zeros(k, dtype=bool)
+    pivots = numpy.ones((k, n), dtype=numpy.float64)
+    for i in range(0, n):
+        # find maximum magnitude in this column and swap it into row i of every system
+        max_ind = i + numpy.argmax(numpy.abs(s[:, i:, i]), axis=1)
+        row = s[batch, i].copy()
+        s[batch, i] = s[batch, max_ind]
+        s[batch, max_ind] = row
+        pivot = s[:, i, i]
+        zero = numpy.abs(pivot) <= tolerance
+        singular |= zero
+        pivots[:, i] = numpy.where(zero, 1.0, pivot)
+        # forward elimination of the remaining rows
+        factors = s[:, i + 1:, i] / pivots[:, i, None]
+        s[:, i + 1:, i:] -= factors[:, :, None] * s[:, None, i, i:]
+    # back substitution
+    x = numpy.zeros((k, n), dtype=numpy.float64)
+    for i in range(n - 1, -1, -1):
+        x[:, i] = (s[:, i, n] - numpy.einsum('kj,kj->k', s[:, i, i + 1:n], x[:, i + 1:])) / pivots[:, i]
+    x[singular] = float('NaN')
+    return x, singular
+
+
 def gauss_jordan(system: sympy.Matrix, symbol_list):
     """
     Performs gauss jordan elimination with partial pivoting on a system of
@@ -112,9 +171,14 @@ def gauss_jordan(system: sympy.Matrix, symbol_list):
     :return: a [n, 1] matrix (vector) containing result.
     """
     system = system.as_mutable()
+    original = system[:, :]
     n = system.shape[0]
     output = Output()
     output.title = "Gauss Jordan"
+    # the LU factors are recorded on the way, U row i is the pivot times the
+    # normalized row i before the backward eliminations modify it
+    lu = sympy.zeros(n, n)
+    perm = numpy.arange(n)
     begin = timeit.default_timer()
     # iterate over rows
     for i in range(0, n):
@@ -122,10 +186,16 @@ def gauss_jordan(system: sympy.Matrix, symbol_list):
         max_ind = _get_max_elem(system, i)
         # swap current row with the row found to have the maximum element
         system.row_swap(max_ind, i)
+        lu.row_swap(max_ind, i)
+        perm[[i, max_ind]] = perm[[max_ind, i]]
+        pivot = system[i, i]
         # normalize current row
-        system.row_op(i, lambda u, v: u / system[i, i])
+        system.row_op(i, lambda u, v: u / pivot)
+        for k in range(i, n):
+            lu[i, k] = pivot * system[i, k]
         # forward elimination, iterate over remaining rows and eliminate
         for j in range(i + 1, n):
+            lu[j, i] = system[j, i] / pivot
             _eliminate(system, i, j)
         # forward elimination, iterate over previous rows and eliminate
         for j in range(i - 1, -1, -1):
@@ -133,7 +203,69 @@ def gauss_jordan(system: sympy.Matrix, symbol_list):
     # return last column
     end = timeit.default_timer()
     output.execution_time = abs(end - begin)
-    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, sympy.Matrix(system.col(system.shape[0]))))
+    x = sympy.Matrix(system.col(system.shape[0]))
+    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, x))
+    _solution_diagnostics(output, original, x, lambda: (lu, perm))
+    return output
+
+
+def _integer_rows(system: sympy.Matrix):
+    """
+    Scales each row of a rational augmented matrix by the l.c.m of its
+    denominators, which does not change the solution of the system.
+    :return: a list of rows of integers (gmpy2.mpz if available).
+    """
+    rows = []
+    for i in range(system.shape[0]):
+        entries = [sympy.Rational(v) for v in system.row(i)]
+        scale = reduce(lambda p, q: p * q // gcd(p, q), (int(v.q) for v in entries), 1)
+        rows.append([_integer(int(v.p) * (scale // int(v.q))) for v in entries])
+    return rows
+
+
+def bareiss(system: sympy.Matrix, symbol_list):
+    """
+    Performs fraction-free (Bareiss) elimination on a system of linear equations
+    with rational coefficients. Every intermediate value is an integer whose
+    size grows polynomially, the only divisions are exact ones and the
+    solution is formed by a single division by the determinant at the end.
+    :param system: augmented matrix of the system, exact (integer or rational) entries.
+    :param symbol_list: list of symbols used in the equations.
+    :return: an Output containing the exact solution.
+    """
+    output = Output()
+    output.title = "Bareiss Elimination"
+    begin = timeit.default_timer()
+    m = _integer_rows(sympy.Matrix(system))
+    n = len(m)
+    prev = _integer(1)
+    for k in range(0, n):
+        # any nonzero pivot will do in exact arithmetic
+        if m[k][k] == 0:
+            pivot = next((i for i in range(k + 1, n) if m[i][k] != 0), None)
+            if pivot is None:
+                raise ValueError("The matrix is singular")
+            m[k], m[pivot] = m[pivot], m[k]
+        mk = m[k]
+        for i in range(k + 1, n):
+            mi = m[i]
+            for j in range(k + 1, n + 1):
+                mi[j] = (mi[j] * mk[k] - mi[k] * mk[j]) // prev
+            mi[k] = 0
+        prev = mk[k]
+    # fraction-free back substitution, y = det * x is an integer vector
+    det = m[n - 1][n - 1]
+    y = [_integer(0)] * n
+    for i in range(n - 1, -1, -1):
+        s = det * m[i][n]
+        for j in range(i + 1, n):
+            s -= m[i][j] * y[j]
+        y[i] = s // m[i][i]
+    x = sympy.Matrix([sympy.Rational(int(yi), int(det)) for yi in y])
+    end = timeit.default_timer()
+    output.execution_time = abs(end - begin)
+    output.roots = numpy.array(x).astype(numpy.float64).ravel()
+    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, x))
     return output
 
 
@@ -154,7 +286,323 @@ def _decompose(a, indexMap):
     return a, indexMap
 
 
-def lu_decomp(system: sympy.Matrix, symbol_list):
+def _lu_factor(a: numpy.ndarray):
+    """
+    Performs LU decomposition with partial pivoting on a numpy array, the
+    arithmetic is done in the dtype of a.
+    :param a: [n, n] coefficients matrix, it is not modified.
+    :return: the packed factors (L strictly below the diagonal, its unit
+    diagonal is implied, and U on and above it) and the row permutation.
+    """
+    lu = a.copy()
+    n = lu.shape[0]
+    perm = numpy.arange(n)
+    for i in range(0, n):
+        # find maximum magnitude and index in this column
+        max_ind = i + numpy.argmax(numpy.abs(lu[i:, i]))
+        if lu[max_ind, i] == 0:
+            raise ValueError("The matrix is singular")
+        if max_ind != i:
+            lu[[i, max_ind]] = lu[[max_ind, i]]
+            perm[[i, max_ind]] = perm[[max_ind, i]]
+        # store the factors in-place and eliminate the remaining sub-matrix
+        lu[i + 1:, i] /= lu[i, i]
+        lu[i + 1:, i + 1:] -= numpy.outer(lu[i + 1:, i], lu[i, i + 1:])
+    return lu, perm
+
+
+def _lu_solve(lu: numpy.ndarray, perm: numpy.ndarray, b: numpy.ndarray):
+    """
+    Solves LUx = Pb by forward then back substitution, in the dtype of lu.
+    :return: the n-dimensional solution vector.
+    """
+    n = lu.shape[0]
+    y = b[perm].astype(lu.dtype)
+    for i in range(1, n):
+        y[i] -= lu[i, :i] @ y[:i]
+    for i in range(n - 1, -1, -1):
+        y[i] = (y[i] - lu[i, i + 1:] @ y[i + 1:]) / lu[i, i]
+    return y
+
+
+def _backward_error(a: numpy.ndarray, x: numpy.ndarray, b: numpy.ndarray):
+    """
+    :return: the normwise backward error ||b - Ax|| / (||A|| ||x|| + ||b||) in the infinity norm.
+    """
+    r = b - a @ x
+    denom = numpy.abs(a).sum(axis=1).max() * numpy.abs(x).max() + numpy.abs(b).max()
+    return numpy.abs(r).max() / denom if denom else 0.0
+
+
+def _lu_solve_transpose(lu: numpy.ndarray, perm: numpy.ndarray, c: numpy.ndarray):
+    """
+    Solves A^T z = c with the factors of PA = LU, U^T w = c then L^T v = w and z = P^T v.
+    :return: the n-dimensional solution vector.
+    """
+    n = lu.shape[0]
+    w = c.astype(lu.dtype)
+    for i in range(0, n):
+        w[i] = (w[i] - lu[:i, i] @ w[:i]) / lu[i, i]
+    for i in range(n - 2, -1, -1):
+        w[i] -= lu[i + 1:, i] @ w[i + 1:]
+    z = numpy.empty(n, dtype=lu.dtype)
+    z[perm] = w
+    return z
+
+
+def _inverse_norm1_estimate(lu: numpy.ndarray, perm: numpy.ndarray, max_steps=5):
+    """
+    Estimates ||A^-1||_1 from the factors of PA = LU by Hager's method with
+    Higham's refinements, each step costs two triangular solves, O(n^2).
+    """
+    n = lu.shape[0]
+    x = numpy.full(n, 1.0 / n)
+    estimate = 0.0
+    for k in range(0, max_steps):
+        y = _lu_solve(lu, perm, x)
+        new_estimate = numpy.abs(y).sum()
+        if k > 0 and new_estimate <= estimate:
+            break
+        estimate = new_estimate
+        z = _lu_solve_transpose(lu, perm, numpy.where(y >= 0, 1.0, -1.0))
+        j = int(numpy.argmax(numpy.abs(z)))
+        if k > 0 and numpy.abs(z[j]) <= z @ x:
+            break
+        x = numpy.zeros(n)
+        x[j] = 1.0
+    # alternative estimate guarding against the cases Hager's method misses
+    alternating = numpy.array([(-1) ** i * (1 + i / max(n - 1, 1)) for i in range(n)])
+    alternative = 2 * numpy.abs(_lu_solve(lu, perm, alternating)).sum() / (3 * n)
+    return max(estimate, alternative)
+
+
+def _solution_diagnostics(output: Output, system, x, factors):
+    """
+    Fills roots, residual, backward_error and condition_estimate of an Output
+    from the solution of a direct method, the condition number is estimated
+    from the existing factors so no extra factorization is needed.
+    :param system: the original augmented matrix.
+    :param x: the solution.
+    :param factors: a function returning the packed LU factors and the row
+    permutation of the factorization PA = LU.
+    """
+    try:
+        system = numpy.array(system).astype(numpy.float64)
+        x = numpy.array(x).astype(numpy.float64).ravel()
+        lu, perm = factors()
+        lu = numpy.array(lu).astype(numpy.float64)
+    except (TypeError, ValueError):
+        # exact arithmetic produced non-finite values (singular system)
+        return
+    n = system.shape[0]
+    a, b = system[:, :n], system[:, n]
+    output.roots = x
+    output.residual = numpy.abs(b - a @ x).max()
+    output.backward_error = _backward_error(a, x, b)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        output.condition_estimate = numpy.abs(a).sum(axis=0).max() * _inverse_norm1_estimate(lu, perm)
+    if numpy.all(numpy.isfinite(lu)) and numpy.all(lu.diagonal()):
+        output.factors = FactoredSystem(a, lu, perm)
+
+
+class FactoredSystem:
+    """
+    The LU factors of a coefficients matrix kept between solves. Edits to the
+    matrix are applied as a low-rank correction with the Sherman-Morrison-Woodbury
+    formula instead of a new factorization: with A = A0 + U V^T, where U selects
+    the k edited rows and V^T holds their changes,
+    A^-1 b = y - W (I + V^T W)^-1 V^T y, y = A0^-1 b and W = A0^-1 U.
+    An edit of k rows costs O(k n^2) and a solve O(n^2 + k n).
+    Fields:
+    -------
+    a: the current [n, n] float64 coefficients matrix
+    base: the matrix A0 that lu and perm factor
+    lu: the packed LU factors of base
+    perm: the row permutation of the factorization
+    rows: the rows in which a differs from base
+    rank: the rank k of the correction, len(rows)
+    max_rank: the largest correction kept before refactoring a
+    tolerance: the largest backward error accepted before refactoring a
+    refactors: the number of full factorizations done after the first one
+    """
+
+    def __init__(self, a, lu=None, perm=None, max_rank=None, tolerance=None):
+        self.a = numpy.array(a, dtype=numpy.float64)
+        n = self.a.shape[0]
+        if lu is None:
+            lu, perm = _lu_factor(self.a)
+        self.base = self.a
+        self.lu, self.perm = lu, perm
+        self.rows = numpy.empty(0, dtype=numpy.int64)
+        self.rank = 0
+        self.max_rank = max(1, n // 8) if max_rank is None else max_rank
+        self.tolerance = 1e3 * numpy.sqrt(n) * numpy.finfo(numpy.float64).eps if tolerance is None else tolerance
+        self.refactors = 0
+        # A0^-1 e_i of every edited row i, kept while the base does not change
+        self._columns = {}
+        self._correction = None
+
+    def refactor(self):
+        """
+        Factors the current matrix from scratch and drops the correction, O(n^3).
+        """
+        self.lu, self.perm = _lu_factor(self.a)
+        self.base = self.a
+        self.rows = numpy.empty(0, dtype=numpy.int64)
+        self.rank = 0
+        self.refactors += 1
+        self._columns = {}
+        self._correction = None
+
+    def update(self, a):
+        """
+        Replaces the coefficients matrix, only the rows that differ from the
+        factored matrix are corrected, refactors when too many rows changed or
+        the correction is singular.
+        :param a: [n, n] the edited coefficients matrix.
+        """
+        self.a = numpy.array(a, dtype=numpy.float64)
+        rows = numpy.flatnonzero((self.a != self.base).any(axis=1))
+        if len(rows) > self.max_rank:
+            self.refactor()
+            return
+        self.rows, self.rank = rows, len(rows)
+        if not self.rank:
+            self._correction = None
+            return
+        n = self.a.shape[0]
+        for i in rows:
+            if i not in self._columns:
+                e = numpy.zeros(n)
+                e[i] = 1.0
+                self._columns[i] = _lu_solve(self.lu, self.perm, e)
+        w = numpy.column_stack([self._columns[i] for i in rows])
+        vt = self.a[rows] - self.base[rows]
+        try:
+            capacitance = _lu_factor(numpy.eye(self.rank) + vt @ w)
+        except ValueError:
+            self.refactor()
+            return
+        self._correction = (w, vt, capacitance)
+
+    def solve(self, b):
+        """
+        Solves the current system, refactors and solves again if the backward
+        error of the corrected solution exceeds the tolerance.
+        :return: the n-dimensional solution vector.
+        """
+        x = _lu_solve(self.lu, self.perm, b)
+        if self._correction is None:
+            return x
+        w, vt, capacitance = self._correction
+        x -= w @ _lu_solve(*capacitance, vt @ x)
+        if not _backward_error(self.a, x, b) <= self.tolerance:
+            self.refactor()
+            x = _lu_solve(self.lu, self.perm, b)
+        return x
+
+
+def _mixed_precision_solve(a: numpy.ndarray, b: numpy.ndarray, max_refine=30):
+    """
+    Factors a in float32 then recovers float64 accuracy by iterative refinement
+    reusing the float32 factors, falls back to a float64 factorization when the
+    refinement stalls or diverges.
+    :return: the solution, the factors used (LU and permutation), the number
+    of refinement steps and True if the float64 fallback was used.
+    """
+    n = a.shape[0]
+    tolerance = numpy.finfo(numpy.float64).eps * numpy.sqrt(n)
+    try:
+        lu, perm = _lu_factor(a.astype(numpy.float32))
+    except ValueError:
+        lu = None
+    if lu is not None:
+        x = _lu_solve(lu, perm, b).astype(numpy.float64)
+        berr = _backward_error(a, x, b)
+        steps = 0
+        while berr > tolerance and steps < max_refine:
+            d = _lu_solve(lu, perm, b - a @ x).astype(numpy.float64)
+            x_new = x + d
+            berr_new = _backward_error(a, x_new, b)
+            if not berr_new < 0.5 * berr:
+                break
+            x, berr, steps = x_new, berr_new, steps + 1
+        if berr <= tolerance:
+            return x, lu, perm, steps, False
+    lu, perm = _lu_factor(a)
+    x = _lu_solve(lu, perm, b)
+    return x, lu, perm, 0, True
+
+
+def lu_decomp(system: sympy.Matrix, symbol_list, precision=None, factors=None):
+    """
+    Performs LU decomposition with partial pivoting on a system of linear equations.
+    :param system: augmented matrix of the system, sympy.Matrix for exact
+    arithmetic or a float numpy array.
+    :param symbol_list: list of symbols used in the equations.
+    :param precision: None for exact arithmetic on sympy matrices (float64 on
+    numpy arrays), 'double' to factor in float64, or 'mixed' to factor in
+    float32 and refine the solution to float64 accuracy.
+    :param factors: the FactoredSystem (Output.factors) of an earlier solve of
+    a system of the same size, the edited rows are solved by a low-rank update
+    of its factors in float64, precision is then ignored.
+    :return: an Output, the mixed mode also fills refinement_steps.
+    """
+    if factors is not None:
+        return _lu_decomp_updated(system, symbol_list, factors)
+    if precision is None and not isinstance(system, numpy.ndarray):
+        return _lu_decomp_exact(system, symbol_list)
+    if precision not in (None, 'double', 'mixed'):
+        raise ValueError("Invalid precision: " + str(precision))
+    output = Output()
+    output.title = "LU Decomposition"
+    system = numpy.array(system).astype(numpy.float64)
+    n = system.shape[0]
+    a, b = system[:, :n], system[:, n]
+    begin = timeit.default_timer()
+    if precision == 'mixed':
+        x, lu, perm, output.refinement_steps, fallback = _mixed_precision_solve(a, b)
+        output.title += " (float64 fallback)" if fallback else " (mixed precision)"
+    else:
+        lu, perm = _lu_factor(a)
+        x = _lu_solve(lu, perm, b)
+    end = timeit.default_timer()
+    output.execution_time = abs(end - begin)
+    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, x))
+    _solution_diagnostics(output, system, x, lambda: (lu, perm))
+    return output
+
+
+def _lu_decomp_updated(system, symbol_list, factors: FactoredSystem):
+    output = Output()
+    output.title = "LU Decomposition (low-rank update)"
+    system = numpy.array(system).astype(numpy.float64)
+    n = system.shape[0]
+    if factors.a.shape != (n, n):
+        raise ValueError("The factors belong to a system of a different size")
+    a, b = system[:, :n], system[:, n]
+    refactors = factors.refactors
+    begin = timeit.default_timer()
+    factors.update(a)
+    x = factors.solve(b)
+    end = timeit.default_timer()
+    output.execution_time = abs(end - begin)
+    if factors.refactors > refactors:
+        output.title = "LU Decomposition (refactored)"
+    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, x))
+    output.roots = x
+    output.factors = factors
+    output.residual = numpy.abs(b - a @ x).max()
+    output.backward_error = _backward_error(a, x, b)
+    if not factors.rank:
+        # the estimate needs the factors of a itself
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            output.condition_estimate = (numpy.abs(a).sum(axis=0).max() *
+                                         _inverse_norm1_estimate(factors.lu, factors.perm))
+    return output
+
+
+def _lu_decomp_exact(system: sympy.Matrix, symbol_list):
     system = system.as_mutable()
     output = Output()
     output.title = "LU Decomposition"
@@ -162,23 +610,266 @@ def lu_decomp(system: sympy.Matrix, symbol_list):
     n = system.shape[0]
     a = system[:, :n]
     b = system[:, n]
-    indexMap = numpy.array(range(n), dtype=numpy.int)
+    indexMap = numpy.array(range(n), dtype=int)
     a, indexMap = _decompose(a, indexMap)
     y = _forward_sub(a, b, indexMap)
-    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, _back_sub(a.row_join(y), indexMap)))
+    x = _back_sub(a.row_join(y), indexMap)
+    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, x))
     end = timeit.default_timer()
     output.execution_time = abs(end - begin)
+    _solution_diagnostics(output, system, x, lambda: (a.extract(list(indexMap), list(range(n))), indexMap))
     return output
 
 
-def jacobi(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x=None):
+def _split_system(system):
+    """
+    Splits an augmented system (sympy.Matrix, numpy array or CSRMatrix) into a
+    float64 coefficients matrix, kept in CSR form if sparse, and a r.h.s vector.
+    """
+    if is_sparse(system):
+        return CSRMatrix.from_any(system).split_augmented()
+    system = numpy.array(system).astype(numpy.float64)
+    return system[:, :-1], system[:, -1].copy()
+
+
+def _band(a, lower, upper, extra=0):
+    """
+    Extracts the band of a into row-window storage, band[i, c] holds
+    a[i, i - lower + c] for c in [0, lower + upper + extra], costs O(nnz) for
+    CSR matrices and O(n * width) for dense ones.
+    :param extra: additional zero super-diagonals reserved for fill-in.
+    """
+    n = a.shape[0]
+    band = numpy.zeros((n, lower + upper + extra + 1), dtype=numpy.float64)
+    if isinstance(a, CSRMatrix):
+        rows, cols, values = a.row_ids, a.indices, a.data
+    else:
+        rows, cols = numpy.nonzero(a)
+        values = a[rows, cols]
+    offsets = cols - rows
+    inside = (offsets >= -lower) & (offsets <= upper)
+    if not numpy.all(inside):
+        raise ValueError("The matrix has nonzeros outside the band")
+    numpy.add.at(band, (rows, offsets + lower), values)
+    return band
+
+
+def _structured_output(title, symbol_list, x, begin):
+    output = Output()
+    output.title = title
+    output.execution_time = abs(timeit.default_timer() - begin)
+    output.roots = x
+    output.dataframes.append(equations_util.create_equ_sys_df(symbol_list, x))
+    return output
+
+
+def thomas(system, symbol_list):
+    """
+    Solves a tridiagonal system of linear equations with the Thomas algorithm
+    in O(n), without pivoting (stable for diagonally dominant or symmetric
+    positive definite matrices).
+    :param system: augmented matrix of the system, sympy.Matrix, numpy array or CSRMatrix.
+    :param symbol_list: list of symbols used in the equations.
+    :return: an Output containing the solution.
+    """
+    begin = timeit.default_timer()
+    a, d = _split_system(system)
+    band = _band(a, 1, 1)
+    n = band.shape[0]
+    sub, diag, sup = band[:, 0], band[:, 1].copy(), band[:, 2]
+    # forward elimination of the sub-diagonal
+    for i in range(1, n):
+        if diag[i - 1] == 0:
+            raise ValueError("Zero pivot, the Thomas algorithm needs pivoting for this system")
+        factor = sub[i] / diag[i - 1]
+        diag[i] -= factor * sup[i - 1]
+        d[i] -= factor * d[i - 1]
+    if diag[n - 1] == 0:
+        raise ValueError("Zero pivot, the Thomas algorithm needs pivoting for this system")
+    # back substitution
+    x = numpy.empty(n, dtype=numpy.float64)
+    x[n - 1] = d[n - 1] / diag[n - 1]
+    for i in range(n - 2, -1, -1):
+        x[i] = (d[i] - sup[i] * x[i + 1]) / diag[i]
+    return _structured_output("Thomas Algorithm", symbol_list, x, begin)
+
+
+def banded_lu(system, symbol_list, lower=None, upper=None):
+    """
+    Performs LU decomposition with partial pivoting on a banded system of linear
+    equations in O(n * lower * (lower + upper)), only the band is stored.
+    :param system: augmented matrix of the system, sympy.Matrix, numpy array or CSRMatrix.
+    :param symbol_list: list of symbols used in the equations.
+    :param lower: number of sub-diagonals, detected if None.
+    :param upper: number of super-diagonals, detected if None.
+    :return: an Output containing the solution.
+    """
+    begin = timeit.default_timer()
+    a, b = _split_system(system)
+    if lower is None or upper is None:
+        analysis = analyze_matrix(a)
+        lower, upper = analysis.lower_bandwidth, analysis.upper_bandwidth
+    # pivoting can widen U by `lower` super-diagonals
+    w = _band(a, lower, upper, extra=lower)
+    n = w.shape[0]
+    width = lower + upper
+    pivots = numpy.arange(n)
+    for k in range(0, n):
+        last = min(k + lower, n - 1)
+        # find maximum magnitude in column k, row j holds it at slot k - j + lower
+        candidates = numpy.abs([w[j, k - j + lower] for j in range(k, last + 1)])
+        p = k + int(numpy.argmax(candidates))
+        if w[p, k - p + lower] == 0:
+            raise ValueError("The matrix is singular")
+        cols = min(n, k + width + 1) - k
+        if p != k:
+            pivots[k] = p
+            row_k = w[k, lower:lower + cols].copy()
+            w[k, lower:lower + cols] = w[p, k - p + lower:k - p + lower + cols]
+            w[p, k - p + lower:k - p + lower + cols] = row_k
+        for j in range(k + 1, last + 1):
+            # store the factor in-place and eliminate row j
+            s = k - j + lower
+            factor = w[j, s] / w[k, lower]
+            w[j, s] = factor
+            w[j, s + 1:s + cols] -= factor * w[k, lower + 1:lower + cols]
+    # forward substitution, applying the row interchanges in order
+    for k in range(0, n):
+        if pivots[k] != k:
+            b[k], b[pivots[k]] = b[pivots[k]], b[k]
+        for j in range(k + 1, min(k + lower, n - 1) + 1):
+            b[j] -= w[j, k - j + lower] * b[k]
+    # back substitution
+    x = numpy.empty(n, dtype=numpy.float64)
+    for i in range(n - 1, -1, -1):
+        cols = min(n, i + width + 1) - i
+        x[i] = (b[i] - w[i, lower + 1:lower + cols] @ x[i + 1:i + cols]) / w[i, lower]
+    return _structured_output("Banded LU", symbol_list, x, begin)
+
+
+def cholesky(system, symbol_list):
+    """
+    Solves a symmetric positive definite system of linear equations by
+    Cholesky decomposition A = LL^T, half the work of LU decomposition.
+    :param system: augmented matrix of the system, sympy.Matrix, numpy array or CSRMatrix.
+    :param symbol_list: list of symbols used in the equations.
+    :return: an Output containing the solution.
+    """
+    begin = timeit.default_timer()
+    a, b = _split_system(system)
+    if isinstance(a, CSRMatrix):
+        a = a.toarray()
+    # only the lower triangle is read, the upper one must match it
+    if not numpy.allclose(a, a.T):
+        raise ValueError("The matrix is not symmetric")
+    n = a.shape[0]
+    l = numpy.tril(a)
+    for j in range(0, n):
+        pivot = l[j, j] - l[j, :j] @ l[j, :j]
+        if pivot <= 0:
+            raise ValueError("The matrix is not positive definite")
+        l[j, j] = numpy.sqrt(pivot)
+        l[j + 1:, j] = (l[j + 1:, j] - l[j + 1:, :j] @ l[j, :j]) / l[j, j]
+    y = numpy.empty(n, dtype=numpy.float64)
+    for i in range(0, n):
+        y[i] = (b[i] - l[i, :i] @ y[:i]) / l[i, i]
+    x = numpy.empty(n, dtype=numpy.float64)
+    for i in range(n - 1, -1, -1):
+        x[i] = (y[i] - l[i + 1:, i] @ x[i + 1:]) / l[i, i]
+    return _structured_output("Cholesky Decomposition", symbol_list, x, begin)
+
+
+class WarmStartCache:
+    """
+    Keeps the latest solution of the iterative solvers for each system shape
+    and symbol list, so re-solving a slightly perturbed system (e.g. the next
+    time step) starts from the previous solution instead of zero. The least
+    recently used entries are evicted beyond max_entries.
+    Fields:
+    -------
+    max_entries: the maximum number of systems remembered
+    entries: an OrderedDict mapping (n, symbol names) to [solution, {method
+    title: iterations of its last cold start}]
+    hits: the number of solves seeded from the cache
+    misses: the number of solves that found no compatible solution
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(symbols):
+        return len(symbols), tuple(str(s) for s in symbols)
+
+    def get(self, key):
+        """
+        :return: a copy of the cached solution for key, or None.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0].copy()
+
+    def put(self, key, output: Output):
+        """
+        Stores the solution of output and fills output.iterations_saved for
+        warm starts, from the iterations of the last cold start of the same
+        method. Diverged solutions are not stored.
+        """
+        x = numpy.array(output.roots, dtype=numpy.float64).ravel()
+        entry = self.entries.get(key)
+        cold = {} if entry is None else entry[1]
+        if not output.warm_start:
+            cold[output.title] = output.iterations
+        elif output.title in cold:
+            output.iterations_saved = cold[output.title] - output.iterations
+        if not numpy.all(numpy.isfinite(x)):
+            return
+        self.entries[key] = [x, cold]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def _warm_start(cache, symbols, x, numeric):
+    """
+    Seeds the initial vector from the cache when none is given.
+    :return: the initial vector, the cache key (None when no cache is used)
+    and True if x was taken from the cache.
+    """
+    if cache is None:
+        return x, None, False
+    key = cache.key(symbols)
+    if x is not None:
+        return x, key, False
+    x = cache.get(key)
+    if x is None:
+        return None, key, False
+    return (x if numeric else sympy.Matrix(x)), key, True
+
+
+def jacobi(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x=None, history='full',
+           history_k=1, cache=None, processes=None, instrument=None):
     """Jacobi Iterative Method for Solving A System of Linear Equations:
     takes a system of linear equations and returns an approximate solution
     for the system using Jacobi's approximation.
 
     Keyword arguments:
     A: sympy.Matrix -- The augmented matrix representing the system if b = None
-    else the coefficients matrix. A is an [n, n] matrix.
+    else the coefficients matrix. A is an [n, n] matrix. A can also be a
+    float numpy array, a sparse_util.CSRMatrix (or a scipy.sparse matrix) or a
+    binary_io.MappedMatrix, in which case the sweeps run in float64 (O(nnz)
+    each for sparse matrices, block by block over the file for mapped ones)
+    and b, x may be numpy vectors.
     symbols: list of sympy.Symbol representing the variables' names.
     b: sympy.Matrix -- The r.h.s matrix of the system. b is an n-dimensional
     vector.
@@ -186,6 +877,18 @@ def jacobi(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x
     max_err: float -- The maximum allowed error.
     x: sympy.Matrix -- The initial value for the variables. x is an n-dimensional
     vector.
+    history: str -- Which sweeps to keep in the dataframe, one of 'full', 'every'
+    (every history_k-th sweep), 'last' (the last history_k sweeps) or 'off'.
+    history_k: int -- The step or the length used by the 'every' and 'last' modes.
+    cache: WarmStartCache -- If given and x is None, x is seeded from the latest
+    solution of a system with the same symbols, and the solution is stored back.
+    processes: int -- Split the rows across this many processes sharing A, b
+    and x through shared memory, the sweeps run in float64. A must be held
+    in memory (not a MappedMatrix). Systems with fewer coefficients than
+    shared_jacobi.MIN_NONZEROS are swept serially, the processes would cost
+    more than they save.
+    instrument: instrumentation.Instrumentation -- Collects the iterate and
+    tabulate timings and the iterations, and is called back after each sweep.
 
     return:
     1) The n-dimensional vector x containing the final approximate solution.
@@ -193,45 +896,208 @@ def jacobi(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x
     of x during each iteration.
     3) The numpy array err_hist containing the values of the error during each iteration.
     """
-    A = A.as_mutable()
     n = len(symbols)
     output = Output()
     output.title = "Jacobi"
-    if b is None:
-        A, b = [A[:, :-1], A[:, -1]]
-    if x is None:
-        x = sympy.Matrix.zeros(n, 1)
-    D = A.multiply_elementwise(sympy.Matrix.eye(n))
-    x_prev = x[:, :]
-    err_hist = [float('NaN')]
-    x_hist = sympy.Matrix(x)
-    begin = timeit.default_timer()
-    for _ in range(0, max_iter):
-        x = D.inv() * (b - (A - D) * x)
-        x_hist = x_hist.row_join(x)
-        #print("XHIST:\n", x_hist)
-        diff = (x - x_prev).applyfunc(abs)
-        err = numpy.amax(numpy.array(diff).astype(numpy.float64))
-        err_hist.append(err)
+    instrument = instrument_or_null(instrument)
+    x_hist = IterationHistory(n, max_iter, history, history_k, instrument.iteration)
+    parallel = processes is not None and processes > 1
+    x, key, output.warm_start = _warm_start(cache, symbols, x, parallel or _is_numeric(A))
+    if parallel or _is_numeric(A):
+        A, b, x = _numeric_system(A, b, x, n)
+        diag = A.diagonal()
+        begin = timeit.default_timer()
+        if parallel and isinstance(A, MappedMatrix):
+            raise ValueError("Parallel Jacobi needs the coefficients matrix in memory")
+        if parallel and shared_jacobi.worthwhile(A, processes):
+            output.title = "Jacobi (" + str(processes) + " processes)"
+            x, err = shared_jacobi.iterate(A, b, diag, x, max_iter, max_err, x_hist, processes)
+        else:
+            x, err = _numeric_iterate(lambda v: _jacobi_sweep(A, b, diag, v), x, max_iter, max_err, x_hist)
+        end = timeit.default_timer()
+    else:
+        A = A.as_mutable()
+        if b is None:
+            A, b = [A[:, :-1], A[:, -1]]
+        if x is None:
+            x = sympy.Matrix.zeros(n, 1)
+        D = A.multiply_elementwise(sympy.Matrix.eye(n))
         x_prev = x[:, :]
-        if err < max_err:
-            break
-    end = timeit.default_timer()
+        err, k = float('NaN'), 0
+        x_hist.record(0, x)
+        begin = timeit.default_timer()
+        for k in range(1, max_iter + 1):
+            x = D.inv() * (b - (A - D) * x)
+            diff = (x - x_prev).applyfunc(abs)
+            err = numpy.amax(numpy.array(diff).astype(numpy.float64))
+            x_hist.record(k, x, err)
+            x_prev = x[:, :]
+            if err < max_err:
+                break
+        x_hist.finish(k, x, err)
+        end = timeit.default_timer()
     output.execution_time = abs(end - begin)
+    instrument.add_time('iterate', end - begin)
     output.roots = numpy.array(x[:]).astype(numpy.float64)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe_part2(x_hist, err_hist, symbols))
+    output.iterations = x_hist.last_iteration
+    with instrument.phase('tabulate'):
+        output.dataframes.append(x_hist.to_dataframe(symbols))
+    if key is not None:
+        cache.put(key, output)
+    instrument.finish(output)
     return output
 
 
-def gauss_seidel(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x=None):
+def _is_numeric(A):
+    """
+    :return: True if A is a float array (dense numpy, sparse or memory-mapped)
+    rather than a sympy.Matrix.
+    """
+    return is_sparse(A) or isinstance(A, (numpy.ndarray, MappedMatrix))
+
+
+def _numeric_system(A, b, x, n):
+    """
+    Converts a system of linear equations to float64 numpy arrays, sparse
+    coefficients matrices are kept in CSR form and memory-mapped ones on disk.
+    :param A: augmented matrix if b is None else the coefficients matrix.
+    :param b: r.h.s of the equations or None.
+    :param x: initial value for the variables or None.
+    :param n: number of variables.
+    :return: the coefficients matrix, the r.h.s vector and the initial vector.
+    """
+    if is_sparse(A) or isinstance(A, MappedMatrix):
+        if is_sparse(A):
+            A = CSRMatrix.from_any(A)
+        if b is None:
+            A, b = A.split_augmented()
+    else:
+        A = numpy.array(A).astype(numpy.float64)
+        if b is None:
+            A, b = A[:, :-1], A[:, -1]
+    b = numpy.array(b).astype(numpy.float64).ravel()
+    if x is None:
+        x = numpy.zeros(n, dtype=numpy.float64)
+    else:
+        x = numpy.array(x).astype(numpy.float64).ravel()
+    return A, b, x
+
+
+def _numeric_iterate(sweep, x: numpy.ndarray, max_iter, max_err, x_hist: IterationHistory):
+    """
+    Repeats an in-place sweep over a numpy vector until the maximum change
+    drops below max_err or max_iter sweeps are performed.
+    :param sweep: a function performing one sweep, updating its argument in-place.
+    :param x: initial value for the variables.
+    :param x_hist: the history the values of x and the error are recorded to.
+    :return: the final x and the final error.
+    """
+    x_prev = x.copy()
+    err, k = float('NaN'), 0
+    x_hist.record(0, x)
+    for k in range(1, max_iter + 1):
+        sweep(x)
+        err = numpy.amax(numpy.abs(x - x_prev))
+        x_hist.record(k, x, err)
+        x_prev[:] = x
+        if err < max_err:
+            break
+    x_hist.finish(k, x, err)
+    return x, err
+
+
+def _jacobi_sweep(a, b: numpy.ndarray, diag: numpy.ndarray, x: numpy.ndarray):
+    """
+    Performs one Jacobi sweep, costs O(nnz) when a is a CSRMatrix.
+    :var x: updated in-place.
+    :return: the updated vector x.
+    """
+    x += (b - a @ x) / diag
+    return x
+
+
+def _gauss_seidel_sweep(a, b: numpy.ndarray, diag: numpy.ndarray, x: numpy.ndarray):
+    """
+    Performs one Gauss-Seidel sweep in natural order, costs O(nnz) when a is a
+    CSRMatrix and reads a MappedMatrix from disk one block of rows at a time.
+    :var x: updated in-place.
+    :return: the updated vector x.
+    """
+    if isinstance(a, CSRMatrix):
+        for i in range(a.shape[0]):
+            cols, vals = a.row(i)
+            x[i] += (b[i] - vals @ x[cols]) / diag[i]
+    elif isinstance(a, MappedMatrix):
+        for start, rows in a.blocks():
+            for i in range(len(rows)):
+                x[start + i] += (b[start + i] - rows[i] @ x) / diag[start + i]
+    else:
+        for i in range(a.shape[0]):
+            x[i] += (b[i] - a[i] @ x) / diag[i]
+    return x
+
+
+def _color_unknowns(a):
+    """
+    Greedily colors the adjacency graph of a coefficients matrix so that no two
+    unknowns sharing a nonzero off-diagonal coefficient get the same color.
+    :param a: [n, n] numpy array or CSRMatrix of coefficients.
+    :return: a list of index arrays, one per color class.
+    """
+    n = a.shape[0]
+    if isinstance(a, CSRMatrix):
+        at = a.transpose()
+        neighbours = lambda i: numpy.concatenate((a.row(i)[0], at.row(i)[0]))
+    else:
+        pattern = (a != 0) | (a.T != 0)
+        neighbours = lambda i: pattern[i]
+    colors = numpy.full(n, -1, dtype=numpy.int64)
+    for i in range(n):
+        used = set(colors[neighbours(i)])
+        color = 0
+        while color in used:
+            color += 1
+        colors[i] = color
+    return [numpy.flatnonzero(colors == color) for color in range(colors.max() + 1)]
+
+
+def _color_blocks(a):
+    """
+    :return: a list of (indices, rows of a) pairs, one per color class.
+    """
+    if isinstance(a, MappedMatrix):
+        raise ValueError("Multicolor ordering is not supported for memory-mapped matrices")
+    if isinstance(a, CSRMatrix):
+        return [(c, a.take_rows(c)) for c in _color_unknowns(a)]
+    return [(c, a[c]) for c in _color_unknowns(a)]
+
+
+def _multicolor_sweep(b: numpy.ndarray, diag: numpy.ndarray, x: numpy.ndarray, blocks: list):
+    """
+    Performs one Gauss-Seidel sweep in multicolor order, the unknowns of a color
+    class do not depend on each other so each class is updated as one block.
+    :var x: updated in-place.
+    :return: the updated vector x.
+    """
+    for c, rows in blocks:
+        x[c] += (b[c] - rows @ x) / diag[c]
+    return x
+
+
+def gauss_seidel(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x=None, multicolor=False,
+                 history='full', history_k=1, cache=None, instrument=None):
     """Gauss-Seidel Iterative Method for Solving A System of Linear Equations:
     takes a system of linear equations and returns an approximate solution
     for the system using Gauss-Seidel approximation.
 
     Keyword arguments:
     A: sympy.Matrix -- The augmented matrix representing the system if b = None
-    else the coefficients matrix. A is an [n, n] matrix.
+    else the coefficients matrix. A is an [n, n] matrix. A can also be a
+    float numpy array, a sparse_util.CSRMatrix (or a scipy.sparse matrix) or a
+    binary_io.MappedMatrix, in which case the sweeps run in float64 (O(nnz)
+    each for sparse matrices, block by block over the file for mapped ones)
+    and b, x may be numpy vectors.
     symbols: list of sympy.Symbol representing the variables' names.
     b: sympy.Matrix -- The r.h.s matrix of the system. b is an n-dimensional
     vector.
@@ -239,6 +1105,14 @@ def gauss_seidel(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1
     max_err: float -- The maximum allowed error.
     x: sympy.Matrix -- The initial value for the variables. x is an n-dimensional
     vector.
+    multicolor: bool -- Color the unknowns once and update each color class
+    as a single vectorized block instead of one unknown at a time.
+    history: str -- Which sweeps to keep in the dataframe, one of 'full', 'every'
+    (every history_k-th sweep), 'last' (the last history_k sweeps) or 'off'.
+    history_k: int -- The step or the length used by the 'every' and 'last' modes.
+    cache: WarmStartCache -- If given and x is None, x is seeded from the latest
+    solution of a system with the same symbols, and the solution is stored back.
+    instrument: instrumentation.Instrumentation -- As for jacobi.
 
     return:
     1) The n-dimensional vector x containing the final approximate solution.
@@ -246,35 +1120,494 @@ def gauss_seidel(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1
     of x during each iteration.
     3) The numpy array err_hist containing the values of the error during each iteration.
     """
-    A = A.as_mutable()
     n = len(symbols)
     output = Output()
     output.title = "Gauss-Seidel"
-    if b is None:
-        A, b = [A[:, :-1], A[:, -1]]
-    if x is None:
-        x = sympy.Matrix.zeros(n, 1)
-    x_prev = x[:, :]
-    err_hist = [float('NaN')]
-    x_hist = sympy.Matrix(x)
-    begin = timeit.default_timer()
-    for _ in range(0, max_iter):
-        for i in range(0, n):
-            xi_new = b[i]
-            for j in range(0, n):
-                if i != j:
-                    xi_new -= A[i, j] * x[j]
-                x[i] = xi_new / A[i, i]
-        x_hist = x_hist.row_join(x)
-        diff = (x - x_prev).applyfunc(abs)
-        err = numpy.amax(numpy.array(diff).astype(numpy.float64))
-        err_hist.append(err)
+    instrument = instrument_or_null(instrument)
+    x_hist = IterationHistory(n, max_iter, history, history_k, instrument.iteration)
+    x, key, output.warm_start = _warm_start(cache, symbols, x, multicolor or _is_numeric(A))
+    if multicolor or _is_numeric(A):
+        A, b, x = _numeric_system(A, b, x, n)
+        diag = A.diagonal().copy()
+        if multicolor:
+            output.title = "Gauss-Seidel (Multicolor)"
+            blocks = _color_blocks(A)
+            sweep = lambda v: _multicolor_sweep(b, diag, v, blocks)
+        else:
+            sweep = lambda v: _gauss_seidel_sweep(A, b, diag, v)
+        begin = timeit.default_timer()
+        x, err = _numeric_iterate(sweep, x, max_iter, max_err, x_hist)
+        end = timeit.default_timer()
+    else:
+        A = A.as_mutable()
+        if b is None:
+            A, b = [A[:, :-1], A[:, -1]]
+        if x is None:
+            x = sympy.Matrix.zeros(n, 1)
         x_prev = x[:, :]
-        if err < max_err:
-            break
-    end = timeit.default_timer()
+        err, k = float('NaN'), 0
+        x_hist.record(0, x)
+        begin = timeit.default_timer()
+        for k in range(1, max_iter + 1):
+            for i in range(0, n):
+                xi_new = b[i]
+                for j in range(0, n):
+                    if i != j:
+                        xi_new -= A[i, j] * x[j]
+                    x[i] = xi_new / A[i, i]
+            diff = (x - x_prev).applyfunc(abs)
+            err = numpy.amax(numpy.array(diff).astype(numpy.float64))
+            x_hist.record(k, x, err)
+            x_prev = x[:, :]
+            if err < max_err:
+                break
+        x_hist.finish(k, x, err)
+        end = timeit.default_timer()
     output.execution_time = abs(end - begin)
+    instrument.add_time('iterate', end - begin)
     output.roots = numpy.array(x[:]).astype(numpy.float64)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe_part2(x_hist, err_hist, symbols))
+    output.iterations = x_hist.last_iteration
+    with instrument.phase('tabulate'):
+        output.dataframes.append(x_hist.to_dataframe(symbols))
+    if key is not None:
+        cache.put(key, output)
+    instrument.finish(output)
+    return output
+
+
+def jacobi_preconditioner(a):
+    """
+    Builds a Jacobi (diagonal) preconditioner.
+    :param a: [n, n] numpy array or CSRMatrix of coefficients.
+    :return: a function applying the inverse of the diagonal of a to a vector.
+    """
+    d = a.diagonal().copy()
+    if not numpy.all(d):
+        raise ValueError("Zero on the diagonal, Jacobi preconditioner is not defined")
+    return lambda r: r / d
+
+
+def ilu0_preconditioner(a):
+    """
+    Builds an incomplete LU factorization with zero fill-in, L and U keep the
+    sparsity pattern of a.
+    :param a: [n, n] numpy array or CSRMatrix of coefficients, a MappedMatrix
+    is rejected since the factors would hold the whole matrix in memory.
+    :return: a function applying (LU)^-1 to a vector.
+    """
+    if isinstance(a, MappedMatrix):
+        raise ValueError("ILU(0) is not supported for memory-mapped matrices")
+    a = CSRMatrix.from_any(a)
+    n = a.shape[0]
+    rows = [dict(zip(cols.tolist(), vals.tolist())) for cols, vals in map(a.row, range(n))]
+    for i in range(1, n):
+        row = rows[i]
+        for k in sorted(c for c in row if c < i):
+            if not rows[k].get(k):
+                raise ValueError("Zero pivot in ILU(0) factorization")
+            row[k] /= rows[k][k]
+            for j, v in rows[k].items():
+                if j > k and j in row:
+                    row[j] -= row[k] * v
+    if not rows[n - 1].get(n - 1):
+        raise ValueError("Zero pivot in ILU(0) factorization")
+    lower, upper = [], []
+    diag = numpy.empty(n, dtype=numpy.float64)
+    for i, row in enumerate(rows):
+        lower.append((numpy.array([j for j in row if j < i], dtype=numpy.int64),
+                      numpy.array([v for j, v in row.items() if j < i], dtype=numpy.float64)))
+        upper.append((numpy.array([j for j in row if j > i], dtype=numpy.int64),
+                      numpy.array([v for j, v in row.items() if j > i], dtype=numpy.float64)))
+        diag[i] = row[i]
+
+    def apply(r):
+        z = numpy.array(r, dtype=numpy.float64)
+        for i in range(n):
+            cols, vals = lower[i]
+            z[i] -= vals @ z[cols]
+        for i in range(n - 1, -1, -1):
+            cols, vals = upper[i]
+            z[i] = (z[i] - vals @ z[cols]) / diag[i]
+        return z
+
+    return apply
+
+
+_PRECONDITIONERS = {'jacobi': jacobi_preconditioner, 'ilu0': ilu0_preconditioner}
+
+
+def _krylov(title, steps, A, symbols, b, max_iter, max_err, x, preconditioner, history, history_k, instrument):
+    """
+    Runs a Krylov subspace method and packs its history into an Output.
+    :param steps: a generator function (a, b, x, apply_m) yielding the current
+    approximation and the norm of its residual after each iteration.
+    :param preconditioner: None, a name from _PRECONDITIONERS or a function
+    taking the coefficients matrix and returning a function applying M^-1.
+    :param instrument: an Instrumentation or None.
+    :return: an Output whose dataframe holds the values of x, the error and
+    the relative residual ||b - Ax|| / ||b|| during each iteration.
+    """
+    n = len(symbols)
+    output = Output()
+    output.title = title
+    instrument = instrument_or_null(instrument)
+    A, b, x = _numeric_system(A, b, x, n)
+    begin = timeit.default_timer()
+    if preconditioner is None:
+        apply_m = lambda r: r
+    else:
+        if isinstance(preconditioner, str):
+            output.title += " (" + preconditioner + ")"
+            preconditioner = _PRECONDITIONERS[preconditioner]
+        apply_m = preconditioner(A)
+    b_norm = numpy.linalg.norm(b) or 1.0
+    x_hist = IterationHistory(n, max_iter, history, history_k, instrument.iteration)
+    err, k = float('NaN'), 0
+    res = numpy.linalg.norm(b - A @ x) / b_norm
+    x_hist.record(0, x, err, res)
+    x_prev = x.copy()
+    if res >= max_err and max_iter > 0:
+        for k, (x_k, r_norm) in enumerate(steps(A, b, x.copy(), apply_m), 1):
+            err = numpy.amax(numpy.abs(x_k - x_prev))
+            res = r_norm / b_norm
+            x_prev[:] = x_k
+            x_hist.record(k, x_prev, err, res)
+            if res < max_err or k >= max_iter:
+                break
+    x_hist.finish(k, x_prev, err, res)
+    end = timeit.default_timer()
+    output.execution_time = abs(end - begin)
+    instrument.add_time('iterate', end - begin)
+    output.roots = x_prev
+    output.errors = numpy.append(output.errors, res)
+    output.iterations = x_hist.last_iteration
+    with instrument.phase('tabulate'):
+        output.dataframes.append(x_hist.to_dataframe(symbols, residual=True))
+    instrument.finish(output)
+    return output
+
+
+def _cg_steps(a, b, x, apply_m):
+    r = b - a @ x
+    z = apply_m(r)
+    p = z.copy()
+    rz = r @ z
+    while True:
+        ap = a @ p
+        pap = p @ ap
+        if pap == 0:
+            return
+        alpha = rz / pap
+        x += alpha * p
+        r -= alpha * ap
+        yield x, numpy.linalg.norm(r)
+        z = apply_m(r)
+        rz_new = r @ z
+        p = z + (rz_new / rz) * p
+        rz = rz_new
+
+
+def _bicgstab_steps(a, b, x, apply_m):
+    r = b - a @ x
+    r_hat = r.copy()
+    rho = alpha = omega = 1.0
+    v = p = numpy.zeros_like(b)
+    while True:
+        rho_new = r_hat @ r
+        if rho_new == 0 or omega == 0:
+            return
+        p = r + (rho_new / rho) * (alpha / omega) * (p - omega * v)
+        p_hat = apply_m(p)
+        v = a @ p_hat
+        alpha = rho_new / (r_hat @ v)
+        s = r - alpha * v
+        s_hat = apply_m(s)
+        t = a @ s_hat
+        tt = t @ t
+        omega = (t @ s) / tt if tt else 0.0
+        x += alpha * p_hat + omega * s_hat
+        r = s - omega * t
+        rho = rho_new
+        yield x, numpy.linalg.norm(r)
+
+
+def _gmres_steps(a, b, x, apply_m, restart):
+    n = len(b)
+    m = min(restart, n)
+    while True:
+        r = b - a @ x
+        beta = numpy.linalg.norm(r)
+        if beta == 0:
+            return
+        v = numpy.zeros((m + 1, n))
+        h = numpy.zeros((m + 1, m))
+        cs, sn = numpy.zeros(m), numpy.zeros(m)
+        g = numpy.zeros(m + 1)
+        g[0] = beta
+        v[0] = r / beta
+        for j in range(m):
+            w = a @ apply_m(v[j])
+            # modified Gram-Schmidt orthogonalization against the Krylov basis
+            for i in range(j + 1):
+                h[i, j] = w @ v[i]
+                w -= h[i, j] * v[i]
+            h[j + 1, j] = numpy.linalg.norm(w)
+            breakdown = h[j + 1, j] == 0
+            if not breakdown:
+                v[j + 1] = w / h[j + 1, j]
+            # apply the previous Givens rotations then eliminate h[j + 1, j]
+            for i in range(j):
+                h[i, j], h[i + 1, j] = (cs[i] * h[i, j] + sn[i] * h[i + 1, j],
+                                        -sn[i] * h[i, j] + cs[i] * h[i + 1, j])
+            denom = numpy.hypot(h[j, j], h[j + 1, j])
+            if denom == 0:
+                return
+            cs[j], sn[j] = h[j, j] / denom, h[j + 1, j] / denom
+            h[j, j], h[j + 1, j] = denom, 0.0
+            g[j + 1], g[j] = -sn[j] * g[j], cs[j] * g[j]
+            y = numpy.linalg.solve(h[:j + 1, :j + 1], g[:j + 1])
+            x_j = x + apply_m(v[:j + 1].T @ y)
+            yield x_j, abs(g[j + 1])
+            if breakdown:
+                return
+        x = x_j
+
+
+def conjugate_gradient(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x=None,
+                       preconditioner=None, history='full', history_k=1, instrument=None):
+    """Conjugate Gradient Method for Solving A Symmetric Positive Definite System:
+    takes a system of linear equations with a symmetric positive definite
+    coefficients matrix and returns an approximate solution.
+
+    Keyword arguments:
+    A: sympy.Matrix -- The augmented matrix representing the system if b = None
+    else the coefficients matrix, can be a sparse_util.CSRMatrix.
+    symbols: list of sympy.Symbol representing the variables' names.
+    b: The r.h.s of the system. b is an n-dimensional vector.
+    max_iter: int -- The maximum number of iterations to perform.
+    max_err: float -- The maximum allowed relative residual ||b - Ax|| / ||b||.
+    x: The initial value for the variables. x is an n-dimensional vector.
+    preconditioner: None, 'jacobi', 'ilu0' or a function taking the
+    coefficients matrix and returning a function that applies M^-1.
+    history: str -- Which iterations to keep in the dataframe, one of 'full',
+    'every', 'last' or 'off', see equations_util.IterationHistory.
+    history_k: int -- The step or the length used by the 'every' and 'last' modes.
+    instrument: instrumentation.Instrumentation -- As for jacobi.
+
+    return:
+    An Output whose dataframe contains the values of x, the error and the
+    relative residual during each iteration.
+    """
+    return _krylov("Conjugate Gradient", _cg_steps, A, symbols, b, max_iter, max_err, x, preconditioner,
+                   history, history_k, instrument)
+
+
+def bicgstab(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x=None, preconditioner=None,
+             history='full', history_k=1, instrument=None):
+    """Biconjugate Gradient Stabilized Method for Solving A System of Linear Equations:
+    takes a general (non-symmetric) system of linear equations and returns an
+    approximate solution.
+
+    Keyword arguments are the same as conjugate_gradient.
+    """
+    return _krylov("BiCGSTAB", _bicgstab_steps, A, symbols, b, max_iter, max_err, x, preconditioner,
+                   history, history_k, instrument)
+
+
+def gmres(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x=None, preconditioner=None,
+          restart=20, history='full', history_k=1, instrument=None):
+    """Restarted Generalized Minimal Residual Method GMRES(m) for Solving A System of Linear Equations:
+    takes a general system of linear equations and returns an approximate solution.
+
+    Keyword arguments are the same as conjugate_gradient, in addition to:
+    restart: int -- The dimension m of the Krylov subspace before restarting.
+    Each inner step counts as one iteration.
+    """
+    steps = lambda a, rhs, x0, apply_m: _gmres_steps(a, rhs, x0, apply_m, restart)
+    return _krylov("GMRES(" + str(restart) + ")", steps, A, symbols, b, max_iter, max_err, x, preconditioner,
+                   history, history_k, instrument)
+
+
+# rough costs of the building blocks of the methods, in seconds, used by the
+# automatic dispatcher to compare them (measured with numpy on one core)
+_EXACT_OP = 4e-5        # one sympy arithmetic operation
+_PYTHON_STEP = 5e-6     # one step of a Python loop over the rows
+_LU_FLOP = 1.8e-9       # one flop of the rank-1 updates of LU decomposition
+_BLAS_FLOP = 3.5e-10    # one flop of a dense matrix-vector product
+_SPARSE_FLOP = 7e-9     # one nonzero of a sparse product, with the vector updates
+_ITERATION = 4e-5       # the fixed overhead of one iteration of an iterative method
+_VECTOR_OP = 5e-7       # one row of the vector updates and the history of one iteration
+# exact elimination is preferred while it is expected to take less than this
+EXACT_BUDGET = 0.05
+# a band is not stored when it holds more than this many times the nonzeros
+BAND_FILL = 4
+
+
+def _iterations(analysis, max_err, krylov):
+    """
+    Estimates the iterations needed to reduce the error by max_err from the
+    estimated Jacobi spectral radius rho: log(max_err) / log(rho) sweeps for
+    Jacobi, sqrt(kappa) / 2 * log(2 / max_err) for the Krylov methods with
+    kappa ~ (1 + rho) / (1 - rho), capped at n. Infinite for a stationary
+    method that does not converge.
+    """
+    rho = analysis.spectral_radius
+    reduction = numpy.log(1 / min(max(max_err, 1e-16), 0.5))
+    if krylov:
+        if not rho < 1:
+            return analysis.n
+        kappa = (1 + rho) / (1 - rho)
+        return min(analysis.n, int(numpy.ceil(numpy.sqrt(kappa) / 2 * (reduction + numpy.log(2)))))
+    if not rho < 1:
+        return float('inf')
+    return int(numpy.ceil(reduction / -numpy.log(max(rho, 1e-16))))
+
+
+def _candidates(analysis, max_err):
+    """
+    Lists the methods able to solve a system with the given properties, with
+    their estimated cost in seconds from n, nnz and the bandwidth.
+    :return: a list of (cost, method, extra keyword arguments, reason).
+    """
+    n, nnz = analysis.n, max(analysis.nnz, 1)
+    lower, upper = analysis.lower_bandwidth, analysis.upper_bandwidth
+    likely_spd = analysis.symmetric and analysis.positive_diagonal
+    product = nnz * _SPARSE_FLOP if analysis.sparse else 2 * n * n * _BLAS_FLOP
+    iteration = _ITERATION + n * _VECTOR_OP
+    # the direct methods need the matrix in memory, one left on disk is only
+    # read block by block by the iterative methods
+    in_memory = not analysis.mapped
+    candidates = []
+    if in_memory and analysis.bandwidth <= 1 and (analysis.diagonally_dominant or likely_spd):
+        candidates.append((n * _PYTHON_STEP, thomas, {},
+                           "tridiagonal and diagonally dominant or symmetric, O(n) Thomas algorithm"))
+    if in_memory and n * (2 * lower + upper + 1) <= BAND_FILL * max(nnz, n):
+        candidates.append((n * (lower + 1) * _PYTHON_STEP + n * lower * (lower + upper) * _LU_FLOP, banded_lu,
+                           {'lower': lower, 'upper': upper},
+                           "banded (%d sub- and %d super-diagonals), O(n * bw^2) banded LU" % (lower, upper)))
+    if in_memory and not analysis.sparse:
+        if likely_spd:
+            candidates.append((n ** 3 / 3 * _BLAS_FLOP + 6 * n * _PYTHON_STEP, cholesky, {},
+                               "dense, symmetric with a positive diagonal, likely positive definite"))
+        candidates.append((2 * n ** 3 / 3 * _LU_FLOP + 10 * n * _PYTHON_STEP, lu_decomp, {'precision': 'double'},
+                           "dense system (n = %d), float64 LU decomposition" % n))
+    if analysis.zero_diagonal:
+        candidates.append((n * (iteration + product), gmres, {},
+                           "zero on the diagonal, stationary methods and diagonal preconditioners are undefined"))
+        return candidates
+    rho = analysis.spectral_radius
+    # symmetric with a positive diagonal and rho < 1 is positive definite
+    if likely_spd and rho < 1:
+        iterations = _iterations(analysis, max_err, True)
+        candidates.append((iterations * (iteration + product), conjugate_gradient, {'preconditioner': 'jacobi'},
+                           "symmetric positive definite, ~%d CG iterations" % iterations))
+    if analysis.diagonally_dominant:
+        # Gauss-Seidel sweeps about half as many times as Jacobi, a multicolor
+        # sweep is vectorized and a sweep in natural order loops over the rows
+        sweeps = int(numpy.ceil(_iterations(analysis, max_err, False) / 2))
+        sweep = 5 * product + 3 * n * _VECTOR_OP if analysis.sparse else n * _PYTHON_STEP
+        candidates.append((sweeps * (iteration + sweep), gauss_seidel, {'multicolor': analysis.sparse},
+                           "strictly diagonally dominant, Gauss-Seidel converges in ~%d sweeps" % sweeps))
+    if rho < 1:
+        iterations = _iterations(analysis, max_err, False)
+        candidates.append((iterations * (iteration + product), jacobi, {},
+                           "estimated Jacobi spectral radius %.3g < 1, ~%d sweeps" % (rho, iterations)))
+    iterations = _iterations(analysis, max_err, True)
+    if not in_memory:
+        candidates.append((iterations * (iteration + product), gmres, {'preconditioner': 'jacobi'},
+                           "general system left on disk (estimated Jacobi spectral radius %.3g)" % rho))
+        return candidates
+    # ILU(0) costs a loop over the rows per application
+    candidates.append((nnz * _PYTHON_STEP + iterations * (iteration + product + 2 * n * _PYTHON_STEP), gmres,
+                       {'preconditioner': 'ilu0'},
+                       "general system (estimated Jacobi spectral radius %.3g)" % rho))
+    return candidates
+
+
+def _dispatch(analysis, max_err=1e-5):
+    """
+    Picks a solver from the properties of the coefficients matrix: exact
+    elimination for small dense systems, otherwise the method with the
+    lowest estimated cost (see _candidates).
+    :param analysis: a matrix_analysis.MatrixAnalysis.
+    :param max_err: the accuracy asked of the iterative methods.
+    :return: the solver, its extra keyword arguments and the reason it was picked.
+    """
+    n = analysis.n
+    if not (analysis.sparse or analysis.mapped) and 2 * n ** 3 / 3 * _EXACT_OP <= EXACT_BUDGET:
+        return gauss, {}, "small dense system (n = %d), exact elimination is cheap" % n
+    cost, method, kwargs, reason = min(_candidates(analysis, max_err), key=lambda candidate: candidate[0])
+    return method, kwargs, reason + ", estimated %.2g s" % cost
+
+
+def _augment(A, b):
+    """
+    :return: the augmented matrix [A | b] in the format of A.
+    """
+    if b is None:
+        return A
+    if is_sparse(A):
+        A = CSRMatrix.from_any(A)
+        b = numpy.array(b).astype(numpy.float64).ravel()
+        rows = numpy.flatnonzero(b)
+        return CSRMatrix.from_coo(numpy.concatenate((A.row_ids, rows)),
+                                  numpy.concatenate((A.indices, numpy.full(len(rows), A.shape[1]))),
+                                  numpy.concatenate((A.data, b[rows])), (A.shape[0], A.shape[1] + 1))
+    if isinstance(A, numpy.ndarray):
+        return numpy.column_stack((A, numpy.array(b).astype(numpy.float64).ravel()))
+    return sympy.Matrix(A).row_join(sympy.Matrix(b))
+
+
+_DIRECT_METHODS = (gauss, lu_decomp, thomas, banded_lu, cholesky)
+
+
+def auto(A: sympy.Matrix, symbols: list, b=None, max_iter=100, max_err=1e-5, x=None, instrument=None):
+    """Automatic Solver for A System of Linear Equations:
+    inspects the system once (size, sparsity, symmetry, diagonal dominance,
+    bandwidth and an estimate of the Jacobi spectral radius) and solves it
+    with the method of the lowest estimated cost from n, nnz and the
+    bandwidth, structured (tridiagonal, banded, symmetric positive definite)
+    systems are solved by the specialized direct methods when they are cheaper.
+
+    Keyword arguments are the same as jacobi, instrument is only used when
+    an iterative method is picked. A binary_io.MappedMatrix is only solved by
+    the iterative methods, without ILU(0) or multicolor ordering.
+
+    return:
+    The Output of the picked method, with the name of the method and the
+    reason it was picked in dispatch and dispatch_reason.
+    """
+    n = len(symbols)
+    if b is None:
+        if is_sparse(A):
+            a = CSRMatrix.from_any(A).split_augmented()[0]
+        elif isinstance(A, MappedMatrix):
+            a = A.split_augmented()[0]
+        else:
+            a = A[:, :n]
+    else:
+        a = A
+    begin = timeit.default_timer()
+    analysis = analyze_matrix(a)
+    method, kwargs, reason = _dispatch(analysis, max_err)
+    analysis_time = timeit.default_timer() - begin
+    if method in _DIRECT_METHODS:
+        system = _augment(A, b)
+        if method is gauss:
+            system = sympy.Matrix(system)
+        try:
+            output = method(system, symbols, **kwargs)
+        except ValueError:
+            if method is not cholesky:
+                raise
+            method = lu_decomp
+            reason += ", but Cholesky failed so float64 LU decomposition was used"
+            output = lu_decomp(system, symbols, precision='double')
+    else:
+        output = method(A, symbols, b=b, max_iter=max_iter, max_err=max_err, x=x, instrument=instrument, **kwargs)
+    output.title = "Auto (" + output.title + ")"
+    output.execution_time += analysis_time
+    output.dispatch = method.__name__
+    output.dispatch_reason = reason
     return output
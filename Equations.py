@@ -7,20 +7,22 @@ import matplotlib.pyplot
 import timeit
 from equations_util import *
 from math import log2, ceil
+from instrumentation import instrument_or_null
 
 
-def regula_falsi(expr, arguments, max_err=1e-5, max_iter=50):
+def regula_falsi(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     if len(arguments) != 2:
         raise ValueError("Error! Invalid number of arguments")
     xl, xu = min(arguments[0], arguments[1]), max(arguments[0], arguments[1])
-    f = expr_to_lambda(expr)
+    f = _compile(expr, instrument)
     if f(xl) * f(xu) > 0:
         raise ValueError(
             "Error! There are no roots in the range [%d, %d]" % (xl, xu))
     prev_xr = 0
     symbol = get_symbol(expr)
     output = Output()
-    _init_output(output, "Regula-Falsi", f, expr_to_lambda(diff(expr)))
+    _init_output(output, "Regula-Falsi", f, _compile(_differentiate(expr, instrument), instrument, 'njev'))
     cur_xi = numpy.empty(0, dtype=numpy.float64)
     cur_err_i = numpy.empty(0, dtype=numpy.float64)
     cur_xi = numpy.append(cur_xi, xl)
@@ -41,9 +43,11 @@ def regula_falsi(expr, arguments, max_err=1e-5, max_iter=50):
         prev_xr = xr
         cur_xi = numpy.append(cur_xi, xr)
         cur_err_i = numpy.append(cur_err_i, err)
+        instrument.iteration(xr, err)
         if err <= max_err:
             break
     end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin)
     try:
         yl = f(xl)
         yu = f(xu)
@@ -54,16 +58,18 @@ def regula_falsi(expr, arguments, max_err=1e-5, max_iter=50):
     output.execution_time = abs(end - begin)
     output.roots = numpy.append(output.roots, xr)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe(
-        cur_xi, output.function, cur_err_i, symbol))
+    output.dataframes.append(_tabulate(
+        instrument, cur_xi, output.function, cur_err_i, symbol))
+    instrument.finish(output)
     return output
 
 
-def bisection(expr, arguments, max_err=1e-5, max_iter=50):
+def bisection(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     if len(arguments) != 2:
         raise ValueError("Error! Invalid number of arguments")
     xl, xu = min(arguments[0], arguments[1]), max(arguments[0], arguments[1])
-    f = expr_to_lambda(expr)
+    f = _compile(expr, instrument)
     if f(xl) * f(xu) > 0:
         raise ValueError(
             "Error! There are no roots in the range [%d, %d]" % (xl, xu))
@@ -92,24 +98,28 @@ def bisection(expr, arguments, max_err=1e-5, max_iter=50):
         prev_xr = xr
         cur_xi = numpy.append(cur_xi, xr)
         cur_err_i = numpy.append(cur_err_i, err)
+        instrument.iteration(xr, err)
         if err <= max_err:
             break
     end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin)
     output.execution_time = abs(end - begin)
     output.roots = numpy.append(output.roots, xr)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe(
-        cur_xi, output.function, cur_err_i, symbol))
+    output.dataframes.append(_tabulate(
+        instrument, cur_xi, output.function, cur_err_i, symbol))
+    instrument.finish(output)
     return output
 
 
-def newton(expr, arguments, max_err=1e-5, max_iter=50):
+def newton(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     if len(arguments) != 1:
         raise ValueError("Error! Invalid number of arguments")
     xi = arguments[0]
-    f = expr_to_lambda(expr)
-    expr_diff = diff(expr)
-    f_diff = expr_to_lambda(expr_diff)
+    f = _compile(expr, instrument)
+    expr_diff = _differentiate(expr, instrument)
+    f_diff = _compile(expr_diff, instrument, 'njev')
     symbol = get_symbol(expr)
     output = Output()
     _init_output(output, "Newton-Raphson", f, f_diff)
@@ -126,9 +136,11 @@ def newton(expr, arguments, max_err=1e-5, max_iter=50):
         xi = root
         cur_xi = numpy.append(cur_xi, root)
         cur_err_i = numpy.append(cur_err_i, err)
+        instrument.iteration(root, err)
         if err <= max_err:
             break
     end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin)
     try:
         fxi = f(xi)
         f_diff_xi = f_diff(xi)
@@ -139,18 +151,98 @@ def newton(expr, arguments, max_err=1e-5, max_iter=50):
     output.execution_time = abs(end - begin)
     output.roots = numpy.append(output.roots, root)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe(
-        cur_xi, output.function, cur_err_i, symbol))
+    output.dataframes.append(_tabulate(
+        instrument, cur_xi, output.function, cur_err_i, symbol))
+    instrument.finish(output)
     return output
 
 
-def newton_mod1(expr, arguments, max_err=1e-5, max_iter=50):
+def newton_batch(expr, starts, max_err=1e-5, max_iter=50, instrument=None):
+    """
+    Runs newton from many initial values at once, every iteration evaluates f
+    and f' on the vector of the initial values still iterating. The initial
+    values reaching a zero derivative or a value that is not finite are run
+    again by newton, so they fail the way it does.
+    :param starts: the initial values.
+    :param instrument: its metrics are those of the whole batch, one iteration
+    per vector step and nfev and njev per initial value evaluated.
+    :return: a list holding, for every initial value, the Output newton(expr,
+    [start], max_err, max_iter) returns or the exception it raises.
+    """
+    instrument = instrument_or_null(instrument)
+    with instrument.phase('compile'):
+        f = expr_to_lambda(expr)
+    expr_diff = _differentiate(expr, instrument)
+    with instrument.phase('compile'):
+        f_diff = expr_to_lambda(expr_diff)
+    symbol = get_symbol(expr)
+    k = len(starts)
+    xs = numpy.full((max_iter + 1, k), numpy.nan)
+    errs = numpy.full((max_iter + 1, k), numpy.nan)
+    xs[0] = starts
+    last = numpy.zeros(k, dtype=numpy.int64)
+    slopes = numpy.full(k, numpy.nan)
+    failed = numpy.zeros(k, dtype=bool)
+    active = numpy.arange(k)
+    begin = timeit.default_timer()
+    with numpy.errstate(all='ignore'):
+        for i in range(1, max_iter + 1):
+            if not len(active):
+                break
+            xi = xs[i - 1, active]
+            fxi = numpy.broadcast_to(numpy.asarray(f(xi), dtype=numpy.float64), xi.shape)
+            fxi_diff = numpy.broadcast_to(numpy.asarray(f_diff(xi), dtype=numpy.float64), xi.shape)
+            instrument.count('nfev', len(xi))
+            instrument.count('njev', len(xi))
+            zero = fxi_diff == 0
+            failed[active[zero]] = True
+            active, xi, fxi, fxi_diff = active[~zero], xi[~zero], fxi[~zero], fxi_diff[~zero]
+            root = xi - fxi / fxi_diff
+            err = numpy.abs(root - xi)
+            xs[i, active] = root
+            errs[i, active] = err
+            last[active] = i
+            slopes[active] = fxi_diff
+            instrument.iteration(root, err, i)
+            failed[active[~numpy.isfinite(root)]] = True
+            active = active[numpy.isfinite(root) & ~(err <= max_err)]
+    end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin)
+    outputs = []
+    for j in range(k):
+        if failed[j] or last[j] == 0:
+            # newton divides by zero or overflows here, depending on the
+            # types f and f' return, it is left to decide how to fail
+            try:
+                outputs.append(newton(expr, [starts[j]], max_err, max_iter))
+            except Exception as e:
+                outputs.append(e)
+            continue
+        output = Output()
+        _init_output(output, "Newton-Raphson", f, f_diff)
+        n = last[j] + 1
+        root = xs[last[j], j]
+        with numpy.errstate(all='ignore'):
+            output.error_bound = abs(root - f(root) / slopes[j] - root)
+        output.execution_time = abs(end - begin) / k
+        output.roots = numpy.append(output.roots, root)
+        output.errors = numpy.append(output.errors, errs[last[j], j])
+        output.dataframes.append(_tabulate(instrument, xs[:n, j], output.function, errs[:n, j], symbol))
+        outputs.append(output)
+    for output in outputs:
+        if isinstance(output, Output):
+            instrument.finish(output)
+    return outputs
+
+
+def newton_mod1(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     if len(arguments) != 2:
         raise ValueError("Error! Invalid number of arguments")
     xi, m = arguments[0], arguments[1]
-    f = expr_to_lambda(expr)
-    expr_diff = diff(expr)
-    f_diff = expr_to_lambda(expr_diff)
+    f = _compile(expr, instrument)
+    expr_diff = _differentiate(expr, instrument)
+    f_diff = _compile(expr_diff, instrument, 'njev')
     symbol = get_symbol(expr)
     output = Output()
     _init_output(output, "Newton-Raphson Mod#1", f, f_diff)
@@ -167,9 +259,11 @@ def newton_mod1(expr, arguments, max_err=1e-5, max_iter=50):
         xi = root
         cur_xi = numpy.append(cur_xi, root)
         cur_err_i = numpy.append(cur_err_i, err)
+        instrument.iteration(root, err)
         if err <= max_err:
             break
     end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin)
     try:
         fxi = f(xi)
         f_diff_xi = f_diff(xi)
@@ -180,19 +274,21 @@ def newton_mod1(expr, arguments, max_err=1e-5, max_iter=50):
     output.execution_time = abs(end - begin)
     output.roots = numpy.append(output.roots, root)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe(
-        cur_xi, output.function, cur_err_i, symbol))
+    output.dataframes.append(_tabulate(
+        instrument, cur_xi, output.function, cur_err_i, symbol))
+    instrument.finish(output)
     return output
 
 
-def newton_mod2(expr, arguments, max_err=1e-5, max_iter=50):
+def newton_mod2(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     if len(arguments) != 1:
         raise ValueError("Error! Invalid number of arguments")
     xi = arguments[0]
-    f = expr_to_lambda(expr)
-    expr_diff = diff(expr)
-    f_diff = expr_to_lambda(expr_diff)
-    f_diff2 = expr_to_lambda(diff(expr_diff))
+    f = _compile(expr, instrument)
+    expr_diff = _differentiate(expr, instrument)
+    f_diff = _compile(expr_diff, instrument, 'njev')
+    f_diff2 = _compile(_differentiate(expr_diff, instrument), instrument, 'njev')
     symbol = get_symbol(expr)
     output = Output()
     _init_output(output, "Newton-Raphson Mod#2", f, f_diff)
@@ -210,9 +306,11 @@ def newton_mod2(expr, arguments, max_err=1e-5, max_iter=50):
         xi = root
         cur_xi = numpy.append(cur_xi, root)
         cur_err_i = numpy.append(cur_err_i, err)
+        instrument.iteration(root, err)
         if err <= max_err:
             break
     end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin)
     try:
         fxi = f(xi)
         f_diff_xi = f_diff(xi)
@@ -224,19 +322,21 @@ def newton_mod2(expr, arguments, max_err=1e-5, max_iter=50):
     output.execution_time = abs(end - begin)
     output.roots = numpy.append(output.roots, root)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe(
-        cur_xi, output.function, cur_err_i, symbol))
+    output.dataframes.append(_tabulate(
+        instrument, cur_xi, output.function, cur_err_i, symbol))
+    instrument.finish(output)
     return output
 
 
-def secant(expr, arguments, max_err=1e-5, max_iter=50):
+def secant(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     if len(arguments) != 2:
         raise ValueError("Error! Invalid number of arguments")
     xi, xi_prev = arguments[0], arguments[1]
-    f = expr_to_lambda(expr)
+    f = _compile(expr, instrument)
     symbol = get_symbol(expr)
     output = Output()
-    _init_output(output, "Secant", f, expr_to_lambda(diff(expr)))
+    _init_output(output, "Secant", f, _compile(_differentiate(expr, instrument), instrument, 'njev'))
     cur_xi = numpy.empty(0, dtype=numpy.float64)
     cur_err_i = numpy.empty(0, dtype=numpy.float64)
     cur_xi = numpy.append(cur_xi, xi)
@@ -251,9 +351,11 @@ def secant(expr, arguments, max_err=1e-5, max_iter=50):
         xi = root
         cur_xi = numpy.append(cur_xi, root)
         cur_err_i = numpy.append(cur_err_i, err)
+        instrument.iteration(root, err)
         if err <= max_err:
             break
     end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin)
     try:
         fxi = f(xi)
         fxi_prev = f(xi_prev)
@@ -264,16 +366,18 @@ def secant(expr, arguments, max_err=1e-5, max_iter=50):
     output.execution_time = abs(end - begin)
     output.roots = numpy.append(output.roots, root)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe(
-        cur_xi, output.function, cur_err_i, symbol))
+    output.dataframes.append(_tabulate(
+        instrument, cur_xi, output.function, cur_err_i, symbol))
+    instrument.finish(output)
     return output
 
 
-def fixed_point(expr, arguments, max_err=1e-5, max_iter=50):
+def fixed_point(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     if len(arguments) != 1:
         raise ValueError("Error! Invalid number of arguments")
     xi = arguments[0]
-    f = expr_to_lambda(expr)
+    f = _compile(expr, instrument)
     symbol = get_symbol(expr)
     output = Output()
     _init_output(output, "Fixed-Point", f, lambda x: x - f(x))
@@ -288,9 +392,11 @@ def fixed_point(expr, arguments, max_err=1e-5, max_iter=50):
         xi = root
         cur_xi = numpy.append(cur_xi, root)
         cur_err_i = numpy.append(cur_err_i, err)
+        instrument.iteration(root, err)
         if err <= max_err:
             break
     end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin)
     try:
         x_next = xi - f(xi)
         output.error_bound = abs(x_next - xi)
@@ -299,24 +405,28 @@ def fixed_point(expr, arguments, max_err=1e-5, max_iter=50):
     output.execution_time = abs(end - begin)
     output.roots = numpy.append(output.roots, root)
     output.errors = numpy.append(output.errors, err)
-    output.dataframes.append(create_dataframe(
-        cur_xi, output.function, cur_err_i, symbol))
+    output.dataframes.append(_tabulate(
+        instrument, cur_xi, output.function, cur_err_i, symbol))
+    instrument.finish(output)
     return output
 
 
-def birge_vieta(expr, arguments, max_err=1e-5, max_iter=50):
+def birge_vieta(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     if len(arguments) != 1:
         raise ValueError("Error! Invalid number of arguments")
     xi = arguments[0]
     output = Output()
     symbol = get_symbol(expr)
-    _init_output(output, "Birge-Vieta", expr_to_lambda(expr),
-                 expr_to_lambda(diff(expr)))
+    _init_output(output, "Birge-Vieta", _compile(expr, instrument),
+                 _compile(_differentiate(expr, instrument), instrument, 'njev'))
     poly = sympy.Poly(expr, expr.free_symbols)
     a = poly.all_coeffs()
     m = len(a) - 1
     n = m + 1
     i = 1
+    # the tables are built inside the loop, their time is not iterate time
+    tabulated = instrument.timings.get('tabulate', 0.0)
     begin = timeit.default_timer()
     while m > 0:
         cur_xi = numpy.empty(0, dtype=numpy.float64)
@@ -328,26 +438,33 @@ def birge_vieta(expr, arguments, max_err=1e-5, max_iter=50):
         err = 0
         for _ in range(0, max_iter):
             find_coeffs(a, b, c, xi)
+            # b[m] and c[m - 1] are p(xi) and p'(xi)
+            instrument.count('nfev')
+            instrument.count('njev')
             root = xi - b[m] / c[m - 1]
             err = abs((root - xi))
             xi = root
             cur_xi = numpy.append(cur_xi, xi)
             cur_err_i = numpy.append(cur_err_i, err)
+            instrument.iteration(xi, err)
             if err <= max_err:
                 break
         a = b[0: -1]
         m = len(a) - 1
-        output.dataframes.append(create_dataframe(
-            cur_xi, output.function, cur_err_i, symbol, i))
+        output.dataframes.append(_tabulate(
+            instrument, cur_xi, output.function, cur_err_i, symbol, i))
         i += 1
         output.roots = numpy.append(output.roots, xi)
         output.errors = numpy.append(output.errors, err)
     end = timeit.default_timer()
+    instrument.add_time('iterate', end - begin - (instrument.timings.get('tabulate', 0.0) - tabulated))
     output.execution_time = abs(end - begin)
+    instrument.finish(output)
     return output
 
 
-def illinois(expr, arguments, max_err=1e-5, max_iter=50):
+def illinois(expr, arguments, max_err=1e-5, max_iter=50, instrument=None):
+    instrument = instrument_or_null(instrument)
     delta = 0.1
     if len(arguments) == 3:
         delta = arguments[2]
@@ -355,12 +472,14 @@ def illinois(expr, arguments, max_err=1e-5, max_iter=50):
         raise ValueError("Error! Invalid number of arguments")
     start, end = arguments[0], arguments[1]
     i = 0
-    f = expr_to_lambda(expr)
+    f = _compile(expr, instrument)
 
     symbol = get_symbol(expr)
     counter = 0
     output = Output()
-    _init_output(output, "Illinois", f, expr_to_lambda(diff(expr)))
+    _init_output(output, "Illinois", f, _compile(_differentiate(expr, instrument), instrument, 'njev'))
+    # the tables are built inside the loop, their time is not iterate time
+    tabulated = instrument.timings.get('tabulate', 0.0)
     begin_time = timeit.default_timer()
 
     while start + i * delta < end:
@@ -396,18 +515,21 @@ def illinois(expr, arguments, max_err=1e-5, max_iter=50):
             prev_xi = xi
             cur_xi = numpy.append(cur_xi, xi)
             cur_err_i = numpy.append(cur_err_i, err)
+            instrument.iteration(xi, err)
             if err <= max_err:
                 break
 
-        output.dataframes.append(create_dataframe(
-            cur_xi, output.function, cur_err_i, symbol, counter))
+        output.dataframes.append(_tabulate(
+            instrument, cur_xi, output.function, cur_err_i, symbol, counter))
         i += 1
         output.roots = numpy.append(output.roots, prev_xi)
         output.errors = numpy.append(output.errors, err)
         counter += 1
 
     end_time = timeit.default_timer()
+    instrument.add_time('iterate', end_time - begin_time - (instrument.timings.get('tabulate', 0.0) - tabulated))
     output.execution_time = abs(end_time - begin_time)
+    instrument.finish(output)
     return output
 
 
@@ -415,6 +537,42 @@ def _init_output(output: Output, method_name: str, f, f_bound):
     output.roots = []
     output.errors = []
     output.title = method_name
+    # the functions kept for plotting are not counted
+    output.function = getattr(f, '__wrapped__', f)
+    output.boundary_function = getattr(f_bound, '__wrapped__', f_bound)
+
+
+def _compile(expr, instrument, counter='nfev'):
+    """
+    :return: expr as a function, counted by instrument under counter.
+    """
+    with instrument.phase('compile'):
+        f = expr_to_lambda(expr)
+    return instrument.counted(f, counter)
+
+
+def _differentiate(expr, instrument):
+    with instrument.phase('differentiate'):
+        return diff(expr)
+
+
+def _tabulate(instrument, *args):
+    with instrument.phase('tabulate'):
+        return create_dataframe(*args)
+
+
+def restore_functions(output: Output, expr, *_, **__):
+    """
+    Rebuilds the function and the boundary function of an output loaded from
+    a ResultCache, the arguments are those the method was called with.
+    """
+    f = expr_to_lambda(expr)
+    if output.title == "Bisection":
+        f_bound = lambda x: x / 2
+    elif output.title == "Fixed-Point":
+        f_bound = lambda x: x - f(x)
+    else:
+        f_bound = expr_to_lambda(diff(expr))
     output.function = f
     output.boundary_function = f_bound
 
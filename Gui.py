@@ -10,37 +10,16 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QErrorMessage,
 from PyQt5.uic import loadUi
 import os.path
 from bisect import bisect_right
+from collections import OrderedDict
+from gui_worker import SolveQueue, attach_status_widgets
+from table_model import ColumnarTableModel
+import plot_util
+from export_util import EXPORT_FILTERS, export_outputs
+from result_cache import default_cache
+from instrumentation import Instrumentation, describe
 
-
-class PandasModel(QtCore.QAbstractTableModel):
-    """
-    Class to populate a table view with a pandas dataframe
-    """
-
-    def __init__(self, data, parent=None):
-        QtCore.QAbstractTableModel.__init__(self, parent)
-        self._data = data
-
-    def rowCount(self, parent=None):
-        return self._data.shape[0]
-
-    def columnCount(self, parent=None):
-        return self._data.shape[1] + 1
-
-    def data(self, index, role=QtCore.Qt.DisplayRole):
-        if index.isValid():
-            if role == QtCore.Qt.DisplayRole:
-                if index.column() == 0:
-                    return index.row() + 1
-                return str(self._data.iloc[index.row(), index.column() - 1])
-        return None
-
-    def headerData(self, col, orientation, role):
-        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
-            if col == 0:
-                return 'i'
-            return self._data.columns[col - 1]
-        return None
+# viewports of sampled curves kept per Output while panning and zooming
+CURVE_VIEWPORTS = 8
 
 
 class PlotWindow(QMainWindow):
@@ -52,6 +31,9 @@ class PlotWindow(QMainWindow):
          [plt.figure(3), self.error_plot, self.error_tab]]
         self.func_canvas = self.root_canvas = None
         self.render_figs()
+        # one persistent line per method title
+        self.root_lines = {}
+        self.error_lines = {}
 
 
     def render_figs(self):
@@ -72,6 +54,32 @@ class PlotWindow(QMainWindow):
         self.error_plot = self.figs[1][1]
         self.root_canvas, self.error_canvas = canvases[0], canvases[1]
 
+    def show_outputs(self, outs):
+        """
+        Plots the roots and the errors of the first dataframe of each Output,
+        the lines of the methods shown before are reused.
+        """
+        for plot, column, title, lines in ((self.root_plot, 0, "Roots", self.root_lines),
+                                           (self.error_plot, 2, "Errors", self.error_lines)):
+            shown = []
+            for out in outs:
+                df = out.dataframes[0]
+                if out.title not in lines:
+                    lines[out.title] = plot.plot([], [], label=out.title)[0]
+                line = lines[out.title]
+                line.set_data(df.index.to_numpy(), df[df.columns.values[column]].to_numpy())
+                line.set_visible(True)
+                shown.append(line)
+            for line in lines.values():
+                if line not in shown:
+                    line.set_visible(False)
+            plot.set_title(title)
+            plot.relim(visible_only=True)
+            plot.autoscale_view()
+            plot.legend(shown, [line.get_label() for line in shown])
+        self.root_canvas.draw_idle()
+        self.error_canvas.draw_idle()
+
 class EquationSolverUi(QMainWindow):
     def __init__(self, *args):
         super(EquationSolverUi, self).__init__(*args)
@@ -91,8 +99,28 @@ class EquationSolverUi(QMainWindow):
         self.render_figs()
         self.actionLoad_File.triggered.connect(self.load_file)
         self.actionSave_File.triggered.connect(self.save_file)
+        self.actionClear_Cache.triggered.connect(self.clear_cache)
         self.actionExit.triggered.connect(self.exit)
         self.solving_all_flag = False
+        # outputs of earlier solves, also across sessions
+        self.results = default_cache()
+        # significant digits shown in the tables, None for full precision
+        self.table_precision = None
+        # sampled curves of each Output, keyed by the Output itself (an id could
+        # be reused once the Output is gone) then by the last viewports shown
+        self.curve_cache = {}
+        self.plotted_out = None
+        self.plot_window = None
+        # placeholder tab -> (Output, dataframe index) of the tabs not built yet
+        self.pending_tabs = {}
+        self.resample_timer = QtCore.QTimer(self)
+        self.resample_timer.setSingleShot(True)
+        self.resample_timer.timeout.connect(self.resample_plots)
+        # solves run on a thread pool, results come back through signals
+        self.solves = SolveQueue(self)
+        self.solves.error.connect(self.show_error_msg)
+        self.solves.cancelled.connect(self.solve_cancelled)
+        attach_status_widgets(self, self.solves)
 
 
     def render_figs(self):
@@ -112,6 +140,19 @@ class EquationSolverUi(QMainWindow):
         self.func_plot = self.figs[0][1]
         self.error_plot = self.figs[1][1]
         self.func_canvas, self.error_canvas = canvases[0], canvases[1]
+        # the lines and titles persist, switching tabs only replaces their
+        # data and blits them over the cached axes
+        self.func_blit = plot_util.BlitManager(self.func_canvas)
+        self.error_blit = plot_util.BlitManager(self.error_canvas)
+        self.func_lines = [self.func_blit.add(self.func_plot.plot([], [], color)[0]) for color in ('r', 'g')]
+        self.func_legend = self.func_plot.legend(self.func_lines, ["Function", "Boundary Function"])
+        self.func_legend.set_visible(False)
+        self.func_blit.add(self.func_plot.title)
+        self.error_blit.add(self.error_plot.title)
+        self.trace_lines = []
+        self.trace_legend = None
+        self.trace_limits = None
+        self.func_plot.callbacks.connect('xlim_changed', self.func_view_changed)
 
     @staticmethod
     def extract_args(args):
@@ -136,38 +177,48 @@ class EquationSolverUi(QMainWindow):
             raise ValueError("Invalid arguments")
         return expr, iter, eps, args
 
-    def solve_single(self, func):
-        expr, iter, eps, args = self.extract_info()
-        out = func(expr, args, eps, iter)
+    def solve_single(self, func, done=None):
+        instrument = Instrumentation()
+        with instrument.phase('parse'):
+            expr, iter, eps, args = self.extract_info()
+        self.solves.submit(self.results.solve, func, expr, args, eps, iter, restore=restore_functions,
+                           options={'instrument': instrument}, instrument=instrument, result=self.add_result,
+                           done=done)
+
+    def add_result(self, out):
         if (len(out.dataframes) == 0):
             raise ValueError("Could not find any roots")
-        self.indices.append(self.indices[self.counter] + len(out.dataframes))
+        self.indices.append(self.indices[-1] + len(out.dataframes))
         self.outs.append(out)
+        self.extend_trace_limits(out)
+        # the tabs are empty placeholders filled by _setup_tab when first shown
         if len(out.dataframes) > 1:
             for i in range(0, len(out.dataframes)):
-                self.tabWidget_2.addTab(self._setup_tab(out, i), out.title + " " + str(i + 1))
+                self.add_lazy_tab(out, i, out.title + " " + str(i + 1))
         else:
-            self.tabWidget_2.addTab(self._setup_tab(out), out.title)
+            self.add_lazy_tab(out, None, out.title)
+
+    def add_lazy_tab(self, out, index, title):
+        placeholder = QWidget()
+        self.pending_tabs[placeholder] = (out, index)
+        self.tabWidget_2.addTab(placeholder, title)
+
+    def build_tab(self, tab_index):
+        placeholder = self.tabWidget_2.widget(tab_index)
+        if placeholder in self.pending_tabs:
+            out, index = self.pending_tabs.pop(placeholder)
+            self._setup_tab(out, index, placeholder)
 
     @QtCore.pyqtSlot()
     def solve_eq(self):
         if self.solving_all_flag:
+            if self.solves.busy:
+                return
             try:
-                self.solve_single(self.method_list[self.counter])
-                self.counter += 1
+                self.solve_single(self.method_list[self.counter], done=self.next_method)
             except Exception as e:
                 self.show_error_msg(str(e))
-            finally:
-                if self.counter == len(self.method_list):
-                    # self.clear()
-                    self.plot_all_methods()
-                    self.counter = 0
-                    self.solving_all_flag = False
-                    self.method_select.setEnabled(True)
-                    self.equ_line.setEnabled(True)
-                    self.solve_btn.setText("Solve")
-                else:
-                    self.method_select.setCurrentIndex(self.counter)
+                self.next_method(False)
         elif self.method_select.currentText() == 'All methods':
             self.clear()
             self.solving_all_flag = True
@@ -182,38 +233,151 @@ class EquationSolverUi(QMainWindow):
             except Exception as e:
                 self.show_error_msg(str(e))
 
+    def next_method(self, succeeded):
+        if succeeded:
+            self.counter += 1
+        if self.counter == len(self.method_list):
+            # self.clear()
+            self.plot_all_methods()
+            self.stop_all_methods()
+        else:
+            self.method_select.setCurrentIndex(self.counter)
+
+    def stop_all_methods(self):
+        self.counter = 0
+        self.solving_all_flag = False
+        self.method_select.setEnabled(True)
+        self.equ_line.setEnabled(True)
+        self.solve_btn.setText("Solve")
+
+    def solve_cancelled(self):
+        if self.solving_all_flag:
+            self.stop_all_methods()
+
     def show_error_msg(self, msg):
         self.error_msg.setText(msg)
 
     def update_plots(self, out):
-        x = numpy.arange(-20, 20, 0.1)
-        self.func_plot.clear()
-        self.func_plot.grid(True)
-        self.func_plot.plot(x, [out.function(z) for z in x], 'r', label="f")
-        self.func_plot.plot(x, [out.boundary_function(z) for z in x], 'g', label="g")
-        self.func_plot.legend(["Function", "Boundary Function"])
+        # one range for the whole session keeps the axes still between tabs
+        low, high = plot_util.default_range(numpy.concatenate([numpy.ravel(o.roots) for o in self.outs + [out]]))
+        self.plotted_out = None
+        curves = self.sample_curves(out, low, high)
+        for line, (x, y) in zip(self.func_lines, curves):
+            line.set_data(x, y)
         self.func_plot.set_title(out.title)
-        self.func_plot.relim()
-        self.func_canvas.draw()
+        y_limits = plot_util.finite_limits(curves[0][1]) or (-1.0, 1.0)
+        full = (not self.func_legend.get_visible() or self.func_plot.get_xlim() != (low, high) or
+                self.func_plot.get_ylim() != y_limits)
+        if full:
+            self.func_legend.set_visible(True)
+            self.func_plot.set_xlim(low, high)
+            self.func_plot.set_ylim(*y_limits)
+        self.plotted_out = out
+        self.func_blit.update(full)
+
+    def func_view_changed(self, ax):
+        # zooming and panning re-sample the curves
+        if self.plotted_out is not None:
+            self.resample_timer.start(50)
+
+    def sample_curves(self, out, low, high):
+        """
+        Samples the function and the boundary function of out on [low, high]
+        and decimates them to the width of the canvas, the last CURVE_VIEWPORTS
+        viewports of each Output are cached.
+        :return: the (x, y) of both curves.
+        """
+        width = self.func_canvas.width()
+        cache = self.curve_cache.setdefault(out, OrderedDict())
+        key = (low, high, width)
+        if key in cache:
+            cache.move_to_end(key)
+        else:
+            curves = []
+            for function in (out.function, out.boundary_function):
+                x, y = plot_util.adaptive_sample(function, low, high)
+                curves.append(plot_util.decimate(x, y, width))
+            cache[key] = curves
+            if len(cache) > CURVE_VIEWPORTS:
+                cache.popitem(last=False)
+        return cache[key]
+
+    def resample_plots(self):
+        out = self.plotted_out
+        if out is None:
+            return
+        low, high = self.func_plot.get_xlim()
+        for line, (x, y) in zip(self.func_lines, self.sample_curves(out, low, high)):
+            line.set_data(x, y)
+        self.func_blit.update()
+
+    def extend_trace_limits(self, out):
+        """
+        Grows the limits of the trace plot to hold every dataframe of out.
+        """
+        for df in out.dataframes:
+            x_limits = (df.index.min() - 0.5, df.index.max() + 0.5) if len(df) else None
+            y_limits = plot_util.finite_limits(self._trace_values(df))
+            for axis, limits in enumerate((x_limits, y_limits)):
+                if limits is None:
+                    continue
+                if self.trace_limits is None:
+                    self.trace_limits = [None, None]
+                old = self.trace_limits[axis]
+                self.trace_limits[axis] = limits if old is None else (min(old[0], limits[0]), max(old[1], limits[1]))
 
     @staticmethod
-    def _setup_tab(out: Output, index=None):
-        new_tab = QWidget()
+    def _trace_values(df):
+        try:
+            return df.to_numpy(dtype=numpy.float64)
+        except (TypeError, ValueError):
+            return numpy.empty(0)
+
+    def show_trace(self, df, title):
+        """
+        Shows every column of df against the iteration on the persistent
+        trace lines, blitted unless the limits of the axes change.
+        """
+        while len(self.trace_lines) < df.shape[1]:
+            self.trace_lines.append(self.error_blit.add(self.error_plot.plot([], [])[0]))
+        x = df.index.to_numpy(dtype=numpy.float64)
+        values = self._trace_values(df)
+        for j, line in enumerate(self.trace_lines):
+            line.set_visible(j < df.shape[1])
+            if j < df.shape[1]:
+                line.set_data(x, values[:, j] if values.size else numpy.full(len(x), numpy.nan))
+        self.error_plot.set_title(title)
+        if self.trace_legend is not None:
+            self.error_blit.remove(self.trace_legend)
+            self.trace_legend.remove()
+        self.trace_legend = self.error_blit.add(
+            self.error_plot.legend(self.trace_lines[:df.shape[1]], [str(name) for name in df.columns]))
+        full = False
+        if self.trace_limits is not None:
+            for limits, get, setter in ((self.trace_limits[0], self.error_plot.get_xlim, self.error_plot.set_xlim),
+                                     (self.trace_limits[1], self.error_plot.get_ylim, self.error_plot.set_ylim)):
+                if limits is not None and get() != limits:
+                    setter(*limits)
+                    full = True
+        self.error_blit.update(full)
+
+    def _setup_tab(self, out: Output, index=None, new_tab=None):
+        if new_tab is None:
+            new_tab = QWidget()
         vbox_layout = QVBoxLayout()
         form_layout = QFormLayout()
         view = QTableView()
 
-        model = PandasModel(out.dataframes[0])
+        model = ColumnarTableModel(out.dataframes[0 if index is None else index], precision=self.table_precision)
         root_label = QLabel()
         root_label.setText("Root: " + str(out.roots[0]))
         error_label = QLabel()
         error_label.setText("Error: " + str(out.errors[0]))
         exec_time_label = QLabel()
-        exec_time_label.setText("Execution Time: " + str(out.execution_time))
+        exec_time_label.setText("Execution Time: " + str(out.execution_time) + (" (cached)" if out.cached else ""))
         error_bound_label = QLabel()
         error_bound_label.setText("Error bound: " + str(out.error_bound))
         if index is not None:
-            model = PandasModel(out.dataframes[index])
             root_label.setText("Root: " + str(out.roots[index]))
             error_label.setText("Error: " + str(out.errors[index]))
 
@@ -221,6 +385,10 @@ class EquationSolverUi(QMainWindow):
         form_layout.addWidget(error_label)
         form_layout.addWidget(exec_time_label)
         form_layout.addWidget(error_bound_label)
+        if out.metrics is not None:
+            metrics_label = QLabel()
+            metrics_label.setText(describe(out.metrics))
+            form_layout.addWidget(metrics_label)
 
         view.setModel(model)
         vbox_layout.addWidget(view)
@@ -247,6 +415,8 @@ class EquationSolverUi(QMainWindow):
                 self.eps_line.setText(inp['max_err'])
             if 'max_iter' in inp:
                 self.iter_line.setText(inp['max_iter'])
+            if 'precision' in inp:
+                self.table_precision = int(inp['precision']) if inp['precision'] else None
             if 'arguments' in inp:
                 self.guess_line.setText(inp['arguments'])
             if 'method_name' in inp:
@@ -255,55 +425,77 @@ class EquationSolverUi(QMainWindow):
                     self.method_select.setCurrentIndex(index)
 
     def save_file(self):
-        fname = QFileDialog.getExistingDirectory(self, 'Select Directory')
-        if fname[0]:
-            for out in self.outs:
-                for i in range(len(out.dataframes)):
-                    out.dataframes[i].to_csv(path_or_buf=os.path.join(fname,
-                                                                      out.title + str(i + 1) + '.csv'))
+        fname, _ = QFileDialog.getSaveFileName(self, 'Export Results', '', EXPORT_FILTERS)
+        if fname and self.outs:
+            if not os.path.splitext(fname)[1]:
+                fname += '.npz'
+            session = {'expression': self.equ_line.text(), 'arguments': self.guess_line.text(),
+                       'max_err': self.eps_line.text(), 'max_iter': self.iter_line.text()}
+            # written on the thread pool, a copy of the list keeps later solves out
+            self.solves.submit(export_outputs, list(self.outs), fname, session=session,
+                               result=lambda path: self.statusBar().showMessage("Saved " + path, 5000),
+                               done=self.export_finished, progress=self.show_export_progress)
+
+    def show_export_progress(self, done, total):
+        self.statusBar().showMessage("Exporting " + str(done) + "/" + str(total))
+
+    def export_finished(self, succeeded):
+        if not succeeded:
+            self.statusBar().clearMessage()
+
+    def clear_cache(self):
+        self.results.invalidate()
+        self.statusBar().showMessage("Result cache cleared", 5000)
 
     def exit(self):
         sys.exit(app.exec_())
 
     def tab_changed(self, index):
-        self.error_plot.clear()
-        if not self.outs:
+        if not self.outs or index < 0:
             return
+        self.build_tab(index)
         i = bisect_right(self.indices, index)
         if i:
             i -= 1
-        print(i, index, self.indices[i])
-        self.outs[i].dataframes[index - self.indices[i]].plot(grid=True,
-                                                              title=self.outs[i].title,
-                                                              ax=self.error_plot)
-        self.error_plot.relim()
-        self.error_canvas.draw()
+        self.show_trace(self.outs[i].dataframes[index - self.indices[i]], self.outs[i].title)
         self.update_plots(self.outs[i])
-        print(self.indices)
-        print(len(self.outs))
 
     def plot_all_methods(self):
-        plot_window = PlotWindow(self)
-        for out in self.outs:
-            out.dataframes[0].plot(y=out.dataframes[0].columns.values[0],
-             title="Roots",label=out.title, ax=plot_window.root_plot, grid=True)
-        for out in self.outs:
-            out.dataframes[0].plot(y=out.dataframes[0].columns.values[2],
-            title="Errors", label=out.title, ax=plot_window.error_plot, grid=True)
-        plot_window.error_canvas.draw()
-        plot_window.root_canvas.draw()
-        plot_window.show()
+        if self.plot_window is None:
+            self.plot_window = PlotWindow(self)
+        self.plot_window.show_outputs(self.outs)
+        self.plot_window.show()
 
 
     def clear(self):
+        # the results of the solves still running belong to the cleared session
+        if self.solves.busy:
+            self.solves.cancel()
         self.error_msg.setText("")
         self.outs = []
+        self.curve_cache = {}
+        self.plotted_out = None
         self.indices = [0]
-        self.error_plot.clear()
-        self.func_plot.clear()
-        self.error_canvas.draw()
-        self.func_canvas.draw()
+        self.trace_limits = None
+        for line in self.func_lines:
+            line.set_data([], [])
+        for line in self.trace_lines:
+            line.set_visible(False)
+        if self.trace_legend is not None:
+            self.error_blit.remove(self.trace_legend)
+            self.trace_legend.remove()
+            self.trace_legend = None
+        self.func_legend.set_visible(False)
+        self.func_plot.set_title("")
+        self.error_plot.set_title("")
+        self.error_blit.update(True)
+        self.func_blit.update(True)
+        # QTabWidget.clear does not delete the pages
+        pages = [self.tabWidget_2.widget(i) for i in range(self.tabWidget_2.count())]
         self.tabWidget_2.clear()
+        for page in pages:
+            page.deleteLater()
+        self.pending_tabs = {}
 
 
 if __name__ == '__main__':
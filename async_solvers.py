@@ -0,0 +1,225 @@
+"""Async Solvers:
+asyncio counterparts of the methods of Equations and EquSys, each of them
+runs the method on an executor so the event loop is never blocked.
+
+    from async_solvers import newton, jacobi
+    out = await newton(expr, [1.0])
+    outs = await asyncio.gather(*(newton(expr, [x]) for x in starts))
+
+The solves run on the default AsyncSolver, see configure to change its
+executor and the number of solves running at once. Cancelling a running
+solve stops it at its next iteration only if the method takes an instrument
+(the root finding and iterative methods, and auto when it picks one of
+them), the direct methods run to their end and their result is dropped.
+"""
+import asyncio
+import functools
+import inspect
+import os
+import threading
+import weakref
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+
+import Equations
+import EquSys
+from instrumentation import Cancellation, cancellation_check
+from part1_output import Output
+from result_cache import stripped
+
+
+def _call(method, args, kwargs, event):
+    """
+    Runs in a thread of the executor, the solve stops at its next iteration
+    once event is set if method takes an instrument.
+    """
+    if event.is_set():
+        raise CancelledError()
+    if 'instrument' not in inspect.signature(method).parameters:
+        return method(*args, **kwargs)
+    instrument = kwargs.get('instrument')
+    if instrument is None:
+        return method(*args, **dict(kwargs, instrument=Cancellation(event)))
+    check = cancellation_check(event)
+    instrument.callbacks.append(check)
+    try:
+        return method(*args, **kwargs)
+    finally:
+        instrument.callbacks.remove(check)
+
+
+def _call_in_process(method, args, kwargs):
+    """
+    Runs in a worker process, the callables of the outputs do not survive
+    pickling and are rebuilt by the caller.
+    """
+    result = method(*args, **kwargs)
+    if isinstance(result, Output):
+        return stripped(result)
+    if isinstance(result, list):
+        return [stripped(item) if isinstance(item, Output) else item for item in result]
+    return result
+
+
+def _restore(method, result, args, kwargs):
+    outputs = result if isinstance(result, list) else [result]
+    if method.__module__ == Equations.__name__:
+        for output in outputs:
+            if isinstance(output, Output):
+                Equations.restore_functions(output, *args, **kwargs)
+    return result
+
+
+class AsyncSolver:
+    """
+    Runs the methods on an executor with at most max_concurrency of them
+    submitted at once, the other callers wait for a slot (backpressure).
+    Fields:
+    -------
+    executor: a concurrent.futures executor, threads by default. With a
+    ProcessPoolExecutor the methods run in other processes: a running solve
+    cannot be cancelled and an instrument passed in is not updated (the
+    metrics are still returned in Output.metrics).
+    max_concurrency: the bound on the solves submitted to the executor
+    """
+
+    def __init__(self, executor=None, max_concurrency=None):
+        if max_concurrency is None:
+            max_concurrency = os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_concurrency) if executor is None else executor
+        self.max_concurrency = max_concurrency
+        # a semaphore belongs to one event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self, loop):
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def run(self, method, *args, **kwargs):
+        """
+        Solves method(*args, **kwargs) on the executor. Cancelling the caller
+        drops a solve that has not started and stops a running one at its
+        next iteration if method takes an instrument, otherwise the solve
+        runs to its end. Its slot is freed once it has stopped.
+        :return: the value returned by method.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(loop)
+        await semaphore.acquire()
+        event = threading.Event()
+        try:
+            if isinstance(self.executor, ProcessPoolExecutor):
+                future = self.executor.submit(_call_in_process, method, args, kwargs)
+            else:
+                future = self.executor.submit(_call, method, args, kwargs, event)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # the loop is closed
+                pass
+        future.add_done_callback(release)
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            event.set()
+            future.cancel()
+            raise
+        if isinstance(self.executor, ProcessPoolExecutor):
+            result = _restore(method, result, args, kwargs)
+        return result
+
+    async def map(self, method, problems, **kwargs):
+        """
+        Yields method(*problem, **kwargs) for every problem, in order. The
+        problems are read lazily, at most max_concurrency of them are solving
+        or solved but not yet consumed at any time.
+        :param problems: an iterable of tuples of positional arguments.
+        """
+        pending = []
+        problems = iter(problems)
+        try:
+            for problem in problems:
+                pending.append(asyncio.ensure_future(self.run(method, *problem, **kwargs)))
+                if len(pending) >= self.max_concurrency:
+                    yield await pending.pop(0)
+            while pending:
+                yield await pending.pop(0)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_default_solver = None
+_default_lock = threading.Lock()
+
+
+def default_solver():
+    global _default_solver
+    with _default_lock:
+        if _default_solver is None:
+            _default_solver = AsyncSolver()
+        return _default_solver
+
+
+def configure(executor=None, max_concurrency=None):
+    """
+    Replaces the default AsyncSolver used by the async methods.
+    :return: the new AsyncSolver.
+    """
+    global _default_solver
+    with _default_lock:
+        previous, _default_solver = _default_solver, AsyncSolver(executor, max_concurrency)
+    if previous is not None:
+        previous.shutdown(wait=False)
+    return _default_solver
+
+
+def _async_method(method):
+    """
+    :return: a coroutine function taking the arguments of method plus an
+    optional solver (an AsyncSolver, the default one if None).
+    """
+    @functools.wraps(method)
+    async def solve(*args, solver=None, **kwargs):
+        return await (default_solver() if solver is None else solver).run(method, *args, **kwargs)
+    summary = "Runs " + method.__module__ + "." + method.__name__ + " on an AsyncSolver."
+    if 'instrument' not in inspect.signature(method).parameters:
+        summary += " Once running it is not stopped by cancelling, its result is dropped."
+    solve.__doc__ = summary + "\n\n" + (method.__doc__ or "")
+    return solve
+
+
+regula_falsi = _async_method(Equations.regula_falsi)
+bisection = _async_method(Equations.bisection)
+newton = _async_method(Equations.newton)
+newton_batch = _async_method(Equations.newton_batch)
+newton_mod1 = _async_method(Equations.newton_mod1)
+newton_mod2 = _async_method(Equations.newton_mod2)
+secant = _async_method(Equations.secant)
+fixed_point = _async_method(Equations.fixed_point)
+birge_vieta = _async_method(Equations.birge_vieta)
+illinois = _async_method(Equations.illinois)
+
+gauss = _async_method(EquSys.gauss)
+gauss_batch = _async_method(EquSys.gauss_batch)
+gauss_jordan = _async_method(EquSys.gauss_jordan)
+bareiss = _async_method(EquSys.bareiss)
+lu_decomp = _async_method(EquSys.lu_decomp)
+thomas = _async_method(EquSys.thomas)
+banded_lu = _async_method(EquSys.banded_lu)
+cholesky = _async_method(EquSys.cholesky)
+jacobi = _async_method(EquSys.jacobi)
+gauss_seidel = _async_method(EquSys.gauss_seidel)
+conjugate_gradient = _async_method(EquSys.conjugate_gradient)
+bicgstab = _async_method(EquSys.bicgstab)
+gmres = _async_method(EquSys.gmres)
+auto = _async_method(EquSys.auto)
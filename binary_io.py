@@ -0,0 +1,127 @@
+"""Binary Input:
+Memory-mapped loading of systems of linear equations stored as .npy, .npz or
+raw binary files, for systems whose coefficients matrix does not fit in RAM.
+"""
+import struct
+import zipfile
+
+import numpy
+
+# size of the row blocks read from disk by a MappedMatrix
+BLOCK_BYTES = 64 * 2 ** 20
+
+
+class MappedMatrix:
+    """
+    A dense coefficients matrix left on disk (numpy.memmap), every product
+    reads it block by block so only one block of rows is in memory at a time.
+    Fields:
+    -------
+    array: the memory-mapped [n, m] array
+    shape: a (rows, columns) tuple
+    block_rows: the number of rows read at once
+    """
+
+    def __init__(self, array, block_rows=None):
+        self.array = array
+        self.shape = array.shape
+        if block_rows is None:
+            block_rows = max(1, BLOCK_BYTES // max(1, array.shape[1] * array.itemsize))
+        self.block_rows = block_rows
+
+    def blocks(self):
+        """
+        Yields the index of the first row and the float64 values of each block of rows.
+        """
+        for start in range(0, self.shape[0], self.block_rows):
+            yield start, numpy.asarray(self.array[start:start + self.block_rows], dtype=numpy.float64)
+
+    def dot(self, x):
+        y = numpy.empty(self.shape[0], dtype=numpy.float64)
+        for start, rows in self.blocks():
+            y[start:start + len(rows)] = rows @ x
+        return y
+
+    def __matmul__(self, x):
+        return self.dot(x)
+
+    def diagonal(self):
+        i = numpy.arange(min(self.shape))
+        return numpy.asarray(self.array[i, i], dtype=numpy.float64)
+
+    def split_augmented(self):
+        """
+        Splits an augmented [n, n + 1] matrix into the coefficients matrix (still
+        on disk) and the r.h.s vector (read into memory).
+        """
+        return (MappedMatrix(self.array[:, :-1], self.block_rows),
+                numpy.asarray(self.array[:, -1], dtype=numpy.float64))
+
+
+def _npz_memmap(path: str, name: str):
+    """
+    Maps an array stored in an uncompressed .npz archive without reading it.
+    :return: a numpy.memmap, or None if the member is compressed.
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as f:
+        # skip the zip local file header to reach the .npy content
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack('<HH', f.read(4))
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = numpy.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return numpy.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                        order='F' if fortran_order else 'C')
+
+
+def _map(path: str, shape=None, dtype=numpy.float64, name=None):
+    if path.endswith('.npy'):
+        return numpy.load(path, mmap_mode='r')
+    if path.endswith('.npz'):
+        with zipfile.ZipFile(path) as archive:
+            names = [member[:-4] for member in archive.namelist()]
+        array = _npz_memmap(path, name if name in names else names[0])
+        # compressed archives cannot be mapped, they have to be read
+        return array if array is not None else numpy.load(path)[name if name in names else names[0]]
+    if shape is None:
+        raise ValueError("The shape of a raw binary file must be given")
+    return numpy.memmap(path, dtype=dtype, mode='r', shape=tuple(shape))
+
+
+def load_system(path: str, b_path=None, shape=None, dtype=numpy.float64, block_rows=None):
+    """Load System:
+    Memory-maps a system of linear equations without copying the coefficients.
+
+    Keyword arguments:
+    path: str -- A .npy file, a .npz archive (with members A and optionally b)
+    or a raw binary file in row-major order.
+    b_path: str -- A file holding the r.h.s vector, if None the r.h.s is read
+    from member b of a .npz archive or else from the last column of A.
+    shape: tuple -- The shape of A for raw binary files.
+    dtype: The element type of raw binary files.
+    block_rows: int -- The number of rows read at once by the solvers.
+
+    return:
+    1) A MappedMatrix holding the coefficients.
+    2) The numpy vector b.
+    """
+    array = _map(path, shape, dtype, 'A')
+    b = None
+    if b_path is not None:
+        b = _map(b_path, None if shape is None else (shape[0],), dtype, 'b')
+    elif path.endswith('.npz'):
+        with zipfile.ZipFile(path) as archive:
+            if 'b.npy' in archive.namelist():
+                b = _map(path, name='b')
+    a = MappedMatrix(array, block_rows)
+    if b is None:
+        return a.split_augmented()
+    return a, numpy.asarray(b, dtype=numpy.float64).ravel()
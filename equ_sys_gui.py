@@ -1,5 +1,6 @@
 import sys
 import os.path
+import threading
 
 from EquSys import *
 from PyQt5 import QtCore
@@ -8,49 +9,38 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow,
 from PyQt5.uic import loadUi
 
 from equations_util import equations_to_aug_matrix
-
-
-class PandasModel(QtCore.QAbstractTableModel):
-    """
-    Class to populate a table view with a pandas dataframe
-    """
-
-    def __init__(self, data, parent=None):
-        QtCore.QAbstractTableModel.__init__(self, parent)
-        self._data = data
-
-    def rowCount(self, parent=None):
-        return self._data.shape[0]
-
-    def columnCount(self, parent=None):
-        return self._data.shape[1] + 1
-
-    def data(self, index, role=QtCore.Qt.DisplayRole):
-        if index.isValid():
-            if role == QtCore.Qt.DisplayRole:
-                if index.column() == 0:
-                    return index.row() + 1
-                return str(self._data.iloc[index.row(), index.column() - 1])
-        return None
-
-    def headerData(self, col, orientation, role):
-        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
-            if col == 0:
-                return 'i'
-            return self._data.columns[col - 1]
-        return None
+from gui_worker import SolveQueue, attach_status_widgets
+from table_model import ColumnarTableModel
+from export_util import EXPORT_FILTERS, export_outputs
+from result_cache import default_cache
+from instrumentation import Instrumentation, describe
 
 
 class LinearEquationsSolver(QMainWindow):
     def __init__(self, *args):
         super(LinearEquationsSolver, self).__init__(*args)
         loadUi('part2.ui', self)
-        self.method_list = [gauss, gauss_jordan, lu_decomp, gauss_seidel, jacobi]
+        self.method_list = [gauss, gauss_jordan, lu_decomp, bareiss, gauss_seidel, jacobi,
+                            conjugate_gradient, bicgstab, gmres, auto]
         self.solve_btn.clicked.connect(self.solve_linear_eqs)
         self.outs = []
+        # factors of the last direct solve, reused by LU after small edits
+        self.factors = self.factors_symbols = None
+        self.factors_lock = threading.Lock()
+        # latest solutions of jacobi and gauss_seidel, seeds the next solve
+        self.warm_start = WarmStartCache()
+        # outputs of earlier solves, also across sessions
+        self.results = default_cache()
+        # significant digits shown in the tables, None for full precision
+        self.table_precision = None
         self.actionLoad_File.triggered.connect(self.load_file)
         self.actionSave_File.triggered.connect(self.save_file)
+        self.actionClear_Cache.triggered.connect(self.clear_cache)
         self.actionExit.triggered.connect(self.exit)
+        # solves run on a thread pool, results come back through signals
+        self.solves = SolveQueue(self)
+        self.solves.error.connect(self.show_error_msg)
+        attach_status_widgets(self, self.solves)
 
     @staticmethod
     def extract_equations(equations):
@@ -75,26 +65,58 @@ class LinearEquationsSolver(QMainWindow):
         except ValueError:
             self.show_error_msg("Error: Invalid Epsilon Format")
             return
+        parse = Instrumentation()
         try:
-            aug_mat, symb_list = equations_to_aug_matrix(eqs)
-            if self.method_select.currentText() == "All methods":
-                for i in range(len(self.method_list)):
-                    if i < 3:
-                        out = self.method_list[i](aug_mat, symb_list)
-                    else:
-                        out = self.method_list[i](aug_mat, symb_list, max_iter=iter, max_err=eps)
-                    self.outs.append(out)
-                    self.table_tab_widget.addTab(self._setup_tab(out), out.title)
-            else:
-                if self.method_select.currentIndex() < 3:
-                    out = self.method_list[self.method_select.currentIndex()](aug_mat, symb_list)
-                else:
-                    out = self.method_list[self.method_select.currentIndex()](aug_mat, symb_list, max_iter=iter,
-                                                                              max_err=eps)
-                self.outs.append(out)
-                self.table_tab_widget.addTab(self._setup_tab(out), out.title)
+            with parse.phase('parse'):
+                aug_mat, symb_list = equations_to_aug_matrix(eqs)
         except Exception as e:
             self.show_error_msg(str(e))
+            return
+        parse_time = parse.timings['parse']
+        # each method is solved on the thread pool, the tabs are added as the results arrive
+        if self.method_select.currentText() == "All methods":
+            methods, warm_start = self.method_list, False
+        else:
+            methods, warm_start = [self.method_list[self.method_select.currentIndex()]], True
+        for method in methods:
+            instrument = None
+            if method in (gauss_seidel, jacobi, conjugate_gradient, bicgstab, gmres, auto):
+                instrument = Instrumentation()
+                instrument.add_time('parse', parse_time)
+            self.solves.submit(self._solve, method, aug_mat, symb_list, iter, eps, warm_start, instrument,
+                               instrument=instrument, result=lambda out, s=symb_list: self._add_result(out, s))
+
+    def _solve(self, method, aug_mat, symb_list, iter, eps, warm_start, instrument):
+        """
+        Runs on a pool thread.
+        :param instrument: the Instrumentation of an iterative method, None otherwise.
+        """
+        if method in (gauss, gauss_jordan, lu_decomp, bareiss):
+            return self._solve_direct(method, aug_mat, symb_list)
+        # the warm start and the instrumentation change how the solution is reached,
+        # not the solution, they are left out of the key
+        options = {}
+        if warm_start and method in (jacobi, gauss_seidel):
+            options['cache'] = self.warm_start
+        if instrument is not None:
+            options['instrument'] = instrument
+        return self.results.solve(method, aug_mat, symb_list, max_iter=iter, max_err=eps, options=options)
+
+    def _solve_direct(self, method, aug_mat, symb_list):
+        if method is not lu_decomp:
+            return self.results.solve(method, aug_mat, symb_list)
+        # the factors are updated in place, one solve at a time
+        with self.factors_lock:
+            if self.factors is not None and self.factors_symbols == symb_list:
+                return self.results.solve(lu_decomp, aug_mat, symb_list, options={'factors': self.factors})
+            return self.results.solve(method, aug_mat, symb_list)
+
+    def _add_result(self, out, symb_list):
+        if out.factors is not None:
+            with self.factors_lock:
+                self.factors, self.factors_symbols = out.factors, symb_list
+        self.outs.append(out)
+        self.table_tab_widget.addTab(self._setup_tab(out), out.title)
 
     def show_error_msg(self, msg):
         self.error_msg.setText(msg)
@@ -121,34 +143,74 @@ class LinearEquationsSolver(QMainWindow):
                 self.eps_line.setText(inp['max_err'])
             if 'max_iter' in inp:
                 self.iter_line.setText(inp['max_iter'])
+            if 'precision' in inp:
+                self.table_precision = int(inp['precision']) if inp['precision'] else None
             if 'method_name' in inp:
                 index = self.method_select.findText(inp['method_name'], QtCore.Qt.MatchFixedString)
                 if index >= 0:
                     self.method_select.setCurrentIndex(index)
 
     def save_file(self):
-        fname = QFileDialog.getExistingDirectory(self, 'Select Directory')
-        if fname[0]:
-            for out in self.outs:
-                for i in range(len(out.dataframes)):
-                    out.dataframes[i].to_csv(path_or_buf=os.path.join(fname,
-                                                                      out.title + str(i + 1) + '.csv'))
+        fname, _ = QFileDialog.getSaveFileName(self, 'Export Results', '', EXPORT_FILTERS)
+        if fname and self.outs:
+            if not os.path.splitext(fname)[1]:
+                fname += '.npz'
+            session = {'equations': self.extract_equations(self.equations_text.toPlainText()),
+                       'max_err': self.eps_line.text(), 'max_iter': self.iter_line.text()}
+            # written on the thread pool, a copy of the list keeps later solves out
+            self.solves.submit(export_outputs, list(self.outs), fname, session=session,
+                               result=lambda path: self.statusBar().showMessage("Saved " + path, 5000),
+                               done=self.export_finished, progress=self.show_export_progress)
+
+    def show_export_progress(self, done, total):
+        self.statusBar().showMessage("Exporting " + str(done) + "/" + str(total))
+
+    def export_finished(self, succeeded):
+        if not succeeded:
+            self.statusBar().clearMessage()
+
+    def clear_cache(self):
+        self.results.invalidate()
+        self.statusBar().showMessage("Result cache cleared", 5000)
 
     def exit(self):
         sys.exit(app.exec_())
 
-    @staticmethod
-    def _setup_tab(out: Output):
+    def _setup_tab(self, out: Output):
         new_tab = QWidget()
         vbox_layout = QVBoxLayout()
         form_layout = QFormLayout()
         view = QTableView()
 
-        model = PandasModel(out.dataframes[0])
+        model = ColumnarTableModel(out.dataframes[0], precision=self.table_precision)
         exec_time_label = QLabel()
-        exec_time_label.setText("Execution Time: " + str(out.execution_time))
+        exec_time_label.setText("Execution Time: " + str(out.execution_time) + (" (cached)" if out.cached else ""))
 
         form_layout.addWidget(exec_time_label)
+        if out.dispatch_reason is not None:
+            dispatch_label = QLabel()
+            dispatch_label.setText("Picked " + out.dispatch + ": " + out.dispatch_reason)
+            form_layout.addWidget(dispatch_label)
+        if out.residual is not None:
+            residual_label = QLabel()
+            residual_label.setText("Residual: " + str(out.residual) +
+                                   "    Backward Error: " + str(out.backward_error))
+            form_layout.addWidget(residual_label)
+        if out.condition_estimate is not None:
+            condition_label = QLabel()
+            condition_label.setText("Condition Number (estimate): " + str(out.condition_estimate))
+            form_layout.addWidget(condition_label)
+        if out.warm_start:
+            warm_start_label = QLabel()
+            text = "Warm start: " + str(out.iterations) + " iterations"
+            if out.iterations_saved is not None:
+                text += ", " + str(out.iterations_saved) + " saved"
+            warm_start_label.setText(text)
+            form_layout.addWidget(warm_start_label)
+        if out.metrics is not None:
+            metrics_label = QLabel()
+            metrics_label.setText(describe(out.metrics))
+            form_layout.addWidget(metrics_label)
 
         view.setModel(model)
         vbox_layout.addWidget(view)
@@ -157,6 +219,9 @@ class LinearEquationsSolver(QMainWindow):
         return new_tab
 
     def clear(self):
+        # the results of the solves still running belong to the cleared session
+        if self.solves.busy:
+            self.solves.cancel()
         self.error_msg.setText("")
         self.table_tab_widget.clear()
         self.outs = []
@@ -1,11 +1,17 @@
 """Equation Utilities:
 A module containing some equation parsing methods.
 """
+import builtins
+import keyword
+import re
+import timeit
+
 import pandas
 import functools
 import matplotlib
 import sympy
 import numpy
+from sparse_util import CSRMatrix
 
 
 def equations_to_matrices(equations: list):
@@ -15,6 +21,8 @@ def equations_to_matrices(equations: list):
 
     Keyword arguments:
     equations: list -- A list of containing the string representation of the equations.
+    The simple terms are tokenized, sympy only parses the equations holding
+    other terms (see parse_linear_equations).
 
     return:
     1) The matrix A containing the coefficients of the equation
@@ -22,23 +30,13 @@ def equations_to_matrices(equations: list):
     2) The vector b containing the r.h.s of the equations
     3) The symbols sorted in alphabetical order.
     """
-    print(equations)
-    parsed_equations = []
-    symbols = set()
-    for eq in equations:
-        parts = eq.replace('==', '=').split('=')
-        assert len(parts) == 2
-        lhs, rhs = parts
-        parsed_eqn = sympy.Eq(sympy.sympify(lhs), sympy.sympify(rhs))
-        symbols |= parsed_eqn.free_symbols
-        parsed_equations.append(parsed_eqn)
-    symbol_list = sorted(list(symbols), key=str)
-    A, b = sympy.linear_eq_to_matrix(parsed_equations, symbol_list)
-
-    # asserts that both matrices do not contain any symbols
-    # since bool(empty_set) returns False and bool(non_empty_set) returns true
-    assert not bool(A.free_symbols) and not bool(b.free_symbols)
-    return A, b, symbol_list
+    # the coefficients are sympy numbers, as sympify reads them, so the exact
+    # methods keep working on integers and rationals
+    rows, cols, values, b, names = _tokenize_equations(equations, ParseStats(), _exact_number)
+    A = sympy.zeros(len(b), len(names))
+    for i, j, value in zip(rows, cols, values):
+        A[i, j] = value
+    return A, sympy.Matrix(b), [sympy.Symbol(name) for name in names]
 
 
 def equations_to_aug_matrix(equations: list):
@@ -57,6 +55,220 @@ def equations_to_aug_matrix(equations: list):
     return A.row_join(b), symbol_list
 
 
+_NUMBER = r'(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+_NAME = r'[A-Za-z_]\w*'
+# one term of a linear expression: [sign] number [* name] | [sign] name [* number]
+_TERM = re.compile(r'\s*([+-]?)\s*(?:(%s)\s*(?:\*\s*(%s))?|(%s)(?:\s*\*\s*(%s))?)\s*'
+                   % (_NUMBER, _NAME, _NAME, _NUMBER))
+
+
+class ParseStats:
+    """
+    A data holder class that contains the statistics of a parse.
+    Fields:
+    -------
+    equations: the number of equations parsed
+    terms: the number of nonzero coefficients read
+    fallbacks: the number of equations that needed sympy
+    parse_time: a float representing the parse time
+    equations_per_second: the parse throughput
+    """
+
+    def __init__(self):
+        self.equations = 0
+        self.terms = 0
+        self.fallbacks = 0
+        self.parse_time = 0
+        self.equations_per_second = 0
+
+
+# names sympify may not read as plain symbols (E, I, pi, beta, lambda, ...)
+_RESERVED_NAMES = frozenset(dir(sympy)) | frozenset(dir(builtins)) | frozenset(keyword.kwlist)
+
+
+@functools.lru_cache(maxsize=None)
+def _is_plain_symbol(name: str):
+    """
+    :return: True if sympy reads name as a plain symbol (not E, I, pi, ...).
+    """
+    if name not in _RESERVED_NAMES:
+        return True
+    try:
+        return isinstance(sympy.sympify(name), sympy.Symbol)
+    except (sympy.SympifyError, SyntaxError, TypeError):
+        return False
+
+
+def _scan_side(side: str, sign, terms: list, number=float):
+    """
+    Tokenizes one side of a linear equation made only of simple terms.
+    :param sign: 1 for the l.h.s, -1 for the r.h.s.
+    :param terms: list the (name or None for a constant, coefficient) pairs are appended to.
+    :param number: converts the text of a coefficient to a number.
+    :return: False if the side needs the sympy parser.
+    """
+    pos, first = 0, True
+    while pos < len(side):
+        match = _TERM.match(side, pos)
+        if match is None or match.end() == pos or (not first and not match.group(1)):
+            return False
+        number_text = match.group(2) or match.group(5)
+        name = match.group(3) or match.group(4)
+        if name is not None and not _is_plain_symbol(name):
+            return False
+        coeff = number(number_text or '1')
+        terms.append((name, -sign * coeff if match.group(1) == '-' else sign * coeff))
+        pos, first = match.end(), False
+    return not first
+
+
+def _sympy_terms(lhs: str, rhs: str, number=float):
+    """
+    Parses a linear equation with sympy, used for terms the tokenizer does not handle.
+    :param number: converts a sympy coefficient to a number.
+    :return: a list of (name or None for a constant, coefficient) pairs.
+    """
+    expr = sympy.sympify(lhs) - sympy.sympify(rhs)
+    symbols = sorted(expr.free_symbols, key=str)
+    A, b = sympy.linear_eq_to_matrix([expr], symbols)
+    if A.free_symbols or b.free_symbols:
+        raise ValueError("Not a linear equation: %s = %s" % (lhs.strip(), rhs.strip()))
+    terms = [(str(symbol), number(coeff)) for symbol, coeff in zip(symbols, A) if coeff != 0]
+    terms.append((None, -number(b[0])))
+    return terms
+
+
+def _exact_number(value):
+    """
+    :return: the text of a number or a sympy coefficient as the sympy number
+    sympify reads, without running the sympy parser on the text.
+    """
+    if isinstance(value, str):
+        return sympy.Integer(value) if value.isdigit() else sympy.Float(value)
+    return value
+
+
+def _tokenize_equations(equations, stats, number):
+    """
+    Reads linear equations into COO triplets, see parse_linear_equations.
+    :param stats: the ParseStats counting the equations that needed sympy.
+    :param number: converts the text of a coefficient or a sympy coefficient
+    to the type of the values.
+    :return: the row, the column and the value of each coefficient, the r.h.s
+    and the names of the variables, the columns follow the alphabetical order
+    of the names. The terms of a variable are summed per equation, like sympy
+    does, and a variable whose coefficients are all zero has no column.
+    """
+    rows, cols, values, b = [], [], [], []
+    columns = {}
+    for eq in equations:
+        eq = eq.strip()
+        if not eq:
+            continue
+        parts = eq.replace('==', '=').split('=')
+        if len(parts) != 2:
+            raise ValueError("An equation needs exactly one '=': " + eq)
+        lhs, rhs = parts
+        terms = []
+        if not (_scan_side(lhs, 1, terms, number) and _scan_side(rhs, -1, terms, number)):
+            terms = _sympy_terms(lhs, rhs, number)
+            stats.fallbacks += 1
+        row, constant, coefficients = len(b), 0, {}
+        for name, coeff in terms:
+            if name is None:
+                constant += coeff
+            else:
+                coefficients[name] = coefficients.get(name, 0) + coeff
+        for name, coeff in coefficients.items():
+            if coeff != 0:
+                rows.append(row)
+                cols.append(columns.setdefault(name, len(columns)))
+                values.append(coeff)
+        b.append(-constant)
+    names = sorted(columns)
+    position = numpy.empty(len(names), dtype=numpy.int64)
+    for j, name in enumerate(names):
+        position[columns[name]] = j
+    return rows, position[numpy.array(cols, dtype=numpy.int64)], values, b, names
+
+
+def parse_linear_equations(equations):
+    """Parse Linear Equations:
+    Tokenize linear equations straight into sparse COO triplets, sympy is only
+    used for equations containing terms other than `[sign] number [* name]`
+    and `[sign] name [* number]`.
+
+    Keyword arguments:
+    equations: iterable -- The string representation of the equations, one per
+    item, it can be an open file (blank lines are skipped).
+
+    return:
+    1) The CSRMatrix A containing the coefficients of the equation
+       sorted according to the alphabetical order of their symbols.
+    2) The numpy vector b containing the r.h.s of the equations
+    3) The symbols sorted in alphabetical order.
+    4) A ParseStats.
+    """
+    stats = ParseStats()
+    begin = timeit.default_timer()
+    rows, cols, values, b, names = _tokenize_equations(equations, stats, float)
+    A = CSRMatrix.from_coo(rows, cols, values, (len(b), len(names)))
+    stats.equations = len(b)
+    stats.terms = A.nnz
+    stats.parse_time = timeit.default_timer() - begin
+    stats.equations_per_second = stats.equations / stats.parse_time if stats.parse_time else float('inf')
+    return A, numpy.array(b, dtype=numpy.float64), [sympy.Symbol(name) for name in names], stats
+
+
+def load_linear_equations(path: str):
+    """Load Linear Equations:
+    Stream linear equations from a text file with one equation per line.
+
+    return: the same as parse_linear_equations.
+    """
+    with open(path, 'r') as f:
+        return parse_linear_equations(f)
+
+
+def equations_to_sparse_matrices(equations: list):
+    """Equations to Sparse Matrices:
+    Transform a list of linear equations into a CSR coefficients matrix A and
+    a dense r.h.s vector b, without ever building a dense [n, n] matrix.
+
+    Keyword arguments:
+    equations: list -- A list of containing the string representation of the equations.
+
+    return:
+    1) The CSRMatrix A containing the coefficients of the equation
+       sorted according to the alphabetical order of their symbols.
+    2) The numpy vector b containing the r.h.s of the equations
+    3) The symbols sorted in alphabetical order.
+    """
+    A, b, symbol_list, _ = parse_linear_equations(equations)
+    return A, b, symbol_list
+
+
+def equations_to_sparse_aug_matrix(equations: list):
+    """Equations to Sparse Augmented Matrix:
+    Transform a list of linear equations into an augmented CSR matrix.
+
+    Keyword arguments:
+    equations: list -- A list of containing the string representation of the equations.
+
+    return:
+    1) The augmented CSRMatrix with coefficients sorted according to the alphabetical
+       order of their symbols.
+    2) The symbols sorted in alphabetical order.
+    """
+    A, b, symbol_list = equations_to_sparse_matrices(equations)
+    n = A.shape[1]
+    b_rows = numpy.flatnonzero(b)
+    aug = CSRMatrix.from_coo(numpy.concatenate((A.row_ids, b_rows)),
+                             numpy.concatenate((A.indices, numpy.full(len(b_rows), n))),
+                             numpy.concatenate((A.data, b[b_rows])), (A.shape[0], n + 1))
+    return aug, symbol_list
+
+
 def create_dataframe(x: list, f,
                      err: list, symbol: sympy.Symbol, i=None):
     sym_str = str(symbol)
@@ -86,12 +298,94 @@ def create_equ_sys_df(symbol_list, value_list):
     return df
 
 
-def create_dataframe_part2(x: sympy.Matrix, err: list, symbol: sympy.Symbol):
-    out = dict()
-    for i in range(x.shape[0]):
-        out[str(symbol[i])] = numpy.array(x[i, :][:]).astype(numpy.float64)
-    out["Error"] = err
-    return pandas.DataFrame(out)
+class IterationHistory:
+    """
+    A preallocated float64 store of the values of x, the error and the residual
+    during the iterations of an iterative linear solver.
+    Modes:
+    ------
+    full: keeps every sweep.
+    every: keeps every k-th sweep (and always the last one).
+    last: keeps the last k sweeps in a ring buffer.
+    off: keeps only the last sweep.
+    The callback, if given, is called as callback(x, err, iteration) on
+    every recorded sweep, also those the mode does not keep (x may be a
+    buffer reused by the next sweep).
+    """
+
+    MODES = ('full', 'every', 'last', 'off')
+
+    def __init__(self, n, max_iter, mode='full', k=1, callback=None):
+        if mode not in self.MODES:
+            raise ValueError("Invalid history mode: " + str(mode))
+        if k < 1:
+            raise ValueError("Invalid history step: " + str(k))
+        self.n = n
+        self.mode = mode
+        self.k = k
+        capacity = {'full': max_iter + 1, 'every': max_iter // k + 2, 'last': k, 'off': 1}[mode]
+        # one row per stored sweep: [x_1 .. x_n, error, residual]
+        self.buffer = numpy.empty((capacity, n + 2), dtype=numpy.float64)
+        self.iterations = numpy.empty(capacity, dtype=numpy.int64)
+        self.count = 0
+        self.last_iteration = -1
+        self.callback = callback
+
+    def _write(self, row, iteration, x, err, residual):
+        self.buffer[row, :self.n] = numpy.asarray(x, dtype=numpy.float64).ravel()
+        self.buffer[row, self.n] = err
+        self.buffer[row, self.n + 1] = residual
+        self.iterations[row] = iteration
+        self.last_iteration = iteration
+
+    def record(self, iteration, x, err=float('NaN'), residual=float('NaN')):
+        """
+        Stores the values of iteration number `iteration` if the mode keeps it.
+        :param x: the values of the variables, any array-like of n numbers.
+        """
+        if self.callback is not None:
+            self.callback(x, err, iteration)
+        if self.mode == 'full':
+            self._write(self.count, iteration, x, err, residual)
+        elif self.mode == 'every' and iteration % self.k == 0:
+            self._write(self.count, iteration, x, err, residual)
+        elif self.mode == 'last':
+            self._write(self.count % self.k, iteration, x, err, residual)
+        else:
+            return
+        self.count += 1
+
+    def finish(self, iteration, x, err=float('NaN'), residual=float('NaN')):
+        """
+        Makes sure the final iteration is stored, must be called once after the last sweep.
+        """
+        if self.last_iteration == iteration:
+            return
+        if self.mode == 'off':
+            row = 0
+        elif self.mode == 'last':
+            row = self.count % self.k
+        else:
+            row = self.count
+        self._write(row, iteration, x, err, residual)
+        self.count = 1 if self.mode == 'off' else self.count + 1
+
+    def to_dataframe(self, symbols, residual=False):
+        """
+        Wraps the stored rows in a DataFrame indexed by iteration number, the
+        buffer is not copied unless a wrapped ring buffer has to be reordered.
+        :param symbols: list of the variables' names.
+        :param residual: include the residual column.
+        """
+        rows = min(self.count, len(self.iterations))
+        data, iterations = self.buffer[:rows], self.iterations[:rows]
+        if self.mode == 'last' and self.count > self.k:
+            order = numpy.roll(numpy.arange(self.k), -(self.count % self.k))
+            data, iterations = data[order], iterations[order]
+        columns = [str(symbol) for symbol in symbols] + ["Error", "Residual"]
+        if not residual:
+            data, columns = data[:, :-1], columns[:-1]
+        return pandas.DataFrame(data, index=pandas.Index(iterations), columns=columns, copy=False)
 
 
 def string_to_lambda(expr_str: str):
@@ -112,6 +406,9 @@ def string_to_expression(expr_str: str):
     return expr
 
 
+# expressions are immutable, a long running process (the GUIs, solver_service)
+# differentiates and compiles each of them once
+@functools.lru_cache(maxsize=256)
 def diff(expr: sympy.Expr):
     symbol = get_symbol(expr)
     if not symbol:
@@ -119,6 +416,7 @@ def diff(expr: sympy.Expr):
     return sympy.diff(expr, symbol)
 
 
+@functools.lru_cache(maxsize=256)
 def expr_to_lambda(expr: sympy.Expr):
     symbol = get_symbol(expr)
     if symbol is None:
@@ -148,7 +446,6 @@ def get_symbols(expr: sympy.Expr):
 if __name__ == '__main__':
     aug, sym = equations_to_aug_matrix(["12*x + 3*y - 5*z - 1 == 0", "x+5*y+3*z=28", "3*x+7*y+13*z=76"])
     sympy.pprint(sympy.N(aug))
-    print(create_dataframe_part2(sympy.Matrix([[1, 1]]), [3], sympy.symbols('x y')))
     # x, x_hist, err_hist = jacobi(aug, x=sympy.Matrix([[1], [0], [1]]))
     # sympy.pprint(x)
     # print(len(err_hist))
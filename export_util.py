@@ -0,0 +1,152 @@
+"""Export:
+Writes every Output of a session into one columnar file (Parquet, HDF5,
+compressed NPZ or CSV) together with metadata describing the methods.
+"""
+import json
+import os.path
+
+import numpy
+import pandas
+
+FORMATS = {'.parquet': 'parquet', '.h5': 'hdf5', '.hdf5': 'hdf5', '.npz': 'npz', '.csv': 'csv'}
+
+# file dialog filters, in the order offered by the GUIs
+EXPORT_FILTERS = "Compressed NumPy (*.npz);;Parquet (*.parquet);;HDF5 (*.h5 *.hdf5);;CSV (*.csv)"
+
+# the Output fields saved in the metadata when they are set
+_METADATA_FIELDS = ('title', 'execution_time', 'error_bound', 'roots', 'errors', 'dispatch', 'dispatch_reason',
+                    'refinement_steps', 'backward_error', 'residual', 'condition_estimate', 'iterations',
+                    'warm_start', 'iterations_saved')
+
+
+def json_value(value):
+    if isinstance(value, numpy.ndarray):
+        return [json_value(v) for v in value.ravel().tolist()]
+    if isinstance(value, (list, tuple)):
+        return [json_value(v) for v in value]
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def output_fields(out):
+    """
+    :return: a dict of the scalar fields of out that are set, as JSON values.
+    """
+    fields = {name: json_value(getattr(out, name)) for name in _METADATA_FIELDS
+              if getattr(out, name, None) is not None}
+    fields['tables'] = len(out.dataframes)
+    return fields
+
+
+def output_metadata(outs, session=None):
+    """
+    :param session: a dict describing the whole session (expression, arguments...).
+    :return: a JSON string holding session and the scalar fields of every Output.
+    """
+    return json.dumps({'session': session or {}, 'outputs': [output_fields(out) for out in outs]})
+
+
+def _column(values: pandas.Series):
+    if values.dtype != object:
+        return values
+    try:
+        return values.astype(numpy.float64)
+    except (TypeError, ValueError):
+        return values.astype(str)
+
+
+def outputs_to_frame(outs, progress=None):
+    """
+    Stacks the dataframes of every Output into one long table with the
+    columns method, output, table and iteration followed by the union of
+    their columns (NaN where a table lacks one). Exact (sympy) values are
+    converted to float, other objects to strings.
+    :param progress: called with (tables done, total tables).
+    """
+    total = sum(len(out.dataframes) for out in outs)
+    frames = []
+    for k, out in enumerate(outs):
+        for i, df in enumerate(out.dataframes):
+            frame = pandas.DataFrame({str(name): _column(df[name]) for name in df.columns})
+            frame.insert(0, 'iteration', numpy.arange(len(df)))
+            frame.insert(0, 'table', i)
+            frame.insert(0, 'output', k)
+            frame.insert(0, 'method', str(out.title))
+            frames.append(frame)
+            if progress is not None:
+                progress(len(frames), total)
+    if not frames:
+        return pandas.DataFrame(columns=['method', 'output', 'table', 'iteration'])
+    frame = pandas.concat(frames, ignore_index=True, sort=False)
+    for name in frame.columns:
+        if frame[name].dtype == object and name != 'method':
+            # a column holding strings in some tables and NaN in others
+            frame[name] = frame[name].astype(str)
+    return frame
+
+
+def _write_parquet(frame, path, metadata):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow, use .npz or .csv instead") from None
+    table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[b'solver_metadata'] = metadata.encode()
+    pyarrow.parquet.write_table(table.replace_schema_metadata(schema_metadata), path)
+
+
+def _write_hdf5(frame, path, metadata):
+    try:
+        with pandas.HDFStore(path, mode='w', complevel=5) as store:
+            store.put('results', frame, format='table')
+            store.get_storer('results').attrs.solver_metadata = metadata
+    except ImportError:
+        raise ImportError("HDF5 export needs PyTables, use .npz or .csv instead") from None
+
+
+def _write_npz(frame, path, metadata):
+    arrays = {'column:' + name: frame[name].to_numpy(dtype=str if frame[name].dtype == object else None)
+              for name in frame.columns}
+    arrays['columns'] = numpy.array(list(frame.columns), dtype=str)
+    arrays['metadata'] = numpy.array(metadata)
+    numpy.savez_compressed(path, **arrays)
+
+
+def _write_csv(frame, path, metadata):
+    frame.to_csv(path, index=False)
+    # CSV has no room for metadata, it goes next to the table
+    with open(path + '.json', 'w') as f:
+        f.write(metadata)
+
+
+_WRITERS = {'parquet': _write_parquet, 'hdf5': _write_hdf5, 'npz': _write_npz, 'csv': _write_csv}
+
+
+def export_outputs(outs, path, fmt=None, session=None, progress=None):
+    """
+    Writes every Output into a single file.
+    :param outs: the list of Output to write.
+    :param path: the file name, its extension picks the format if fmt is None.
+    :param fmt: one of 'parquet', 'hdf5', 'npz' or 'csv'.
+    :param session: a dict of metadata describing the session.
+    :param progress: called with (steps done, total steps).
+    :return: the path written.
+    """
+    if fmt is None:
+        fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise ValueError("Unknown export format: " + path)
+    if fmt not in _WRITERS:
+        raise ValueError("Unknown export format: " + str(fmt))
+    total = sum(len(out.dataframes) for out in outs) + 1
+    frame = outputs_to_frame(outs, None if progress is None else lambda done, _: progress(done, total))
+    _WRITERS[fmt](frame, path, output_metadata(outs, session))
+    if progress is not None:
+        progress(total, total)
+    return path
@@ -0,0 +1,208 @@
+"""GUI Workers:
+Runs the solvers of the GUIs on a QThreadPool so the windows stay responsive,
+the results are delivered back on the main thread through Qt signals.
+"""
+import threading
+from concurrent.futures import CancelledError
+
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QProgressBar, QPushButton
+
+from instrumentation import cancellation_check
+
+
+class _TaskSignals(QtCore.QObject):
+    succeeded = QtCore.pyqtSignal(object, object)
+    failed = QtCore.pyqtSignal(object, str)
+    progress = QtCore.pyqtSignal(int, int)
+
+
+class SolveTask(QtCore.QRunnable):
+    """
+    A call of a solver run on a pool thread.
+    Fields:
+    -------
+    func, args, kwargs: the call to perform
+    result: called on the main thread with the return value of the call
+    done: called on the main thread after the call, with True if it succeeded
+    cancel_event: a threading.Event set by cancel, the instrument of the call
+    checks it after every iteration (see SolveQueue.submit)
+    returned: True once run has returned
+    """
+
+    def __init__(self, func, args, kwargs, result=None, done=None):
+        super(SolveTask, self).__init__()
+        self.setAutoDelete(False)
+        self.func, self.args, self.kwargs = func, args, kwargs
+        self.result, self.done = result, done
+        self.cancel_event = threading.Event()
+        self.returned = False
+        self.signals = _TaskSignals()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.returned = True
+
+    def _run(self):
+        if self.cancelled:
+            return
+        try:
+            value = self.func(*self.args, **self.kwargs)
+        except CancelledError:
+            return
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.failed.emit(self, str(e))
+            return
+        if not self.cancelled:
+            self.signals.succeeded.emit(self, value)
+
+    def cancel(self):
+        """
+        Drops the outcome of the call, an instrumented call also stops at its
+        next iteration, any other runs to its end.
+        """
+        self.cancel_event.set()
+
+
+class SolveQueue(QtCore.QObject):
+    """
+    Submits the solves of a window to a thread pool and tracks them.
+    Signals:
+    --------
+    progress(finished, total): emitted whenever a solve is submitted or
+    finishes, total counts the solves since the queue was last idle
+    error(message): emitted when a solve raised an exception
+    cancelled(): emitted when the running solves were cancelled
+    idle(): emitted when no solve is left running
+    """
+    progress = QtCore.pyqtSignal(int, int)
+    error = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+    idle = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None, pool=None):
+        super(SolveQueue, self).__init__(parent)
+        self.pool = QtCore.QThreadPool.globalInstance() if pool is None else pool
+        self.tasks = []
+        # cancelled tasks the pool already started, the pool does not own them
+        # so they are kept alive until they return
+        self.cancelled_tasks = []
+        self.finished = 0
+        self.total = 0
+
+    def submit(self, func, *args, result=None, done=None, progress=None, instrument=None, **kwargs):
+        """
+        Runs func(*args, **kwargs) on the pool.
+        :param result: called with the return value on the main thread.
+        :param done: called on the main thread after the call, with True if it
+        succeeded and its result was delivered.
+        :param progress: if given, func receives a progress=report argument and
+        every report(done, total) it makes calls progress(done, total) on the
+        main thread.
+        :param instrument: the Instrumentation the call solves with (it is not
+        passed to func), cancelling the task then stops the solve at its next
+        iteration.
+        :return: the SolveTask.
+        """
+        task = SolveTask(func, args, kwargs, result, done)
+        task.signals.succeeded.connect(self._succeeded)
+        task.signals.failed.connect(self._failed)
+        if progress is not None:
+            task.signals.progress.connect(progress)
+            kwargs['progress'] = task.signals.progress.emit
+        if instrument is not None:
+            instrument.callbacks.append(cancellation_check(task.cancel_event))
+        self.tasks.append(task)
+        self.total += 1
+        self.progress.emit(self.finished, self.total)
+        self.pool.start(task)
+        return task
+
+    def cancel(self):
+        """
+        Cancels every running or queued solve.
+        """
+        self.cancelled_tasks = [task for task in self.cancelled_tasks if not task.returned]
+        for task in self.tasks:
+            task.cancel()
+            if not self.pool.tryTake(task):
+                self.cancelled_tasks.append(task)
+        self.tasks = []
+        self.cancelled.emit()
+        self._update()
+
+    @property
+    def busy(self):
+        return bool(self.tasks)
+
+    def _finish(self, task, succeeded):
+        if task in self.tasks:
+            self.tasks.remove(task)
+            self.finished += 1
+        if task.done is not None:
+            task.done(succeeded)
+        self._update()
+
+    def _update(self):
+        if self.tasks:
+            self.progress.emit(self.finished, self.total)
+        else:
+            self.finished = self.total = 0
+            self.idle.emit()
+
+    @QtCore.pyqtSlot(object, object)
+    def _succeeded(self, task, value):
+        if task.cancelled:
+            return
+        try:
+            if task.result is not None:
+                task.result(value)
+        except Exception as e:
+            self.error.emit(str(e))
+            self._finish(task, False)
+            return
+        self._finish(task, True)
+
+    @QtCore.pyqtSlot(object, str)
+    def _failed(self, task, message):
+        if task.cancelled:
+            return
+        self.error.emit(message)
+        self._finish(task, False)
+
+
+def attach_status_widgets(window, queue: SolveQueue):
+    """
+    Adds a progress bar and a Cancel button driven by queue to the status bar
+    of window, both are hidden while the queue is idle.
+    :return: the progress bar and the button.
+    """
+    bar = QProgressBar()
+    bar.setMaximumWidth(200)
+    button = QPushButton("Cancel")
+    for widget in (bar, button):
+        widget.hide()
+        window.statusBar().addPermanentWidget(widget)
+
+    def progress(finished, total):
+        # a single solve has no measurable progress, show a busy bar
+        bar.setRange(0, 0 if total == 1 else total)
+        bar.setValue(finished)
+        bar.show()
+        button.show()
+
+    def idle():
+        bar.hide()
+        button.hide()
+
+    queue.progress.connect(progress)
+    queue.idle.connect(idle)
+    button.clicked.connect(queue.cancel)
+    return bar, button
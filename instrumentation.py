@@ -0,0 +1,237 @@
+"""Instrumentation:
+Per-phase timings, per-iteration callbacks and evaluation counters of the
+solvers, and their export as a Prometheus text file or as JSON lines.
+"""
+import json
+import os
+import threading
+import time
+import timeit
+from concurrent.futures import CancelledError
+from contextlib import contextmanager, nullcontext
+
+# the phases timed by the root finding methods, the linear solvers time
+# iterate and tabulate
+PHASES = ('parse', 'differentiate', 'compile', 'iterate', 'tabulate')
+
+
+class Instrumentation:
+    """
+    Collects the metrics of a solve, it is passed to a method as its
+    instrument argument and stored in Output.metrics when the method returns.
+    Fields:
+    -------
+    timings: a dict holding the seconds spent in each phase
+    counters: iterations, nfev (evaluations of the function) and njev
+    (evaluations of its derivatives) for the root finding methods
+    callbacks: functions called with (iteration, x, error) after every iteration
+    method: the title of the method, set when the solve finishes
+    """
+
+    def __init__(self, callbacks=None):
+        self.timings = {}
+        self.counters = {'iterations': 0}
+        self.callbacks = list(callbacks or [])
+        self.method = None
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Adds the time spent in the with block to the phase name.
+        """
+        begin = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.add_time(name, timeit.default_timer() - begin)
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def counted(self, f, counter='nfev'):
+        """
+        :return: f wrapped to increment counters[counter] on every call, the
+        original function is kept in __wrapped__.
+        """
+        counters = self.counters
+        counters.setdefault(counter, 0)
+
+        def wrapper(x):
+            counters[counter] += 1
+            return f(x)
+        wrapper.__wrapped__ = f
+        return wrapper
+
+    def iteration(self, x, error, iteration=None):
+        """
+        Counts an iteration and calls the callbacks.
+        :param iteration: the iteration number, None to use the count so far.
+        Iteration 0 (the initial value) is not counted.
+        """
+        if iteration is None or iteration > 0:
+            self.counters['iterations'] += 1
+        if iteration is None:
+            iteration = self.counters['iterations']
+        for callback in self.callbacks:
+            callback(iteration, x, error)
+
+    def snapshot(self):
+        """
+        :return: a dict of the method, the timings and the counters.
+        """
+        return {'method': self.method, 'timings': dict(self.timings), 'counters': dict(self.counters)}
+
+    def finish(self, output):
+        self.method = output.title
+        output.metrics = self.snapshot()
+
+
+class _NullInstrumentation(Instrumentation):
+    """
+    Used when a method is not instrumented, every hook does nothing.
+    """
+
+    def add_time(self, phase, seconds):
+        pass
+
+    def phase(self, name):
+        return nullcontext()
+
+    def count(self, counter, n=1):
+        pass
+
+    def counted(self, f, counter='nfev'):
+        return f
+
+    def iteration(self, x, error, iteration=None):
+        pass
+
+    def finish(self, output):
+        pass
+
+
+def cancellation_check(event):
+    """
+    :return: a callback of an Instrumentation stopping the solve at its next
+    iteration once event is set, by raising concurrent.futures.CancelledError.
+    """
+    def check(iteration, x, error):
+        if event.is_set():
+            raise CancelledError()
+    return check
+
+
+class Cancellation(_NullInstrumentation):
+    """
+    An instrument collecting nothing, it stops the solve at its next
+    iteration once event is set (see cancellation_check).
+    Fields:
+    -------
+    event: a threading.Event
+    """
+
+    def __init__(self, event):
+        super(Cancellation, self).__init__()
+        self.event = event
+        self._check = cancellation_check(event)
+
+    def iteration(self, x, error, iteration=None):
+        self._check(iteration, x, error)
+
+
+NULL_INSTRUMENTATION = _NullInstrumentation()
+
+
+def instrument_or_null(instrument):
+    return NULL_INSTRUMENTATION if instrument is None else instrument
+
+
+def describe(metrics):
+    """
+    :return: a one line summary of an Output.metrics dict for the GUIs.
+    """
+    order = {phase: i for i, phase in enumerate(PHASES)}
+    timings = sorted(metrics['timings'].items(), key=lambda item: order.get(item[0], len(order)))
+    return ("Phases: " + ", ".join("%s %.3g ms" % (phase, seconds * 1e3) for phase, seconds in timings) +
+            "    " + ", ".join("%s %d" % item for item in metrics['counters'].items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRecorder:
+    """
+    Accumulates the metrics of many solves, appends each of them to a JSON
+    lines file and keeps a Prometheus text file of the totals per method
+    up to date (for the textfile collector of the node exporter).
+    Fields:
+    -------
+    jsonl_path: the JSON lines file, None to skip it
+    prometheus_path: the Prometheus text file, None to skip it
+    solves: the number of solves of each method
+    seconds: the seconds spent by each (method, phase)
+    counts: the total of each (method, counter)
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.solves = {}
+        self.seconds = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, metrics, solves=1, **labels):
+        """
+        :param metrics: an Output.metrics dict (see Instrumentation.snapshot).
+        :param solves: the number of solves metrics covers (a batch).
+        :param labels: extra fields written to the JSON line only.
+        """
+        method = metrics['method'] or 'unknown'
+        with self._lock:
+            self.solves[method] = self.solves.get(method, 0) + solves
+            for phase, seconds in metrics['timings'].items():
+                self.seconds[method, phase] = self.seconds.get((method, phase), 0.0) + seconds
+            for name, count in metrics['counters'].items():
+                self.counts[method, name] = self.counts.get((method, name), 0) + count
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(dict(metrics, time=time.time(), solves=solves, **labels)) + '\n')
+            if self.prometheus_path is not None:
+                self._write_prometheus(self.prometheus_path)
+
+    def prometheus_text(self):
+        """
+        :return: the totals in the Prometheus text exposition format.
+        """
+        lines = ['# HELP solver_solves_total Solves performed by each method.',
+                 '# TYPE solver_solves_total counter']
+        for method, count in sorted(self.solves.items()):
+            lines.append('solver_solves_total{method="%s"} %d' % (_escape(method), count))
+        lines += ['# HELP solver_phase_seconds_total Seconds spent in each phase of the solves.',
+                  '# TYPE solver_phase_seconds_total counter']
+        for (method, phase), seconds in sorted(self.seconds.items()):
+            lines.append('solver_phase_seconds_total{method="%s",phase="%s"} %r' % (_escape(method),
+                                                                                    _escape(phase), seconds))
+        for name in sorted({name for _, name in self.counts}):
+            lines += ['# HELP solver_%s_total Total %s of the solves.' % (name, name),
+                      '# TYPE solver_%s_total counter' % name]
+            for (method, counter), count in sorted(self.counts.items()):
+                if counter == name:
+                    lines.append('solver_%s_total{method="%s"} %d' % (name, _escape(method), count))
+        return '\n'.join(lines) + '\n'
+
+    def _write_prometheus(self, path):
+        # the collector may read at any time, replace the file atomically
+        temp = path + '.tmp'
+        with open(temp, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(temp, path)
+
+    def write_prometheus(self, path=None):
+        with self._lock:
+            self._write_prometheus(self.prometheus_path if path is None else path)
@@ -0,0 +1,133 @@
+"""Matrix Analysis:
+Cheap structural and numerical inspection of a coefficients matrix, used to
+pick a suitable solver for a system of linear equations.
+"""
+import numpy
+from sparse_util import CSRMatrix, is_sparse
+from binary_io import MappedMatrix
+
+
+class MatrixAnalysis:
+    """
+    A data holder class that contains the properties of a coefficients matrix.
+    Fields:
+    -------
+    n: the number of unknowns
+    nnz: the number of nonzero coefficients
+    density: nnz / n ** 2
+    sparse: True if the matrix was given in a sparse format
+    mapped: True if the matrix is a binary_io.MappedMatrix left on disk
+    symmetric: True if the matrix is (numerically) symmetric
+    positive_diagonal: True if every diagonal element is positive
+    zero_diagonal: True if any diagonal element is zero
+    diagonally_dominant: True if the matrix is strictly row diagonally dominant
+    bandwidth: the maximum distance |i - j| of a nonzero from the diagonal
+    lower_bandwidth: the number of nonzero sub-diagonals
+    upper_bandwidth: the number of nonzero super-diagonals
+    spectral_radius: an estimate of the spectral radius of the Jacobi
+    iteration matrix I - D^-1 A (NaN if the diagonal has a zero)
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.nnz = 0
+        self.density = 0
+        self.sparse = False
+        self.mapped = False
+        self.symmetric = False
+        self.positive_diagonal = False
+        self.zero_diagonal = False
+        self.diagonally_dominant = False
+        self.bandwidth = 0
+        self.lower_bandwidth = 0
+        self.upper_bandwidth = 0
+        self.spectral_radius = float('NaN')
+
+
+def _estimate_spectral_radius(a, diag, steps=20):
+    """
+    Estimates the spectral radius of I - D^-1 A by power iteration, each step
+    costs one matrix-vector product.
+    """
+    x = numpy.random.default_rng(0).uniform(0.5, 1.5, len(diag))
+    x /= numpy.linalg.norm(x)
+    radius = 0.0
+    for _ in range(steps):
+        y = x - (a @ x) / diag
+        norm = numpy.linalg.norm(y)
+        if norm == 0:
+            return 0.0
+        radius = norm
+        x = y / norm
+    return radius
+
+
+def _analyze_mapped(a: MappedMatrix):
+    """
+    Reads a memory-mapped matrix one block of rows at a time, the symmetry is
+    checked by comparing y^T A x with x^T A y for random vectors x and y.
+    :return: the absolute off-diagonal row sums, nnz and the lower and upper bandwidths.
+    """
+    n = a.shape[0]
+    off_diagonal = numpy.empty(n, dtype=numpy.float64)
+    nnz = lower = upper = 0
+    for start, block in a.blocks():
+        rows, cols = numpy.nonzero(block)
+        rows += start
+        nnz += len(rows)
+        if len(rows):
+            lower = max(lower, int((rows - cols).max()))
+            upper = max(upper, int((cols - rows).max()))
+        i = numpy.arange(len(block))
+        off_diagonal[start + i] = numpy.abs(block).sum(axis=1) - numpy.abs(block[i, start + i])
+    x, y = numpy.random.default_rng(0).uniform(-1, 1, (2, n))
+    ax, ay = a @ x, a @ y
+    scale = numpy.linalg.norm(ax) * numpy.linalg.norm(y) + numpy.linalg.norm(ay) * numpy.linalg.norm(x)
+    symmetric = bool(abs(y @ ax - x @ ay) <= 1e-9 * scale)
+    return off_diagonal, nnz, lower, upper, symmetric
+
+
+def analyze_matrix(a):
+    """
+    Inspects a square coefficients matrix once, costs O(nnz) for CSR matrices
+    and O(n^2) for dense ones, a memory-mapped matrix is read from disk one
+    block of rows at a time.
+    :param a: [n, n] CSRMatrix, scipy.sparse matrix, binary_io.MappedMatrix,
+    numpy array or sympy.Matrix.
+    :return: a MatrixAnalysis.
+    """
+    analysis = MatrixAnalysis()
+    analysis.sparse = is_sparse(a)
+    analysis.mapped = isinstance(a, MappedMatrix)
+    if analysis.sparse:
+        a = CSRMatrix.from_any(a)
+        rows, cols, values = a.row_ids, a.indices, a.data
+        canonical = CSRMatrix.from_coo(rows, cols, values, a.shape)
+        transposed = a.transpose()
+        analysis.symmetric = (numpy.array_equal(canonical.indptr, transposed.indptr) and
+                              numpy.array_equal(canonical.indices, transposed.indices) and
+                              numpy.allclose(canonical.data, transposed.data))
+        off_diagonal = numpy.bincount(rows, weights=numpy.abs(values) * (rows != cols), minlength=a.shape[0])
+    elif analysis.mapped:
+        off_diagonal, nnz, lower, upper, analysis.symmetric = _analyze_mapped(a)
+    else:
+        a = numpy.array(a).astype(numpy.float64)
+        rows, cols = numpy.nonzero(a)
+        analysis.symmetric = numpy.allclose(a, a.T)
+        off_diagonal = numpy.abs(a).sum(axis=1) - numpy.abs(a.diagonal())
+    if not analysis.mapped:
+        nnz = len(rows)
+        lower = int(max((rows - cols).max(), 0)) if nnz else 0
+        upper = int(max((cols - rows).max(), 0)) if nnz else 0
+    diag = a.diagonal()
+    analysis.n = a.shape[0]
+    analysis.nnz = nnz
+    analysis.density = analysis.nnz / max(analysis.n, 1) ** 2
+    analysis.positive_diagonal = bool(numpy.all(diag > 0))
+    analysis.zero_diagonal = not numpy.all(diag)
+    analysis.diagonally_dominant = bool(numpy.all(numpy.abs(diag) > off_diagonal))
+    analysis.lower_bandwidth, analysis.upper_bandwidth = lower, upper
+    analysis.bandwidth = max(analysis.lower_bandwidth, analysis.upper_bandwidth)
+    if not analysis.zero_diagonal:
+        analysis.spectral_radius = _estimate_spectral_radius(a, diag)
+    return analysis
@@ -14,6 +14,22 @@ class Output:
     function: the function
     boundary_function: the boundary function
     exection_time: a float representing the execution time
+    dispatch: the name of the method picked by an automatic dispatcher
+    dispatch_reason: why the dispatcher picked that method
+    refinement_steps: the number of iterative refinement steps performed
+    backward_error: the normwise backward error of the final solution
+    residual: the infinity norm of the residual b - Ax of the final solution
+    condition_estimate: an estimate of the 1-norm condition number of A
+    factors: the FactoredSystem kept by the direct methods to re-solve the
+    system after small edits (see lu_decomp)
+    iterations: the number of iterations performed by an iterative method
+    warm_start: True if the initial vector was taken from a WarmStartCache
+    iterations_saved: the iterations a warm start saved compared to the last
+    cold start of the same method on the same system (None if unknown)
+    cached: True if the output was loaded from a ResultCache instead of solved
+    metrics: the timings and counters of an instrumented solve (see
+    instrumentation.Instrumentation.snapshot), None if not instrumented or
+    loaded from a ResultCache
     """
 
     def __init__(self):
@@ -25,3 +41,15 @@ class Output:
         self.function = None
         self.boundary_function = None
         self.execution_time = 0
+        self.dispatch = None
+        self.dispatch_reason = None
+        self.refinement_steps = 0
+        self.backward_error = None
+        self.residual = None
+        self.condition_estimate = None
+        self.factors = None
+        self.iterations = 0
+        self.warm_start = False
+        self.iterations_saved = None
+        self.cached = False
+        self.metrics = None
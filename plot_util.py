@@ -0,0 +1,158 @@
+"""Plot Utilities:
+Vectorized, adaptive sampling of the functions plotted by the GUI, and
+min/max decimation of the sampled lines down to the pixel width of the plot.
+"""
+import numpy
+
+
+def evaluate(f, x: numpy.ndarray):
+    """
+    Evaluates f on a whole array at once, falls back to one point at a time
+    for functions that do not broadcast. Points where f fails are NaN.
+    :return: a float64 array shaped like x.
+    """
+    with numpy.errstate(all='ignore'):
+        try:
+            y = numpy.asarray(f(x), dtype=numpy.float64)
+            # constant expressions return a scalar
+            return numpy.broadcast_to(y, x.shape).copy()
+        except (TypeError, ValueError, ZeroDivisionError, OverflowError, AttributeError):
+            pass
+        y = numpy.empty(len(x), dtype=numpy.float64)
+        for i, v in enumerate(x):
+            try:
+                y[i] = f(v)
+            except (TypeError, ValueError, ZeroDivisionError, OverflowError, AttributeError):
+                y[i] = numpy.nan
+        return y
+
+
+def default_range(roots, margin=0.5, minimum=2.0, fallback=(-20.0, 20.0)):
+    """
+    :return: a (low, high) range around the finite roots, padded by margin
+    times their spread (at least minimum), or fallback without roots.
+    """
+    roots = numpy.asarray(roots, dtype=numpy.float64).ravel()
+    roots = roots[numpy.isfinite(roots)]
+    if not len(roots):
+        return fallback
+    low, high = roots.min(), roots.max()
+    pad = max(minimum, margin * (high - low))
+    return low - pad, high + pad
+
+
+def adaptive_sample(f, low, high, points=256, max_points=8192, rounds=12, tolerance=1e-3):
+    """
+    Samples f on [low, high], starting from a uniform grid and halving the
+    intervals where the midpoint differs from the chord by more than
+    tolerance times the range of f, i.e. where the curvature is high. Every
+    round evaluates all new midpoints in one vectorized call.
+    :return: the sorted sample points and the values of f.
+    """
+    x = numpy.linspace(low, high, points)
+    y = evaluate(f, x)
+    for _ in range(rounds):
+        finite = y[numpy.isfinite(y)]
+        span = finite.max() - finite.min() if len(finite) else 0.0
+        mid = 0.5 * (x[:-1] + x[1:])
+        y_mid = evaluate(f, mid)
+        chord = 0.5 * (y[:-1] + y[1:])
+        with numpy.errstate(invalid='ignore'):
+            deviation = numpy.abs(y_mid - chord)
+            refine = ~(deviation <= tolerance * span) & numpy.isfinite(y_mid)
+        if span == 0 or not refine.any():
+            break
+        budget = max_points - len(x)
+        if budget <= 0:
+            break
+        if refine.sum() > budget:
+            # keep the intervals that deviate the most
+            refine[numpy.argsort(numpy.where(refine, deviation, -1))[:-budget]] = False
+        x = numpy.concatenate((x, mid[refine]))
+        y = numpy.concatenate((y, y_mid[refine]))
+        order = numpy.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+    return x, y
+
+
+def decimate(x: numpy.ndarray, y: numpy.ndarray, width: int):
+    """
+    Reduces a line to the minimum and maximum of every pixel column, the
+    drawn image does not change but at most 2 * width points remain.
+    :param x: sorted sample points.
+    :param width: the pixel width of the plot.
+    :return: the decimated x and y.
+    """
+    width = max(int(width), 1)
+    if len(x) <= 2 * width:
+        return x, y
+    column = ((x - x[0]) * (width / (x[-1] - x[0]))).astype(numpy.int64)
+    column[-1] = width - 1
+    starts = numpy.flatnonzero(numpy.diff(column, prepend=-1))
+    with numpy.errstate(invalid='ignore'):
+        low = numpy.fmin.reduceat(y, starts)
+        high = numpy.fmax.reduceat(y, starts)
+    left = x[starts]
+    return numpy.repeat(left, 2), numpy.column_stack((low, high)).ravel()
+
+
+def finite_limits(values, margin=0.05):
+    """
+    :return: the (low, high) range of the finite values padded by margin
+    times their spread, or None if there are none.
+    """
+    values = numpy.asarray(values, dtype=numpy.float64).ravel()
+    values = values[numpy.isfinite(values)]
+    if not len(values):
+        return None
+    low, high = values.min(), values.max()
+    pad = margin * (high - low) or 0.5
+    return low - pad, high + pad
+
+
+class BlitManager:
+    """
+    Redraws the animated artists of a figure over a cached background, so
+    changing their data only repaints the figure instead of redrawing the
+    axes, ticks and grid. The background is captured on every full draw.
+    Fields:
+    -------
+    canvas: the FigureCanvas
+    artists: the animated artists, drawn in order over the background
+    background: the cached pixels of the figure without the animated artists
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.artists = []
+        self.background = None
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def add(self, artist):
+        artist.set_animated(True)
+        self.artists.append(artist)
+        return artist
+
+    def remove(self, artist):
+        if artist in self.artists:
+            self.artists.remove(artist)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.canvas.figure.draw_artist(artist)
+
+    def update(self, full=False):
+        """
+        Repaints the animated artists, full redraws the whole figure first,
+        needed when the limits of the axes changed.
+        """
+        if full or self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
@@ -0,0 +1,252 @@
+"""Result Cache:
+A persistent, content-addressed cache of solver outputs kept in a local SQLite
+file, so solving the same configuration again returns the stored Output.
+
+The outputs are stored as pickles and loading a pickle can run arbitrary code,
+so the file is trusted like code: a cache file owned by another user or
+writable by the group or others is refused (PermissionError), and new files
+are created readable and writable by their owner only. Never point a
+ResultCache at a file received from elsewhere.
+"""
+import copy
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sqlite3
+import stat
+import threading
+import time
+
+import numpy
+import sympy
+
+from part1_output import Output
+from sparse_util import CSRMatrix
+
+# bump when a change of the solvers makes the stored outputs stale
+CACHE_VERSION = 1
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'numerical-analysis', 'results.sqlite')
+
+# Output fields holding callables or solver state, they are not stored
+_UNSTORED_FIELDS = ('function', 'boundary_function', 'factors')
+
+
+def stripped(output: Output):
+    """
+    :return: a shallow copy of output without its callables and factors, it
+    can be pickled.
+    """
+    stored = copy.copy(output)
+    for name in _UNSTORED_FIELDS:
+        setattr(stored, name, None)
+    return stored
+
+
+def _digest(parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _canonical(value):
+    """
+    :return: a JSON-serializable value equal for equal inputs.
+    :raises TypeError: for values that cannot be part of a key.
+    """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, numpy.integer)):
+        return ['int', int(value)]
+    if isinstance(value, (float, numpy.floating)):
+        return ['float', repr(float(value))]
+    if isinstance(value, numpy.ndarray):
+        value = numpy.ascontiguousarray(value)
+        return ['ndarray', value.dtype.str, list(value.shape), _digest([value.tobytes()])]
+    if isinstance(value, CSRMatrix):
+        return ['csr', list(value.shape), _canonical(value.data), _canonical(value.indices),
+                _canonical(value.indptr)]
+    if isinstance(value, sympy.MatrixBase):
+        return ['Matrix', list(value.shape), _digest(sympy.srepr(e).encode() for e in value)]
+    if isinstance(value, sympy.Basic):
+        return ['sympy', sympy.srepr(value)]
+    if isinstance(value, (list, tuple)):
+        return ['list', [_canonical(v) for v in value]]
+    if isinstance(value, dict):
+        return ['dict', sorted([str(k), _canonical(v)] for k, v in value.items())]
+    raise TypeError("A " + type(value).__name__ + " argument cannot be cached")
+
+
+def method_name(method):
+    return method.__module__ + '.' + method.__qualname__
+
+
+def _check_private(path):
+    """
+    :raises PermissionError: if someone but the current user could have
+    written the file at path.
+    """
+    info = os.stat(path)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        raise PermissionError("The result cache " + path + " belongs to another user")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError("The result cache " + path + " is writable by other users")
+
+
+class ResultCache:
+    """
+    Stores the Output of a solver under a SHA-256 hash of the method and its
+    bound arguments (defaults included), the least recently used entries are
+    evicted once the stored outputs exceed max_bytes. The callables and the
+    factors of an Output are not stored, restore hooks rebuild them. The file
+    must be private to the current user (see the module docstring).
+    Fields:
+    -------
+    path: the SQLite file, ':memory:' for a cache that is not persisted
+    max_bytes: the bound on the total size of the stored outputs
+    enabled: False bypasses the cache, the solvers always run
+    hits, misses: the lookups answered by the cache and those that solved
+    """
+
+    def __init__(self, path=None, max_bytes=256 * 2 ** 20, enabled=True):
+        self.path = DEFAULT_PATH if path is None else path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+            if os.path.exists(self.path):
+                _check_private(self.path)
+            else:
+                os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+                os.chmod(self.path, 0o600)
+        # the GUIs solve on a thread pool, one connection guarded by a lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, method TEXT NOT NULL, "
+                             "version INTEGER NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL, "
+                             "data BLOB NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+            self._db.execute("DELETE FROM results WHERE version != ?", (CACHE_VERSION,))
+
+    @staticmethod
+    def key(method, *args, **kwargs):
+        """
+        :return: the hex digest identifying method(*args, **kwargs).
+        :raises TypeError: if an argument cannot be part of a key.
+        """
+        bound = inspect.signature(method).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = [[name, _canonical(value)] for name, value in bound.arguments.items()]
+        return _digest([json.dumps([CACHE_VERSION, method_name(method), arguments]).encode()])
+
+    def get(self, key):
+        """
+        :return: the stored Output with cached set to True, or None. Its metrics
+        are dropped, they measured the original solve and not this lookup.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT data FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self._db:
+                self._db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        try:
+            output = pickle.loads(row[0])
+        except (pickle.UnpicklingError, AttributeError, EOFError, ImportError):
+            # written by another version of the solvers, solve again
+            self.invalidate_key(key)
+            return None
+        output.cached = True
+        output.metrics = None
+        return output
+
+    def put(self, key, method, output: Output):
+        """
+        Stores output under key and evicts the least recently used outputs
+        beyond max_bytes.
+        """
+        data = pickle.dumps(stripped(output), protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, method_name(method), CACHE_VERSION, len(data), time.time(), data))
+            total = self._db.execute("SELECT SUM(size) FROM results").fetchone()[0]
+            for old_key, size in self._db.execute("SELECT key, size FROM results ORDER BY used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                total -= size
+
+    def solve(self, method, *args, restore=None, options=None, **kwargs):
+        """
+        Returns the stored output of method(*args, **kwargs) or runs and stores it.
+        :param restore: called with (output, *args, **kwargs) on an output loaded
+        from the cache, to rebuild the fields that are not stored.
+        :param options: a dict of keyword arguments passed to method but left out
+        of the key, for those that change how a result is reached, not the result.
+        """
+        options = options or {}
+        try:
+            key = self.key(method, *args, **kwargs) if self.enabled else None
+        except TypeError:
+            key = None
+        if key is not None:
+            output = self.get(key)
+            if output is not None:
+                self.hits += 1
+                if restore is not None:
+                    restore(output, *args, **kwargs)
+                return output
+            self.misses += 1
+        output = method(*args, **kwargs, **options)
+        if key is not None:
+            self.put(key, method, output)
+        return output
+
+    def invalidate(self, method=None):
+        """
+        Drops the stored outputs of method, or every output if it is None.
+        """
+        with self._lock, self._db:
+            if method is None:
+                self._db.execute("DELETE FROM results")
+            else:
+                self._db.execute("DELETE FROM results WHERE method = ?", (method_name(method),))
+
+    def invalidate_key(self, key):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def size(self):
+        """
+        :return: the total bytes of the stored outputs.
+        """
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def default_cache():
+    """
+    :return: a ResultCache at DEFAULT_PATH, or one kept in memory if that file
+    cannot be opened or is not private to the current user.
+    """
+    try:
+        return ResultCache()
+    except (OSError, sqlite3.Error):
+        return ResultCache(':memory:')
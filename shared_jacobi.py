@@ -0,0 +1,188 @@
+"""Shared-Memory Jacobi:
+Runs Jacobi sweeps on several processes, each process updates a block of
+rows. The coefficients matrix, the r.h.s and the two iterates live in
+multiprocessing.shared_memory so nothing is copied between sweeps.
+"""
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy
+from sparse_util import CSRMatrix
+
+# below this many coefficients a sweep takes less than starting a process
+# (tens of milliseconds) spread over a typical run, the sweeps run serially
+MIN_NONZEROS = 2 ** 20
+
+# the seconds the workers are given to exit once the sweeps are over
+SHUTDOWN_TIMEOUT = 0.5
+
+
+def worthwhile(a, processes):
+    """
+    :return: True if sweeping the [n, n] numpy array or CSRMatrix a on
+    processes processes is expected to be faster than serially.
+    """
+    nonzeros = a.nnz if isinstance(a, CSRMatrix) else a.size
+    return processes > 1 and nonzeros >= MIN_NONZEROS
+
+
+def _share(array, blocks):
+    """
+    Copies an array into a new shared memory block.
+    :return: the description (name, shape, dtype) used by the workers to attach it.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(shm)
+    numpy.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm.name, array.shape, array.dtype.str
+
+
+def _attach(spec, blocks):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    blocks.append(shm)
+    return numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _partition(a, n, processes):
+    """
+    Splits the rows into contiguous blocks, of equal nonzeros for CSR matrices.
+    :return: the processes + 1 block boundaries.
+    """
+    if isinstance(a, CSRMatrix):
+        bounds = numpy.searchsorted(a.indptr, numpy.linspace(0, a.nnz, processes + 1))
+    else:
+        bounds = numpy.linspace(0, n, processes + 1)
+    bounds = bounds.astype(numpy.int64)
+    bounds[0], bounds[-1] = 0, n
+    return bounds
+
+
+def _sweeps(arrays, sparse, lo, hi, w, barrier, max_iter, max_err):
+    """
+    Updates the rows lo:hi of the iterate on every sweep. Sweep k reads
+    x[(k - 1) % 2] and writes x[k % 2], then stores the largest change of its
+    rows in errs[k % 2, w] and waits on the barrier, after which every process
+    reduces errs[k % 2] to the same error and takes the same decision.
+    """
+    b, diag, xs, errs = arrays['b'][lo:hi], arrays['diag'][lo:hi], arrays['x'], arrays['errs']
+    if sparse:
+        indptr = arrays['indptr']
+        begin, end = indptr[lo], indptr[hi]
+        data, indices = arrays['data'][begin:end], arrays['indices'][begin:end]
+        rows = numpy.repeat(numpy.arange(hi - lo), numpy.diff(indptr[lo:hi + 1]))
+        product = lambda x: numpy.bincount(rows, weights=data * x[indices], minlength=hi - lo)
+    else:
+        product = arrays['a'][lo:hi].dot
+    for k in range(1, max_iter + 1):
+        x, x_new = xs[(k - 1) % 2], xs[k % 2]
+        x_new[lo:hi] = x[lo:hi] + (b - product(x)) / diag
+        errs[k % 2, w] = numpy.abs(x_new[lo:hi] - x[lo:hi]).max() if hi > lo else 0.0
+        barrier.wait()
+        if errs[k % 2].max() < max_err:
+            break
+
+
+def _worker(specs, sparse, lo, hi, w, barrier, max_iter, max_err):
+    blocks = []
+    arrays = {}
+    try:
+        arrays = {key: _attach(spec, blocks) for key, spec in specs.items()}
+        _sweeps(arrays, sparse, lo, hi, w, barrier, max_iter, max_err)
+    except threading.BrokenBarrierError:
+        pass
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        # the views have to be released before the blocks are closed
+        arrays.clear()
+        for shm in blocks:
+            shm.close()
+
+
+def _coordinate(specs, barrier, x, max_iter, max_err, x_hist):
+    """
+    Records the history of sweep k while the workers compute sweep k + 1, the
+    workers do not overwrite x[k % 2] before every process passed the next barrier.
+    :return: the final x and the final error.
+    """
+    blocks = []
+    arrays = {}
+    try:
+        arrays = {key: _attach(specs[key], blocks) for key in ('x', 'errs')}
+        xs, errs = arrays['x'], arrays['errs']
+        err, k = float('NaN'), 0
+        x_hist.record(0, x)
+        for k in range(1, max_iter + 1):
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                raise RuntimeError("A Jacobi worker process failed") from None
+            err = errs[k % 2].max()
+            x_hist.record(k, xs[k % 2], err)
+            if err < max_err:
+                break
+        x = xs[k % 2].copy()
+        x_hist.finish(k, x, err)
+        return x, err
+    finally:
+        # the views have to be released before the blocks are closed
+        xs = errs = None
+        arrays.clear()
+        for shm in blocks:
+            shm.close()
+
+
+def iterate(a, b, diag, x, max_iter, max_err, x_hist, processes):
+    """
+    Performs Jacobi sweeps on a pool of processes until the maximum change
+    drops below max_err or max_iter sweeps are performed.
+    :param a: [n, n] float64 numpy array or CSRMatrix of coefficients.
+    :param x: initial value for the variables.
+    :param x_hist: the history the values of x and the error are recorded to.
+    :param processes: the number of worker processes.
+    :return: the final x and the final error.
+    """
+    n = len(b)
+    blocks = []
+    workers = []
+    barrier = None
+    try:
+        specs = {'b': _share(b, blocks), 'diag': _share(diag, blocks),
+                 'x': _share(numpy.stack([x, x]), blocks),
+                 'errs': _share(numpy.full((2, processes), numpy.nan), blocks)}
+        if isinstance(a, CSRMatrix):
+            specs.update(data=_share(a.data, blocks), indices=_share(a.indices, blocks),
+                         indptr=_share(a.indptr, blocks))
+        else:
+            specs['a'] = _share(numpy.ascontiguousarray(a), blocks)
+        context = multiprocessing.get_context()
+        # the calling process takes part in the barrier to record the history
+        barrier = context.Barrier(processes + 1)
+        bounds = _partition(a, n, processes)
+        for w in range(processes):
+            workers.append(context.Process(target=_worker, daemon=True,
+                                           args=(specs, isinstance(a, CSRMatrix), bounds[w], bounds[w + 1], w,
+                                                 barrier, max_iter, max_err)))
+            workers[-1].start()
+        return _coordinate(specs, barrier, x, max_iter, max_err, x_hist)
+    finally:
+        if barrier is not None:
+            # wakes the workers still waiting if the history recording raised
+            # (a cancelled solve), those that finished the sweeps are gone
+            barrier.abort()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.join(timeout=max(deadline - time.monotonic(), 0))
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for shm in blocks:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
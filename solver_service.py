@@ -0,0 +1,389 @@
+"""Solver Service:
+A long running local HTTP/JSON service solving equations and systems of
+linear equations on a pool of worker processes. The workers keep the parsed
+and compiled expressions and the LU factors warm between requests, identical
+concurrent requests share one solve and concurrent Newton-Raphson requests
+for the same expression are solved together by one vectorized call.
+
+    python solver_service.py --port 8765
+
+    POST /solve    {"method": "newton", "expression": "x**2 - 2", "arguments": [1]}
+    POST /solve    {"method": "jacobi", "equations": ["4*x + y = 1", "x + 3*y = 2"]}
+    GET  /health
+    GET  /metrics  (Prometheus text)
+"""
+import argparse
+import functools
+import hashlib
+import json
+import threading
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import Equations
+import EquSys
+from equations_util import equations_to_aug_matrix, equations_to_sparse_matrices, string_to_expression
+from export_util import json_value, output_fields
+from instrumentation import Instrumentation, MetricsRecorder
+
+ROOT_METHODS = {'bisection': Equations.bisection, 'fixed_point': Equations.fixed_point,
+                'newton': Equations.newton, 'newton_mod1': Equations.newton_mod1,
+                'newton_mod2': Equations.newton_mod2, 'regula_falsi': Equations.regula_falsi,
+                'secant': Equations.secant, 'birge_vieta': Equations.birge_vieta,
+                'illinois': Equations.illinois}
+
+SYSTEM_METHODS = {'gauss': EquSys.gauss, 'gauss_jordan': EquSys.gauss_jordan, 'lu_decomp': EquSys.lu_decomp,
+                  'bareiss': EquSys.bareiss, 'gauss_seidel': EquSys.gauss_seidel, 'jacobi': EquSys.jacobi,
+                  'conjugate_gradient': EquSys.conjugate_gradient, 'bicgstab': EquSys.bicgstab,
+                  'gmres': EquSys.gmres, 'auto': EquSys.auto}
+
+# the system methods taking max_iter, max_err and an instrument
+_ITERATIVE = ('gauss_seidel', 'jacobi', 'conjugate_gradient', 'bicgstab', 'gmres')
+
+# the methods whose concurrent requests are solved by one vectorized call
+_BATCHED = {'newton': Equations.newton_batch}
+
+
+class RequestError(ValueError):
+    """Raised for a malformed request."""
+
+
+def normalize_request(request):
+    """
+    Validates a request and fills in the defaults.
+    :return: a dict with method, max_err, max_iter and either expression and
+    arguments or equations.
+    :raises RequestError: if the request is malformed.
+    """
+    if not isinstance(request, dict):
+        raise RequestError("The request must be a JSON object")
+    method = request.get('method')
+    try:
+        normalized = {'method': method, 'max_err': float(request.get('max_err', 1e-5)),
+                      'max_iter': int(request.get('max_iter', 50))}
+        if method in ROOT_METHODS:
+            normalized['expression'] = str(request['expression'])
+            normalized['arguments'] = [float(a) for a in request.get('arguments', [])]
+        elif method in SYSTEM_METHODS:
+            normalized['equations'] = [str(e) for e in request['equations']]
+        else:
+            raise RequestError("Unknown method: " + str(method))
+    except (KeyError, TypeError, ValueError) as e:
+        if isinstance(e, RequestError):
+            raise
+        raise RequestError("Invalid request: " + str(e)) from None
+    return normalized
+
+
+def request_key(request):
+    """
+    :return: a digest equal for equal normalized requests.
+    """
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def output_to_json(out):
+    """
+    :return: the scalar fields, the metrics and the tables of an Output as
+    JSON values.
+    """
+    result = output_fields(out)
+    result['metrics'] = out.metrics
+    result['tables'] = [{'columns': [str(c) for c in df.columns],
+                         'data': [[json_value(v) for v in row] for row in df.itertuples(index=False)]}
+                        for df in out.dataframes]
+    return result
+
+
+# state of a worker process, kept between the requests it serves
+
+@functools.lru_cache(maxsize=256)
+def _expression(text):
+    return string_to_expression(text)
+
+
+@functools.lru_cache(maxsize=64)
+def _system(equations):
+    return equations_to_aug_matrix(list(equations))
+
+
+@functools.lru_cache(maxsize=64)
+def _sparse_system(equations):
+    return equations_to_sparse_matrices(list(equations))
+
+
+# the factors of the latest LU solve of each set of variables
+_factors = {}
+
+
+def _solve(request):
+    """
+    Runs in a worker process.
+    :return: the output of the request as JSON values.
+    """
+    method = request['method']
+    instrument = Instrumentation()
+    if method in ROOT_METHODS:
+        with instrument.phase('parse'):
+            expr = _expression(request['expression'])
+        out = ROOT_METHODS[method](expr, request['arguments'], request['max_err'], request['max_iter'],
+                                   instrument=instrument)
+        return output_to_json(out)
+    if method in _ITERATIVE:
+        # the iterative methods run on the CSR coefficients, never building a dense matrix
+        with instrument.phase('parse'):
+            A, b, symbols = _sparse_system(tuple(request['equations']))
+        out = SYSTEM_METHODS[method](A, symbols, b=b, max_iter=request['max_iter'], max_err=request['max_err'],
+                                     instrument=instrument)
+        return output_to_json(out)
+    with instrument.phase('parse'):
+        aug_mat, symbols = _system(tuple(request['equations']))
+    # the methods may modify the matrix, the cached one is kept intact
+    aug_mat = aug_mat.copy()
+    if method == 'lu_decomp':
+        names = tuple(str(s) for s in symbols)
+        out = EquSys.lu_decomp(aug_mat, symbols, factors=_factors.get(names))
+        if out.factors is not None:
+            _factors[names] = out.factors
+    elif method == 'auto':
+        out = EquSys.auto(aug_mat, symbols, max_iter=request['max_iter'], max_err=request['max_err'],
+                          instrument=instrument)
+    else:
+        out = SYSTEM_METHODS[method](aug_mat, symbols)
+    return output_to_json(out)
+
+
+def _solve_batch(method, expression, starts, max_err, max_iter):
+    """
+    Runs in a worker process.
+    :return: for every initial value, the output as JSON values (holding the
+    metrics of the whole batch) or the message of the exception raised.
+    """
+    instrument = Instrumentation()
+    with instrument.phase('parse'):
+        expr = _expression(expression)
+    outs = _BATCHED[method](expr, starts, max_err, max_iter, instrument=instrument)
+    return [str(out) if isinstance(out, Exception) else output_to_json(out) for out in outs]
+
+
+class SolverService:
+    """
+    Dispatches requests to a process pool, coalescing identical concurrent
+    requests into one solve and Newton-Raphson requests with the same
+    expression, max_err and max_iter into one vectorized solve.
+    Fields:
+    -------
+    pool: the ProcessPoolExecutor running the solves
+    batch_window: the seconds a batchable request waits for others
+    max_batch: the largest number of requests solved by one vectorized call
+    metrics: a MetricsRecorder of the solves
+    requests, coalesced, batched: the requests received, those answered by
+    the solve of an identical request and those solved in a batch
+    """
+
+    def __init__(self, processes=None, batch_window=0.002, max_batch=256, metrics=None):
+        self.pool = ProcessPoolExecutor(processes)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.metrics = MetricsRecorder() if metrics is None else metrics
+        self.requests = self.coalesced = self.batched = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._batches = {}
+
+    def submit(self, request):
+        """
+        :param request: a JSON request, see normalize_request.
+        :return: a concurrent.futures.Future of the output as JSON values.
+        :raises RequestError: if the request is malformed.
+        """
+        request = normalize_request(request)
+        key = request_key(request)
+        with self._lock:
+            self.requests += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = Future()
+            self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._forget(key))
+        if request['method'] in _BATCHED and len(request['arguments']) == 1:
+            self._add_to_batch(request, future)
+        else:
+            self._chain(self.pool.submit(_solve, request), future)
+        return future
+
+    def solve(self, request, timeout=None):
+        return self.submit(request).result(timeout)
+
+    def _forget(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _chain(self, source: Future, target: Future):
+        def done(_):
+            if source.cancelled():
+                # the pool was shut down
+                target.cancel()
+            elif source.exception() is not None:
+                target.set_exception(source.exception())
+            else:
+                self._record(source.result())
+                target.set_result(source.result())
+        source.add_done_callback(done)
+
+    def _record(self, result):
+        if result.get('metrics') is not None:
+            self.metrics.record(result['metrics'])
+
+    def _add_to_batch(self, request, future):
+        group = (request['method'], request['expression'], request['max_err'], request['max_iter'])
+        with self._lock:
+            batch = self._batches.get(group)
+            if batch is None:
+                batch = self._batches[group] = []
+                timer = threading.Timer(self.batch_window, self._flush, (group,))
+                timer.daemon = True
+                timer.start()
+            batch.append((request['arguments'][0], future))
+            full = len(batch) >= self.max_batch
+        if full:
+            self._flush(group)
+
+    def _flush(self, group):
+        with self._lock:
+            batch = self._batches.pop(group, None)
+            if batch is not None and len(batch) > 1:
+                self.batched += len(batch)
+        if not batch:
+            return
+        method, expression, max_err, max_iter = group
+        if len(batch) == 1:
+            # nothing arrived to share the call with
+            start, future = batch[0]
+            request = {'method': method, 'expression': expression, 'arguments': [start],
+                       'max_err': max_err, 'max_iter': max_iter}
+            self._chain(self.pool.submit(_solve, request), future)
+            return
+        source = self.pool.submit(_solve_batch, method, expression, [start for start, _ in batch], max_err, max_iter)
+
+        def done(_):
+            if source.cancelled():
+                for _, future in batch:
+                    future.cancel()
+                return
+            if source.exception() is not None:
+                for _, future in batch:
+                    future.set_exception(source.exception())
+                return
+            solved = [result for result in source.result() if not isinstance(result, str)]
+            if solved:
+                self.metrics.record(solved[0]['metrics'], solves=len(solved))
+            for (_, future), result in zip(batch, source.result()):
+                if isinstance(result, str):
+                    future.set_exception(ValueError(result))
+                else:
+                    future.set_result(result)
+        source.add_done_callback(done)
+
+    def prometheus_text(self):
+        with self._lock:
+            counts = (('requests', self.requests, 'Requests received.'),
+                      ('coalesced', self.coalesced, 'Requests answered by the solve of an identical request.'),
+                      ('batched', self.batched, 'Requests solved by a vectorized batch.'))
+        lines = []
+        for name, value, text in counts:
+            lines += ['# HELP solver_service_%s_total %s' % (name, text),
+                      '# TYPE solver_service_%s_total counter' % name,
+                      'solver_service_%s_total %d' % (name, value)]
+        return '\n'.join(lines) + '\n' + self.metrics.prometheus_text()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+    timeout_seconds = 300
+
+    def _reply(self, status, body, content_type='application/json'):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            self._reply(200, self.service.prometheus_text(), 'text/plain; version=0.0.4')
+        else:
+            self._reply(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path != '/solve':
+            self._reply(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'null')
+            result = self.service.solve(request, self.timeout_seconds)
+        except (RequestError, json.JSONDecodeError) as e:
+            self._reply(400, {'error': str(e)})
+        except (TimeoutError, FutureTimeoutError):
+            # the solve is still running, its result is dropped
+            self._reply(504, {'error': 'The solve took more than %s seconds' % self.timeout_seconds})
+        except (BrokenProcessPool, CancelledError) as e:
+            # the pool broke or is shutting down
+            self._reply(503, {'error': str(e) or type(e).__name__})
+        except Exception as e:
+            # the solver rejected the problem (no roots in range, singular system...)
+            self._reply(422, {'error': str(e) or type(e).__name__})
+        else:
+            self._reply(200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # bursts of concurrent clients are what the coalescing is for
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def make_server(service, host='127.0.0.1', port=8765):
+    """
+    :return: a ThreadingHTTPServer serving service, call serve_forever on it.
+    Port 0 picks a free port (see server.server_address).
+    """
+    handler = type('Handler', (_Handler,), {'service': service})
+    return _Server((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--batch-window', type=float, default=0.002)
+    parser.add_argument('--metrics-jsonl', default=None)
+    args = parser.parse_args()
+    service = SolverService(args.processes, args.batch_window, metrics=MetricsRecorder(args.metrics_jsonl))
+    server = make_server(service, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Sparse Utilities:
+A minimal compressed sparse row (CSR) matrix backed by numpy arrays, used by
+the iterative solvers for systems that are too large to be stored densely.
+"""
+import numpy
+
+
+class CSRMatrix:
+    """
+    A compressed sparse row matrix, memory usage is O(nnz).
+    Fields:
+    -------
+    data: a numpy.array of floats containing the nonzero values
+    indices: a numpy.array containing the column index of each value
+    indptr: a numpy.array, row i is stored in data[indptr[i]:indptr[i + 1]]
+    shape: a (rows, columns) tuple
+    """
+
+    def __init__(self, data, indices, indptr, shape):
+        self.data = numpy.asarray(data, dtype=numpy.float64)
+        self.indices = numpy.asarray(indices, dtype=numpy.int64)
+        self.indptr = numpy.asarray(indptr, dtype=numpy.int64)
+        self.shape = (int(shape[0]), int(shape[1]))
+        self._row_ids = None
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape):
+        """
+        Builds a CSR matrix from coordinate triplets, duplicate entries are summed.
+        :param rows: row index of each entry.
+        :param cols: column index of each entry.
+        :param values: value of each entry.
+        :param shape: a (rows, columns) tuple.
+        :return: a CSRMatrix.
+        """
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        cols = numpy.asarray(cols, dtype=numpy.int64)
+        values = numpy.asarray(values, dtype=numpy.float64)
+        keys = rows * shape[1] + cols
+        order = numpy.argsort(keys, kind='stable')
+        keys, values = keys[order], values[order]
+        keys, start = numpy.unique(keys, return_index=True)
+        if len(values):
+            values = numpy.add.reduceat(values, start)
+        rows, cols = keys // shape[1], keys % shape[1]
+        indptr = numpy.zeros(shape[0] + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(values, cols, indptr, shape)
+
+    @classmethod
+    def from_dense(cls, a):
+        a = numpy.array(a).astype(numpy.float64)
+        rows, cols = numpy.nonzero(a)
+        return cls.from_coo(rows, cols, a[rows, cols], a.shape)
+
+    @classmethod
+    def from_any(cls, a):
+        """
+        Converts a CSRMatrix, a scipy.sparse matrix or a dense matrix to a CSRMatrix.
+        """
+        if isinstance(a, cls):
+            return a
+        if hasattr(a, 'tocsr'):
+            a = a.tocsr()
+            return cls(a.data, a.indices, a.indptr, a.shape)
+        return cls.from_dense(a)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @property
+    def row_ids(self):
+        """The row index of each stored value (computed once)."""
+        if self._row_ids is None:
+            self._row_ids = numpy.repeat(numpy.arange(self.shape[0], dtype=numpy.int64),
+                                         numpy.diff(self.indptr))
+        return self._row_ids
+
+    def row(self, i):
+        """
+        :return: the column indices and the values of the nonzeros in row i.
+        """
+        begin, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[begin:end], self.data[begin:end]
+
+    def diagonal(self):
+        d = numpy.zeros(min(self.shape), dtype=numpy.float64)
+        mask = self.row_ids == self.indices
+        numpy.add.at(d, self.indices[mask], self.data[mask])
+        return d
+
+    def dot(self, x):
+        """
+        Multiplies the matrix by the vector x in O(nnz).
+        """
+        return numpy.bincount(self.row_ids, weights=self.data * x[self.indices],
+                              minlength=self.shape[0])
+
+    def __matmul__(self, x):
+        return self.dot(x)
+
+    def take_rows(self, rows):
+        """
+        :return: a CSRMatrix made of the given rows, in the given order.
+        """
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        indptr = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=indptr[1:])
+        positions = numpy.repeat(self.indptr[rows] - indptr[:-1], lengths) + numpy.arange(indptr[-1])
+        return CSRMatrix(self.data[positions], self.indices[positions], indptr, (len(rows), self.shape[1]))
+
+    def transpose(self):
+        return CSRMatrix.from_coo(self.indices, self.row_ids, self.data, (self.shape[1], self.shape[0]))
+
+    def split_augmented(self):
+        """
+        Splits an augmented [n, n + 1] matrix into the coefficients matrix and the r.h.s vector.
+        :return: a CSRMatrix [n, n] and a dense numpy vector b.
+        """
+        n = self.shape[1] - 1
+        last = self.indices == n
+        b = numpy.zeros(self.shape[0], dtype=numpy.float64)
+        numpy.add.at(b, self.row_ids[last], self.data[last])
+        keep = ~last
+        return CSRMatrix.from_coo(self.row_ids[keep], self.indices[keep], self.data[keep],
+                                  (self.shape[0], n)), b
+
+    def toarray(self):
+        a = numpy.zeros(self.shape, dtype=numpy.float64)
+        numpy.add.at(a, (self.row_ids, self.indices), self.data)
+        return a
+
+
+def is_sparse(a):
+    """
+    :return: True if a is a CSRMatrix or a scipy.sparse matrix.
+    """
+    return isinstance(a, CSRMatrix) or hasattr(a, 'tocsr')
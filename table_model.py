@@ -0,0 +1,102 @@
+"""Table Model:
+A Qt table model shared by the GUIs, it reads the columns of a dataframe as
+numpy arrays, formats the cells in bulk one block of rows at a time and hands
+the rows to the view incrementally.
+"""
+from collections import OrderedDict
+
+import numpy
+from PyQt5 import QtCore
+
+
+class ColumnarTableModel(QtCore.QAbstractTableModel):
+    """
+    Populates a table view with the columns of a pandas dataframe, the first
+    column shows the row number.
+    Fields:
+    -------
+    columns: a list holding a numpy array per column of the dataframe
+    names: the column names
+    precision: the significant digits of float cells, None for the shortest
+    representation that round-trips
+    block_rows: the number of rows formatted at once
+    fetch_rows: the number of rows handed to the view by each fetchMore
+    loaded: the number of rows handed to the view so far
+    """
+
+    def __init__(self, data, parent=None, precision=None, block_rows=256, fetch_rows=1000, max_blocks=64):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+        self.columns = [data[name].to_numpy() for name in data.columns]
+        self.names = list(data.columns)
+        self.total = data.shape[0]
+        self.precision = precision
+        self.block_rows = block_rows
+        self.fetch_rows = fetch_rows
+        self.loaded = min(self.total, fetch_rows)
+        self._blocks = OrderedDict()
+        self._max_blocks = max_blocks
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns) + 1
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self.loaded < self.total
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(self.fetch_rows, self.total - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def set_precision(self, precision):
+        """
+        Changes the significant digits of float cells and repaints the view.
+        """
+        self.precision = precision
+        self._blocks.clear()
+        if self.loaded:
+            self.dataChanged.emit(self.index(0, 1), self.index(self.loaded - 1, len(self.columns)))
+
+    def _format(self, column: numpy.ndarray):
+        if self.precision is not None and column.dtype.kind == 'f':
+            return numpy.char.mod('%.' + str(self.precision) + 'g', column)
+        return [str(value) for value in column]
+
+    def _block(self, block):
+        """
+        :return: the formatted cells of a block of rows, one list per column.
+        """
+        cells = self._blocks.get(block)
+        if cells is None:
+            begin = block * self.block_rows
+            end = begin + self.block_rows
+            cells = [self._format(column[begin:end]) for column in self.columns]
+            self._blocks[block] = cells
+            if len(self._blocks) > self._max_blocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(block)
+        return cells
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if index.isValid():
+            if role == QtCore.Qt.DisplayRole:
+                if index.column() == 0:
+                    return index.row() + 1
+                block, row = divmod(index.row(), self.block_rows)
+                return str(self._block(block)[index.column() - 1][row])
+        return None
+
+    def headerData(self, col, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            if col == 0:
+                return 'i'
+            return str(self.names[col - 1])
+        return None
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pytest
+
+import async_solvers
+import Equations
+from equations_util import string_to_expression
+from instrumentation import Instrumentation
+from sparse_util import CSRMatrix
+
+
+def test_gather_matches_the_blocking_method():
+    expr = string_to_expression("x**3 - 2*x - 5")
+    starts = [1.0, 2.0, 3.0, 4.0]
+
+    async def solve():
+        return await asyncio.gather(*(async_solvers.newton(expr, [x]) for x in starts))
+    for start, out in zip(starts, asyncio.run(solve())):
+        numpy.testing.assert_allclose(out.roots, Equations.newton(expr, [start]).roots)
+
+
+def test_concurrency_is_bounded():
+    solver = async_solvers.AsyncSolver(max_concurrency=2)
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def work(i):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return i
+
+    async def solve():
+        return await asyncio.gather(*(solver.run(work, i) for i in range(10)))
+    assert asyncio.run(solve()) == list(range(10))
+    assert running[1] == 2
+    solver.shutdown()
+
+
+def test_map_yields_in_order():
+    solver = async_solvers.AsyncSolver(max_concurrency=3)
+
+    async def solve():
+        return [value async for value in solver.map(pow, [(i, 2) for i in range(10)])]
+    assert asyncio.run(solve()) == [i ** 2 for i in range(10)]
+    solver.shutdown()
+
+
+def slow_sparse_system(n=40):
+    """
+    A cyclic system that is not diagonally dominant, with an estimated Jacobi
+    spectral radius below 1, so auto picks jacobi.
+    """
+    rows = numpy.concatenate((numpy.arange(n), numpy.arange(n)))
+    columns = numpy.concatenate((numpy.arange(n), (numpy.arange(n) + 1) % n))
+    weights = numpy.where(numpy.arange(n) % 2 == 0, 1.2, 0.8316)
+    return CSRMatrix.from_coo(rows, columns, numpy.concatenate((numpy.ones(n), weights)), (n, n))
+
+
+@pytest.mark.parametrize('method', [async_solvers.jacobi, async_solvers.auto])
+def test_cancel_stops_an_iterative_solve(method):
+    n = 40
+    instrument = Instrumentation()
+
+    async def solve():
+        task = asyncio.ensure_future(method(slow_sparse_system(n), list(range(n)), b=numpy.ones(n),
+                                            max_iter=10 ** 5, max_err=0, instrument=instrument))
+        while instrument.counters['iterations'] < 3:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the solve stops in its thread at the next iteration
+        cancelled_at = instrument.counters['iterations']
+        await asyncio.sleep(0.2)
+        return cancelled_at
+    cancelled_at = asyncio.run(solve())
+    assert instrument.counters['iterations'] <= cancelled_at + 1
+    assert instrument.callbacks == []
+
+
+def test_process_pool_restores_the_functions():
+    solver = async_solvers.AsyncSolver(ProcessPoolExecutor(1), 1)
+    expr = string_to_expression("x**2 - 2")
+    out = asyncio.run(async_solvers.newton(expr, [1.0], solver=solver, instrument=Instrumentation()))
+    assert out.function(2.0) == 2.0 and out.metrics['counters']['iterations'] > 0
+    solver.shutdown()
+
+
+def test_direct_methods_document_that_they_run_to_the_end():
+    assert "not stopped" in async_solvers.gauss.__doc__
+    assert "not stopped" not in async_solvers.auto.__doc__
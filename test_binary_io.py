@@ -0,0 +1,101 @@
+import numpy
+import pytest
+import sympy
+
+from binary_io import MappedMatrix, load_system
+from EquSys import auto, gauss_seidel, ilu0_preconditioner, jacobi
+from matrix_analysis import analyze_matrix
+
+
+@pytest.fixture
+def system():
+    rng = numpy.random.default_rng(7)
+    a = rng.uniform(-1, 1, (20, 20))
+    numpy.fill_diagonal(a, numpy.abs(a).sum(axis=1) + 1)
+    return a, rng.uniform(-1, 1, 20)
+
+
+def check(loaded, a, b):
+    mapped, rhs = loaded
+    assert isinstance(mapped, MappedMatrix)
+    numpy.testing.assert_array_equal(rhs, b)
+    numpy.testing.assert_array_equal(mapped.diagonal(), numpy.diag(a))
+    x = numpy.linspace(-1, 1, 20)
+    numpy.testing.assert_allclose(mapped @ x, a @ x)
+
+
+def test_npy_augmented(tmp_path, system):
+    a, b = system
+    numpy.save(tmp_path / 'aug.npy', numpy.column_stack((a, b)))
+    loaded = load_system(str(tmp_path / 'aug.npy'), block_rows=3)
+    assert isinstance(loaded[0].array, numpy.memmap)
+    check(loaded, a, b)
+
+
+def test_npy_with_separate_rhs(tmp_path, system):
+    a, b = system
+    numpy.save(tmp_path / 'a.npy', a)
+    numpy.save(tmp_path / 'b.npy', b)
+    check(load_system(str(tmp_path / 'a.npy'), b_path=str(tmp_path / 'b.npy')), a, b)
+
+
+@pytest.mark.parametrize('save', [numpy.savez, numpy.savez_compressed])
+def test_npz(tmp_path, system, save):
+    a, b = system
+    save(tmp_path / 'system.npz', A=a, b=b)
+    loaded = load_system(str(tmp_path / 'system.npz'))
+    # only uncompressed archives can be mapped
+    assert isinstance(loaded[0].array, numpy.memmap) == (save is numpy.savez)
+    check(loaded, a, b)
+
+
+def test_raw_binary(tmp_path, system):
+    a, b = system
+    aug = numpy.column_stack((a, b)).astype(numpy.float32)
+    aug.tofile(tmp_path / 'aug.bin')
+    loaded = load_system(str(tmp_path / 'aug.bin'), shape=aug.shape, dtype=numpy.float32)
+    check(loaded, a.astype(numpy.float32), b.astype(numpy.float32))
+    with pytest.raises(ValueError):
+        load_system(str(tmp_path / 'aug.bin'))
+
+
+@pytest.mark.parametrize('method', [jacobi, gauss_seidel])
+def test_block_sweeps_match_numpy(tmp_path, system, method):
+    a, b = system
+    numpy.save(tmp_path / 'aug.npy', numpy.column_stack((a, b)))
+    mapped, rhs = load_system(str(tmp_path / 'aug.npy'), block_rows=6)
+    out = method(mapped, sympy.symbols('x0:20'), b=rhs, max_iter=500, max_err=1e-12)
+    numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(a, b), atol=1e-9)
+
+
+def test_mapped_matrix_errors(tmp_path, system):
+    a, b = system
+    numpy.save(tmp_path / 'a.npy', a)
+    # without a r.h.s file the last column is the r.h.s
+    mapped, rhs = load_system(str(tmp_path / 'a.npy'))
+    with pytest.raises(ValueError):
+        gauss_seidel(mapped, sympy.symbols('x0:19'), b=rhs, multicolor=True)
+    with pytest.raises(ValueError):
+        jacobi(mapped, sympy.symbols('x0:19'), b=rhs, processes=2)
+
+
+@pytest.mark.parametrize('symmetric', [False, True])
+def test_mapped_analysis_matches_dense(tmp_path, system, symmetric):
+    a, _ = system
+    a = a + a.T if symmetric else a
+    numpy.save(tmp_path / 'a.npy', a)
+    mapped = MappedMatrix(numpy.load(tmp_path / 'a.npy', mmap_mode='r'), block_rows=6)
+    expected, analysis = vars(analyze_matrix(a)), vars(analyze_matrix(mapped))
+    assert analysis.pop('mapped') and not expected.pop('mapped')
+    assert analysis == pytest.approx(expected)
+
+
+def test_auto_solves_a_mapped_matrix(tmp_path, system):
+    a, b = system
+    numpy.save(tmp_path / 'aug.npy', numpy.column_stack((a, b)))
+    aug = MappedMatrix(numpy.load(tmp_path / 'aug.npy', mmap_mode='r'), block_rows=6)
+    out = auto(aug, sympy.symbols('x0:20'), max_iter=500, max_err=1e-12)
+    assert out.dispatch in ('jacobi', 'gauss_seidel', 'conjugate_gradient', 'gmres')
+    numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(a, b), atol=1e-9)
+    with pytest.raises(ValueError):
+        ilu0_preconditioner(aug.split_augmented()[0])
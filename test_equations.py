@@ -0,0 +1,26 @@
+import numpy
+import pytest
+
+from Equations import *
+from equations_util import string_to_expression
+
+
+def run(method, expr, arguments):
+    try:
+        return method(string_to_expression(expr), arguments)
+    except Exception as e:
+        return e
+
+
+@pytest.mark.parametrize('expr', ['x**2 - 2', 'cos(x)', 'x**2', 'x**3 - 2*x - 5', 'atan(x)'])
+def test_newton_batch_matches_newton(expr):
+    starts = [float(x) for x in numpy.linspace(-3, 3, 25)] + [0.0]
+    with numpy.errstate(all='ignore'):
+        batch = newton_batch(string_to_expression(expr), starts)
+        for start, lane in zip(starts, batch):
+            single = run(newton, expr, [start])
+            assert type(lane) is type(single)
+            if isinstance(single, Output):
+                numpy.testing.assert_allclose(lane.roots, single.roots, atol=1e-12, equal_nan=True)
+                numpy.testing.assert_allclose(lane.errors, single.errors, atol=1e-12, equal_nan=True)
+                assert len(lane.dataframes[0]) == len(single.dataframes[0])
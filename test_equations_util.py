@@ -0,0 +1,113 @@
+import numpy
+import pytest
+import sympy
+from sympy.solvers.solveset import NonlinearError, linear_eq_to_matrix
+
+from equations_util import *
+from EquSys import jacobi
+
+SAMPLE = ["x1 + x2 + 2 * x3 = 8", "-x1 - 2 * x2 + 3 * x3 = 1", "3*x1+7*x2+4*x3 = 10",
+          "x4 = 0.5 - x1", "2.5e1*x2 - x4 / 4 + x3 = 3 * x1"]
+
+
+def test_dense_parse_matches_sympy():
+    A, b, symbols = equations_to_matrices(SAMPLE)
+    names = sympy.symbols('x1:5')
+    expected_A, expected_b = linear_eq_to_matrix([sympy.sympify("(%s) - (%s)" % tuple(eq.split('=')))
+                                                  for eq in SAMPLE], names)
+    assert symbols == list(names)
+    assert A == expected_A
+    assert b == expected_b
+
+
+def test_dense_parse_keeps_integers_exact():
+    A, b, _ = equations_to_matrices(["2*x + 3*y = 7", "x - y = 1"])
+    assert all(isinstance(value, sympy.Integer) for value in list(A) + list(b))
+
+
+@pytest.mark.parametrize('equations', [["x + y - y = 1", "2*x = y + 2 - y"], ["0*z + x = 2", "x - 2*z + 2*z = 2"],
+                                       ["x + 2*(y - y) = 1"]])
+def test_cancelled_variables_have_no_column(equations):
+    A, b, symbols = equations_to_matrices(equations)
+    assert symbols == [sympy.Symbol('x')]
+    sparse_A, _, sparse_symbols, _ = parse_linear_equations(equations)
+    assert sparse_symbols == symbols and sparse_A.nnz == len(equations)
+    numpy.testing.assert_allclose(sparse_A.toarray(), numpy.array(A, dtype=numpy.float64))
+
+
+def test_sparse_parse_matches_dense():
+    A, b, symbols, stats = parse_linear_equations(SAMPLE)
+    dense_A, dense_b, dense_symbols = equations_to_matrices(SAMPLE)
+    assert symbols == dense_symbols
+    numpy.testing.assert_allclose(A.toarray(), numpy.array(dense_A, dtype=numpy.float64))
+    numpy.testing.assert_allclose(b, numpy.array(dense_b, dtype=numpy.float64).ravel())
+    assert stats.equations == len(SAMPLE)
+    assert stats.terms == A.nnz
+    assert stats.fallbacks == 1
+
+
+def test_sympy_fallback_and_blank_lines():
+    A, b, symbols, stats = parse_linear_equations(["2*(x + y) = 4", "", "x - y = 0", "   "])
+    assert symbols == list(sympy.symbols('x y'))
+    numpy.testing.assert_allclose(A.toarray(), [[2.0, 2.0], [1.0, -1.0]])
+    numpy.testing.assert_allclose(b, [4.0, 0.0])
+    assert stats.equations == 2
+    assert stats.fallbacks == 1
+
+
+@pytest.mark.parametrize('equation', ["x*y = 1", "x**2 + y = 1", "sin(x) = 1"])
+def test_nonlinear_equations_are_rejected(equation):
+    with pytest.raises(NonlinearError):
+        parse_linear_equations([equation])
+    with pytest.raises(NonlinearError):
+        equations_to_matrices([equation])
+
+
+def test_malformed_equation_is_rejected():
+    with pytest.raises(sympy.SympifyError):
+        parse_linear_equations(["4x = 2"])
+
+
+@pytest.mark.parametrize('equation', ["x + y", "x = y = 1"])
+def test_equation_without_one_equal_sign_is_rejected(equation):
+    with pytest.raises(ValueError):
+        equations_to_matrices([equation])
+
+
+def history(mode, k=1, sweeps=10, max_iter=20):
+    h = IterationHistory(2, max_iter, mode, k)
+    for i in range(sweeps + 1):
+        h.record(i, [i, -i], 1.0 / (i + 1))
+    h.finish(sweeps, [sweeps, -sweeps], 1.0 / (sweeps + 1))
+    return h.to_dataframe(['x', 'y'])
+
+
+@pytest.mark.parametrize('mode, k, kept', [
+    ('full', 1, list(range(11))),
+    ('every', 3, [0, 3, 6, 9, 10]),
+    ('every', 5, [0, 5, 10]),
+    ('last', 4, [7, 8, 9, 10]),
+    ('last', 20, list(range(11))),
+    ('off', 1, [10]),
+])
+def test_history_modes(mode, k, kept):
+    df = history(mode, k)
+    assert df.index.tolist() == kept
+    assert df['x'].tolist() == kept
+    assert df['y'].tolist() == [-i for i in kept]
+    numpy.testing.assert_allclose(df['Error'], [1.0 / (i + 1) for i in kept])
+    assert list(df.columns) == ['x', 'y', 'Error']
+
+
+def test_history_matches_the_solvers():
+    a, b = sympy.Matrix([[4, 1], [1, 3]]), sympy.Matrix([1, 2])
+    full = jacobi(a, list('xy'), b=b, max_err=1e-10).dataframes[-1]
+    last = jacobi(a, list('xy'), b=b, max_err=1e-10, history='last', history_k=3).dataframes[-1]
+    assert last.equals(full.iloc[-3:])
+
+
+def test_history_errors():
+    with pytest.raises(ValueError):
+        IterationHistory(2, 10, 'some')
+    with pytest.raises(ValueError):
+        IterationHistory(2, 10, 'every', 0)
@@ -0,0 +1,455 @@
+import numpy
+import pytest
+import sympy
+
+from EquSys import *
+from EquSys import FactoredSystem, _color_unknowns
+from equations_util import equations_to_aug_matrix
+from part1_output import Output
+from sparse_util import CSRMatrix
+
+# the samples of test.py
+SAMPLE = ["x1 + x2 + 2 * x3 = 8", "-x1 - 2 * x2 + 3 * x3 = 1", "3*x1+7*x2+4*x3 = 10"]
+
+
+def solution(system):
+    system = numpy.array(system).astype(numpy.float64)
+    return numpy.linalg.solve(system[:, :-1], system[:, -1])
+
+
+def values(output):
+    return numpy.array(output.dataframes[-1]["Values"].tolist()).astype(numpy.float64)
+
+
+def dominant_system(n=30, seed=0):
+    """
+    :return: a sparse, strictly diagonally dominant [n, n] matrix and a r.h.s.
+    """
+    rng = numpy.random.default_rng(seed)
+    a = numpy.where(rng.random((n, n)) < 0.1, rng.uniform(-1, 1, (n, n)), 0.0)
+    numpy.fill_diagonal(a, numpy.abs(a).sum(axis=1) + 1)
+    return a, rng.uniform(-5, 5, n)
+
+
+def test_multicolor_gauss_seidel_matches_numpy():
+    a, b = dominant_system()
+    symbols = sympy.symbols('x0:30')
+    out = gauss_seidel(a, symbols, b=b, max_iter=500, max_err=1e-12, multicolor=True)
+    assert out.title == "Gauss-Seidel (Multicolor)"
+    numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(a, b), atol=1e-9)
+    # fewer sweeps than Jacobi, every color class reads the updated classes before it
+    assert out.iterations < jacobi(a, symbols, b=b, max_iter=500, max_err=1e-12).iterations
+
+
+def test_multicolor_classes_are_independent():
+    a, _ = dominant_system()
+    classes = _color_unknowns(a)
+    assert sorted(numpy.concatenate(classes).tolist()) == list(range(30))
+    for c in classes:
+        block = a[numpy.ix_(c, c)]
+        assert numpy.count_nonzero(block - numpy.diag(numpy.diag(block))) == 0
+
+
+def test_multicolor_gauss_seidel_on_sympy_system():
+    aug, symbols = equations_to_aug_matrix(["4*x + y = 1", "x + 3*y - z = 2", "-y + 5*z = 3"])
+    out = gauss_seidel(aug, symbols, max_iter=200, max_err=1e-12, multicolor=True)
+    numpy.testing.assert_allclose(out.roots, solution(aug), atol=1e-9)
+
+
+@pytest.mark.parametrize('method', [jacobi, gauss_seidel])
+def test_csr_iterations_match_dense(method):
+    a, b = dominant_system()
+    symbols = sympy.symbols('x0:30')
+    sparse = method(CSRMatrix.from_dense(a), symbols, b=b, max_iter=500, max_err=1e-12)
+    dense = method(a, symbols, b=b, max_iter=500, max_err=1e-12)
+    numpy.testing.assert_allclose(sparse.roots, numpy.linalg.solve(a, b), atol=1e-9)
+    numpy.testing.assert_allclose(sparse.roots, dense.roots, atol=1e-12)
+    assert sparse.iterations == dense.iterations
+
+
+@pytest.mark.parametrize('method', [jacobi, gauss_seidel])
+def test_csr_augmented_matrix(method):
+    aug, symbols = equations_to_aug_matrix(["4*x + y = 1", "x + 3*y - z = 2", "-y + 5*z = 3"])
+    out = method(CSRMatrix.from_dense(numpy.array(aug, dtype=numpy.float64)), symbols, max_iter=200,
+                 max_err=1e-12)
+    numpy.testing.assert_allclose(out.roots, solution(aug), atol=1e-9)
+
+
+def spd_system(n=30, seed=1):
+    a, b = dominant_system(n, seed)
+    return a + a.T, b
+
+
+@pytest.mark.parametrize('preconditioner', [None, 'jacobi', 'ilu0'])
+@pytest.mark.parametrize('sparse', [False, True])
+def test_conjugate_gradient_matches_numpy(preconditioner, sparse):
+    a, b = spd_system()
+    out = conjugate_gradient(CSRMatrix.from_dense(a) if sparse else a, sympy.symbols('x0:30'), b=b,
+                             max_iter=200, max_err=1e-12, preconditioner=preconditioner)
+    numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(a, b), atol=1e-9)
+    assert out.errors[-1] < 1e-12
+    assert out.dataframes[-1]["Residual"].iloc[-1] < 1e-12
+
+
+@pytest.mark.parametrize('method', [bicgstab, gmres])
+@pytest.mark.parametrize('preconditioner', [None, 'jacobi', 'ilu0'])
+def test_nonsymmetric_krylov_matches_numpy(method, preconditioner):
+    a, b = dominant_system(seed=2)
+    out = method(a, sympy.symbols('x0:30'), b=b, max_iter=300, max_err=1e-12, preconditioner=preconditioner)
+    numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(a, b), atol=1e-9)
+
+
+def test_preconditioning_saves_iterations():
+    a, b = spd_system()
+    a = a * numpy.logspace(0, 3, 30)[:, None] ** 0.5 * numpy.logspace(0, 3, 30) ** 0.5
+    symbols = sympy.symbols('x0:30')
+    plain = conjugate_gradient(a, symbols, b=b, max_iter=500, max_err=1e-10)
+    ilu = conjugate_gradient(a, symbols, b=b, max_iter=500, max_err=1e-10, preconditioner='ilu0')
+    assert ilu.iterations < plain.iterations
+
+
+def test_ilu0_is_exact_without_fill_in():
+    a = numpy.diag([4.0] * 6) + numpy.diag([-1.0] * 5, 1) + numpy.diag([-2.0] * 5, -1)
+    r = numpy.arange(6.0)
+    numpy.testing.assert_allclose(ilu0_preconditioner(a)(r), numpy.linalg.solve(a, r))
+
+
+def test_preconditioner_errors():
+    a = numpy.array([[0.0, 1.0], [1.0, 2.0]])
+    with pytest.raises(ValueError):
+        jacobi_preconditioner(a)
+    with pytest.raises(ValueError):
+        ilu0_preconditioner(a)
+    with pytest.raises(ValueError):
+        conjugate_gradient(a, list('xy'), b=[1.0, 1.0], preconditioner='jacobi')
+
+
+def test_auto_small_dense_system():
+    aug, symbols = equations_to_aug_matrix(SAMPLE)
+    out = auto(aug, symbols)
+    assert out.dispatch == 'gauss'
+    numpy.testing.assert_allclose(values(out), solution(aug))
+    numpy.testing.assert_allclose(values(out), [float(v) for v in aug[:, :3].LUsolve(aug[:, 3])])
+
+
+def banded(n, offsets):
+    a = sum(numpy.diag(numpy.full(n - abs(k), -1.0), k) for k in offsets if k)
+    return a + numpy.diag(numpy.full(n, 2.0 * len(offsets)))
+
+
+def indefinite(n=30, seed=3):
+    rng = numpy.random.default_rng(seed)
+    a = rng.uniform(-1, 1, (n, n))
+    a = a + a.T
+    numpy.fill_diagonal(a, 0.1)
+    return a
+
+
+def zero_diagonal(n=30):
+    a, _ = dominant_system(n)
+    a[0, 0], a[0, 1] = 0.0, a[0, 1] + 5.0
+    return a
+
+
+def weak_diagonal(n=30, seed=4):
+    rng = numpy.random.default_rng(seed)
+    return rng.uniform(-1, 1, (n, n)) + 2 * numpy.eye(n)
+
+
+def poisson(m):
+    """
+    :return: the 5-point Laplacian of an [m, m] grid, sparse and positive definite.
+    """
+    t = banded(m, (-1, 0, 1)) - 4 * numpy.eye(m)
+    return numpy.kron(numpy.eye(m), t) + numpy.kron(t, numpy.eye(m))
+
+
+@pytest.mark.parametrize('a, sparse, dispatch', [
+    # dense
+    (dominant_system()[0], False, 'lu_decomp'),
+    (dominant_system(300)[0], False, 'jacobi'),
+    (spd_system()[0], False, 'cholesky'),
+    (spd_system(300)[0], False, 'conjugate_gradient'),
+    (weak_diagonal(), False, 'lu_decomp'),
+    (indefinite(), False, 'lu_decomp'),
+    # banded
+    (banded(40, (-1, 0, 1)), False, 'thomas'),
+    (banded(40, (-2, -1, 0, 1, 2)), False, 'banded_lu'),
+    (banded(2000, (-2, -1, 0, 1, 2)), True, 'conjugate_gradient'),
+    (poisson(30), True, 'conjugate_gradient'),
+    # sparse symmetric positive definite
+    (spd_system()[0], True, 'conjugate_gradient'),
+    # sparse nonsymmetric
+    (dominant_system()[0], True, 'gauss_seidel'),
+    (zero_diagonal(), True, 'gmres'),
+])
+def test_auto_dispatch(a, sparse, dispatch):
+    n = len(a)
+    b = numpy.linspace(-1, 1, n)
+    out = auto(CSRMatrix.from_dense(a) if sparse else a, sympy.symbols('x0:%d' % n), b=b, max_iter=500,
+               max_err=1e-12)
+    assert out.dispatch == dispatch
+    assert out.dispatch_reason
+    assert out.title.startswith("Auto (")
+    numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(a, b), atol=1e-8)
+
+
+def test_exact_lu_decomp_matches_sympy():
+    aug, symbols = equations_to_aug_matrix(SAMPLE)
+    out = lu_decomp(aug, symbols)
+    assert list(out.dataframes[-1]["Values"]) == list(aug[:, :3].LUsolve(aug[:, 3]))
+
+
+@pytest.mark.parametrize('precision, title', [
+    (None, "LU Decomposition"),
+    ('double', "LU Decomposition"),
+    ('mixed', "LU Decomposition (mixed precision)"),
+])
+def test_numeric_lu_decomp_matches_numpy(precision, title):
+    a, b = dominant_system()
+    system = numpy.column_stack((a, b))
+    out = lu_decomp(system, sympy.symbols('x0:30'), precision=precision)
+    assert out.title == title
+    numpy.testing.assert_allclose(values(out), numpy.linalg.solve(a, b), rtol=1e-12, atol=1e-14)
+
+
+def test_mixed_precision_refines_to_double_accuracy():
+    a, b = dominant_system(seed=4)
+    a = a + 1e-3 * numpy.random.default_rng(4).uniform(-1, 1, a.shape)
+    out = lu_decomp(numpy.column_stack((a, b)), sympy.symbols('x0:30'), precision='mixed')
+    assert out.refinement_steps > 0
+    assert out.backward_error <= numpy.finfo(numpy.float64).eps * numpy.sqrt(30)
+
+
+def test_mixed_precision_falls_back_on_ill_conditioned_system():
+    n = 12
+    a = 1.0 / (numpy.arange(n)[:, None] + numpy.arange(n) + 1)
+    b = a.sum(axis=1)
+    out = lu_decomp(numpy.column_stack((a, b)), sympy.symbols('x0:12'), precision='mixed')
+    assert out.title == "LU Decomposition (float64 fallback)"
+    # the solution itself is not accurate, the backward error is small
+    assert out.backward_error < 1e-14
+
+
+def test_lu_decomp_errors():
+    system = numpy.array([[1.0, 2.0, 3.0], [2.0, 4.0, 6.0]])
+    with pytest.raises(ValueError):
+        lu_decomp(system, list('xy'), precision='quad')
+    with pytest.raises(ValueError):
+        lu_decomp(system, list('xy'), precision='double')
+
+
+@pytest.mark.parametrize('form', ['dense', 'csr', 'sympy'])
+def test_thomas_matches_numpy(form):
+    a = banded(20, (-1, 0, 1))
+    system = numpy.column_stack((a, numpy.arange(20.0)))
+    system = {'dense': system, 'csr': CSRMatrix.from_dense(system), 'sympy': sympy.Matrix(system)}[form]
+    numpy.testing.assert_allclose(values(thomas(system, sympy.symbols('x0:20'))),
+                                  numpy.linalg.solve(a, numpy.arange(20.0)))
+
+
+def test_thomas_zero_pivot():
+    system = numpy.array([[0.0, 1.0, 1.0], [1.0, 1.0, 2.0]])
+    with pytest.raises(ValueError):
+        thomas(system, list('xy'))
+
+
+@pytest.mark.parametrize('lower, upper', [(None, None), (2, 1), (3, 3)])
+def test_banded_lu_pivots(lower, upper):
+    rng = numpy.random.default_rng(5)
+    a = sum(numpy.diag(rng.uniform(-1, 1, 25 - abs(k)), k) for k in (-2, -1, 0, 1))
+    # small pivots on the diagonal force row interchanges
+    a[numpy.diag_indices(25)] *= 1e-3
+    b = rng.uniform(-1, 1, 25)
+    out = banded_lu(CSRMatrix.from_dense(numpy.column_stack((a, b))), sympy.symbols('x0:25'), lower, upper)
+    numpy.testing.assert_allclose(values(out), numpy.linalg.solve(a, b), rtol=1e-9)
+
+
+def test_banded_lu_nonzero_outside_band():
+    system = numpy.column_stack((banded(6, (-2, -1, 0, 1, 2)), numpy.ones(6)))
+    with pytest.raises(ValueError):
+        banded_lu(system, sympy.symbols('x0:6'), lower=1, upper=1)
+    with pytest.raises(ValueError):
+        thomas(system, sympy.symbols('x0:6'))
+
+
+def test_cholesky_matches_numpy_on_csr():
+    a, b = spd_system()
+    out = cholesky(CSRMatrix.from_dense(numpy.column_stack((a, b))), sympy.symbols('x0:30'))
+    numpy.testing.assert_allclose(values(out), numpy.linalg.solve(a, b))
+
+
+def test_cholesky_matches_numpy():
+    a = numpy.array([[4.0, 1.0, 0.5], [1.0, 3.0, 0.2], [0.5, 0.2, 2.0]])
+    system = numpy.column_stack((a, [1.0, 2.0, 3.0]))
+    numpy.testing.assert_allclose(values(cholesky(system, list('xyz'))), solution(system))
+
+
+def test_cholesky_rejects_nonsymmetric_matrix():
+    system = numpy.array([[4.0, 1.0, 2.0, 15.0], [1.0, 3.0, 0.0, 10.0], [2.0, 5.0, 6.0, 41.0]])
+    with pytest.raises(ValueError):
+        cholesky(system, list('xyz'))
+
+
+def test_cholesky_rejects_indefinite_matrix():
+    system = numpy.array([[1.0, 2.0, 1.0], [2.0, 1.0, 1.0]])
+    with pytest.raises(ValueError):
+        cholesky(system, list('xy'))
+
+
+def test_bareiss_is_exact():
+    aug = sympy.Matrix([[sympy.Rational(1, 3), 2, -1, 1], [4, sympy.Rational(-5, 2), 6, 0], [7, 8, 10, 3]])
+    out = bareiss(aug, list('xyz'))
+    assert list(out.dataframes[-1]["Values"]) == list(aug[:, :3].LUsolve(aug[:, 3]))
+    numpy.testing.assert_allclose(out.roots, solution(aug))
+
+
+def test_bareiss_needs_a_row_interchange():
+    aug = sympy.Matrix([[0, 1, 1, 3], [1, 0, 1, 2], [1, 1, 0, 1]])
+    assert list(bareiss(aug, list('xyz')).dataframes[-1]["Values"]) == list(aug[:, :3].LUsolve(aug[:, 3]))
+
+
+def test_bareiss_singular():
+    with pytest.raises(ValueError):
+        bareiss(sympy.Matrix([[1, 2, 3], [2, 4, 5]]), list('xy'))
+
+
+def test_gauss_batch_matches_numpy():
+    rng = numpy.random.default_rng(6)
+    systems = rng.uniform(-1, 1, (50, 4, 5))
+    systems[7, 3, :4] = 2 * systems[7, 1, :4]
+    x, singular = gauss_batch(systems)
+    assert singular.tolist() == [k == 7 for k in range(50)]
+    assert numpy.isnan(x[7]).all()
+    regular = ~singular
+    numpy.testing.assert_allclose(x[regular], numpy.linalg.solve(systems[regular, :, :4], systems[regular, :, 4]),
+                                  rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize('shape', [(4, 5), (2, 4, 4), (2, 3, 5)])
+def test_gauss_batch_shape(shape):
+    with pytest.raises(ValueError):
+        gauss_batch(numpy.ones(shape))
+
+
+@pytest.mark.parametrize('method, kwargs', [
+    (gauss, {}), (gauss_jordan, {}), (lu_decomp, {}), (lu_decomp, {'precision': 'double'}),
+    (lu_decomp, {'precision': 'mixed'}),
+])
+def test_direct_solution_diagnostics(method, kwargs):
+    aug, symbols = equations_to_aug_matrix(SAMPLE)
+    a = numpy.array(aug[:, :3]).astype(numpy.float64)
+    system = aug if not kwargs else numpy.array(aug).astype(numpy.float64)
+    out = method(system, symbols, **kwargs)
+    numpy.testing.assert_allclose(out.roots, solution(aug))
+    assert out.residual < 1e-12
+    assert out.backward_error < 1e-15
+    # Hager's estimate is a lower bound, exact on small matrices
+    assert out.condition_estimate == pytest.approx(numpy.linalg.cond(a, 1))
+
+
+def test_condition_estimate_of_ill_conditioned_system():
+    n = 8
+    a = 1.0 / (numpy.arange(n)[:, None] + numpy.arange(n) + 1)
+    out = lu_decomp(numpy.column_stack((a, a.sum(axis=1))), sympy.symbols('x0:8'), precision='double')
+    cond = numpy.linalg.cond(a, 1)
+    assert cond / 10 <= out.condition_estimate <= cond * 1.01
+    assert out.backward_error < 1e-15
+
+
+@pytest.mark.parametrize('method', [gauss, gauss_jordan, lu_decomp])
+def test_singular_exact_system_has_no_diagnostics(method):
+    out = method(sympy.Matrix([[1, 2, 3], [2, 4, 5]]), list('xy'))
+    assert out.residual is None and out.condition_estimate is None and out.factors is None
+
+
+def test_low_rank_update_matches_numpy():
+    a, b = dominant_system()
+    symbols = sympy.symbols('x0:30')
+    factors = lu_decomp(numpy.column_stack((a, b)), symbols, precision='double').factors
+    for row in (3, 17):
+        a[row] += numpy.linspace(-0.5, 0.5, 30)
+        out = lu_decomp(numpy.column_stack((a, b)), symbols, factors=factors)
+        assert out.title == "LU Decomposition (low-rank update)"
+        assert out.factors is factors
+        numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(a, b), rtol=1e-10)
+    assert factors.rank == 2
+    assert factors.refactors == 0
+    assert out.backward_error < 1e-14
+
+
+def test_exact_solve_factors_can_be_updated():
+    aug, symbols = equations_to_aug_matrix(SAMPLE)
+    factors = gauss(aug, symbols).factors
+    edited = numpy.array(aug).astype(numpy.float64)
+    edited[1, :3] = [2.0, -1.0, 1.0]
+    out = lu_decomp(edited, symbols, factors=factors)
+    numpy.testing.assert_allclose(out.roots, solution(edited))
+
+
+def test_many_edited_rows_refactor():
+    a, b = dominant_system()
+    symbols = sympy.symbols('x0:30')
+    factors = FactoredSystem(a)
+    a[:10] *= 1.5
+    out = lu_decomp(numpy.column_stack((a, b)), symbols, factors=factors)
+    assert out.title == "LU Decomposition (refactored)"
+    assert factors.refactors == 1 and factors.rank == 0
+    numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(a, b), rtol=1e-10)
+    numpy.testing.assert_allclose(out.condition_estimate, numpy.linalg.cond(a, 1), rtol=0.5)
+
+
+def test_singular_edit_is_reported():
+    a = numpy.array([[2.0, 1.0, 0.0], [1.0, 3.0, 1.0], [0.0, 1.0, 4.0]])
+    factors = FactoredSystem(a, max_rank=2)
+    edited = a.copy()
+    # makes A0 + UV^T singular: row 1 becomes a multiple of row 0, the
+    # correction fails and so does the factorization of the edited matrix
+    edited[1] = 2 * a[0]
+    with pytest.raises(ValueError):
+        lu_decomp(numpy.column_stack((edited, numpy.ones(3))), list('xyz'), factors=factors)
+
+
+def test_factors_of_a_different_size():
+    factors = FactoredSystem(numpy.eye(3))
+    with pytest.raises(ValueError):
+        lu_decomp(numpy.column_stack((numpy.eye(4), numpy.ones(4))), list('wxyz'), factors=factors)
+
+
+@pytest.mark.parametrize('method', [jacobi, gauss_seidel])
+def test_warm_start_saves_iterations(method):
+    a, b = dominant_system()
+    symbols = sympy.symbols('x0:30')
+    cache = WarmStartCache()
+    cold = method(a, symbols, b=b, max_iter=500, max_err=1e-10, cache=cache)
+    assert not cold.warm_start and cache.misses == 1
+    # the next time step, a slightly perturbed system
+    warm = method(a, symbols, b=b * 1.001, max_iter=500, max_err=1e-10, cache=cache)
+    assert warm.warm_start and cache.hits == 1
+    assert warm.iterations < cold.iterations
+    assert warm.iterations_saved == cold.iterations - warm.iterations
+    numpy.testing.assert_allclose(warm.roots, numpy.linalg.solve(a, b * 1.001), atol=1e-8)
+
+
+def test_warm_start_on_sympy_system():
+    aug, symbols = equations_to_aug_matrix(["4*x + y = 1", "x + 3*y - z = 2", "-y + 5*z = 3"])
+    cache = WarmStartCache()
+    cold = gauss_seidel(aug, symbols, max_iter=100, max_err=1e-8, cache=cache)
+    warm = gauss_seidel(aug, symbols, max_iter=100, max_err=1e-8, cache=cache)
+    assert warm.warm_start
+    assert warm.iterations < cold.iterations
+    numpy.testing.assert_allclose(warm.roots, solution(aug), atol=1e-7)
+
+
+def test_warm_start_cache_eviction_and_divergence():
+    cache = WarmStartCache(max_entries=2)
+    out = Output()
+    for names in ('xy', 'yz', 'zw'):
+        out.roots = numpy.ones(2)
+        cache.put(cache.key(list(names)), out)
+    assert list(cache.entries) == [cache.key(list('yz')), cache.key(list('zw'))]
+    out.roots = numpy.array([numpy.inf, 1.0])
+    cache.put(cache.key(list('ab')), out)
+    assert cache.get(cache.key(list('ab'))) is None
+    # an explicit initial vector is used as given
+    assert jacobi(numpy.eye(2), list('yz'), b=[1.0, 2.0], x=[0.0, 0.0], cache=cache).warm_start is False
@@ -0,0 +1,73 @@
+import json
+
+import numpy
+import pandas
+import pytest
+
+from Equations import newton
+from EquSys import gauss
+from equations_util import equations_to_aug_matrix, string_to_expression
+from export_util import export_outputs, outputs_to_frame
+
+
+@pytest.fixture
+def outs():
+    aug, symbols = equations_to_aug_matrix(["x + y = 3", "x - y = 1"])
+    return [newton(string_to_expression("x**2 - 2"), [1.0]), gauss(aug, symbols)]
+
+
+def read(path, fmt):
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+        return table.to_pandas(), table.schema.metadata[b'solver_metadata'].decode()
+    if fmt == 'hdf5':
+        with pandas.HDFStore(path, mode='r') as store:
+            return store['results'], store.get_storer('results').attrs.solver_metadata
+    if fmt == 'npz':
+        with numpy.load(path) as data:
+            return (pandas.DataFrame({name: data['column:' + name] for name in data['columns']}),
+                    str(data['metadata']))
+    with open(path + '.json') as f:
+        return pandas.read_csv(path), f.read()
+
+
+def test_outputs_to_frame(outs):
+    frame = outputs_to_frame(outs)
+    newton_rows = frame[frame['output'] == 0]
+    assert len(newton_rows) == len(outs[0].dataframes[0])
+    assert (newton_rows['method'] == outs[0].title).all()
+    # the exact values of gauss are stored as floats, NaN in the tables lacking the column
+    gauss_rows = frame[frame['output'] == 1]
+    assert gauss_rows['Values'].tolist() == [2.0, 1.0]
+    assert newton_rows['Values'].isna().all()
+    assert outputs_to_frame([]).columns.tolist() == ['method', 'output', 'table', 'iteration']
+
+
+@pytest.mark.parametrize('fmt, suffix', [('parquet', '.parquet'), ('hdf5', '.h5'), ('npz', '.npz'),
+                                         ('csv', '.csv')])
+def test_round_trip(tmp_path, outs, fmt, suffix):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    if fmt == 'hdf5':
+        pytest.importorskip('tables')
+    steps = []
+    path = export_outputs(outs, str(tmp_path / ('session' + suffix)), session={'expression': 'x**2 - 2'},
+                          progress=lambda done, total: steps.append((done, total)))
+    frame, metadata = read(path, fmt)
+    expected = outputs_to_frame(outs)
+    assert list(frame.columns) == list(expected.columns)
+    numpy.testing.assert_allclose(frame['Values'].astype(float), expected['Values'])
+    assert frame['method'].tolist() == expected['method'].tolist()
+    metadata = json.loads(metadata)
+    assert metadata['session'] == {'expression': 'x**2 - 2'}
+    assert [out['title'] for out in metadata['outputs']] == [out.title for out in outs]
+    assert metadata['outputs'][1]['roots'] == [2.0, 1.0]
+    assert steps[-1] == (3, 3)
+
+
+def test_unknown_format(tmp_path, outs):
+    with pytest.raises(ValueError):
+        export_outputs(outs, str(tmp_path / 'session.xlsx'))
+    with pytest.raises(ValueError):
+        export_outputs(outs, str(tmp_path / 'session.npz'), fmt='xlsx')
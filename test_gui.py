@@ -0,0 +1,84 @@
+import os
+import threading
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QApplication, QTableView
+
+import Gui
+from Equations import newton
+from equations_util import string_to_expression
+from result_cache import ResultCache
+
+if QtCore.QCoreApplication.instance() is None:
+    app = QApplication([])
+elif not isinstance(QtCore.QCoreApplication.instance(), QApplication):
+    pytest.skip("a non-GUI application is already running", allow_module_level=True)
+
+
+@pytest.fixture
+def window(monkeypatch):
+    monkeypatch.setattr(Gui, 'default_cache', lambda: ResultCache(':memory:'))
+    window = Gui.EquationSolverUi()
+    yield window
+    window.close()
+
+
+def tables(tab):
+    return tab.findChildren(QTableView)
+
+
+def test_tabs_are_built_when_first_shown(window):
+    expr = string_to_expression("x**2 - 2")
+    outs = [newton(expr, [start]) for start in (1.0, -1.0, 3.0)]
+    for out in outs:
+        window.add_result(out)
+    tabs = [window.tabWidget_2.widget(i) for i in range(3)]
+    # adding the first tab shows it
+    assert tables(tabs[0]) and not tables(tabs[1]) and not tables(tabs[2])
+    assert set(window.pending_tabs) == set(tabs[1:])
+    window.tabWidget_2.setCurrentIndex(2)
+    assert tables(tabs[2]) and not tables(tabs[1])
+    assert window.tabWidget_2.widget(2) is tabs[2]
+    assert tables(tabs[2])[0].model().total == len(outs[2].dataframes[0])
+    window.clear()
+    assert window.tabWidget_2.count() == 0 and window.pending_tabs == {}
+
+
+def test_results_of_a_cleared_session_are_dropped(window):
+    expr = string_to_expression("x**2 - 2")
+    release = threading.Event()
+
+    def solve(start):
+        release.wait(10)
+        return newton(expr, [start])
+
+    window.solves.submit(solve, 1.0, result=window.add_result)
+    window.clear()
+    window.solves.submit(solve, -1.0, result=window.add_result)
+    release.set()
+    while not window.solves.pool.waitForDone(10):
+        app.processEvents()
+    app.processEvents()
+    assert [out.roots for out in window.outs] == [newton(expr, [-1.0]).roots]
+    assert window.indices == [0, len(window.outs[0].dataframes)]
+    window.tabWidget_2.setCurrentIndex(0)
+    window.tab_changed(0)
+
+
+def test_sampled_curves_are_bounded_per_output(window):
+    out = newton(string_to_expression("x**2 - 2"), [1.0])
+    window.add_result(out)
+    for shift in range(3 * Gui.CURVE_VIEWPORTS):
+        window.sample_curves(out, -2.0 + shift, 2.0 + shift)
+    cache = window.curve_cache[out]
+    assert len(cache) == Gui.CURVE_VIEWPORTS
+    # the last viewports are kept, the latest one last
+    assert [low for low, high, width in cache] == [-2.0 + shift for shift in range(2 * Gui.CURVE_VIEWPORTS,
+                                                                                  3 * Gui.CURVE_VIEWPORTS)]
+    first = next(iter(cache))
+    window.sample_curves(out, first[0], first[1])
+    assert list(cache)[-1] == first
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import numpy
+from PyQt5 import QtCore
+
+from EquSys import jacobi
+from gui_worker import SolveQueue
+from instrumentation import Instrumentation
+
+app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def wait(pool):
+    while not pool.waitForDone(10):
+        app.processEvents()
+    app.processEvents()
+
+
+def test_cancel_stops_an_instrumented_solve():
+    n = 50
+    system = numpy.column_stack((numpy.eye(n) + numpy.ones((n, n)) / n, numpy.ones(n)))
+    instrument = Instrumentation()
+    results, errors = [], []
+    queue = SolveQueue(pool=QtCore.QThreadPool())
+    queue.error.connect(errors.append)
+    queue.submit(lambda: jacobi(system, list(range(n)), max_iter=10 ** 7, max_err=0, history='off',
+                                instrument=instrument), instrument=instrument, result=results.append)
+    while instrument.counters['iterations'] == 0:
+        time.sleep(0.01)
+    queue.cancel()
+    wait(queue.pool)
+    assert 0 < instrument.counters['iterations'] < 10 ** 7
+    assert results == [] and errors == [] and not queue.busy
+
+
+def test_cancel_drops_a_running_solve():
+    started, release = threading.Event(), threading.Event()
+
+    def solve():
+        started.set()
+        release.wait()
+        return 1
+    results, errors, done = [], [], []
+    queue = SolveQueue(pool=QtCore.QThreadPool())
+    queue.error.connect(errors.append)
+    queue.submit(solve, result=results.append, done=done.append)
+    started.wait()
+    queue.cancel()
+    assert not queue.busy
+    release.set()
+    wait(queue.pool)
+    assert results == [] and errors == [] and done == []
+
+
+def test_results_and_errors_are_delivered():
+    results, errors, done = [], [], []
+    queue = SolveQueue(pool=QtCore.QThreadPool())
+    queue.error.connect(errors.append)
+    queue.submit(sum, [1, 2, 3], result=results.append, done=done.append)
+    queue.submit(int, "not a number", done=done.append)
+    wait(queue.pool)
+    assert results == [6] and len(errors) == 1 and sorted(done) == [False, True]
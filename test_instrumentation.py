@@ -0,0 +1,74 @@
+import json
+import threading
+from concurrent.futures import CancelledError
+
+import numpy
+import pytest
+
+from Equations import newton
+from EquSys import jacobi
+from equations_util import string_to_expression
+from instrumentation import Cancellation, Instrumentation, MetricsRecorder, cancellation_check, describe
+
+
+def test_newton_is_instrumented():
+    calls = []
+    instrument = Instrumentation(callbacks=[lambda k, x, err: calls.append(k)])
+    with instrument.phase('parse'):
+        expr = string_to_expression("x**2 - 2")
+    out = newton(expr, [1.0], instrument=instrument)
+    metrics = out.metrics
+    assert metrics['method'] == out.title
+    assert set(metrics['timings']) == {'parse', 'differentiate', 'compile', 'iterate', 'tabulate'}
+    # the first row of the table is the initial value
+    iterations = metrics['counters']['iterations']
+    assert iterations == len(out.dataframes[0]) - 1
+    assert calls == list(range(1, iterations + 1))
+    assert metrics['counters']['nfev'] == metrics['counters']['njev'] == iterations + 1
+    assert describe(metrics).startswith("Phases: parse ")
+
+
+def test_jacobi_is_instrumented():
+    a = numpy.array([[4.0, 1.0], [1.0, 3.0]])
+    errors = []
+    instrument = Instrumentation(callbacks=[lambda k, x, err: errors.append(err)])
+    out = jacobi(a, list('xy'), b=[1.0, 2.0], max_err=1e-10, instrument=instrument)
+    assert out.metrics['counters']['iterations'] == out.iterations
+    assert set(out.metrics['timings']) == {'iterate', 'tabulate'}
+    assert numpy.isnan(errors[0]) and errors[-1] < 1e-10
+    assert len(errors) == out.iterations + 1
+
+
+def test_uninstrumented_solve_has_no_metrics():
+    assert newton(string_to_expression("x**2 - 2"), [1.0]).metrics is None
+
+
+def test_cancellation_check_stops_the_solve():
+    event = threading.Event()
+    event.set()
+    with pytest.raises(CancelledError):
+        jacobi(numpy.eye(2), list('xy'), b=[1.0, 2.0], instrument=Instrumentation([cancellation_check(event)]))
+
+
+def test_cancellation_stops_the_solve():
+    event = threading.Event()
+    event.set()
+    with pytest.raises(CancelledError):
+        jacobi(numpy.eye(2), list('xy'), b=[1.0, 2.0], instrument=Cancellation(event))
+
+
+def test_metrics_recorder(tmp_path):
+    recorder = MetricsRecorder(str(tmp_path / 'metrics.jsonl'), str(tmp_path / 'metrics.prom'))
+    metrics = {'method': 'New"ton', 'timings': {'iterate': 0.5}, 'counters': {'iterations': 3, 'nfev': 4}}
+    recorder.record(metrics)
+    recorder.record(metrics, solves=2, batch=True)
+    lines = [json.loads(line) for line in open(tmp_path / 'metrics.jsonl')]
+    assert [line['solves'] for line in lines] == [1, 2]
+    assert lines[1]['batch'] is True and lines[1]['counters'] == metrics['counters']
+    text = open(tmp_path / 'metrics.prom').read()
+    assert text == recorder.prometheus_text()
+    assert 'solver_solves_total{method="New\\"ton"} 3' in text
+    assert 'solver_phase_seconds_total{method="New\\"ton",phase="iterate"} 1.0' in text
+    assert 'solver_nfev_total{method="New\\"ton"} 8' in text
+    assert '# TYPE solver_iterations_total counter' in text
+    assert not (tmp_path / 'metrics.prom.tmp').exists()
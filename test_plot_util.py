@@ -0,0 +1,70 @@
+import math
+
+import numpy
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from plot_util import BlitManager, adaptive_sample, decimate, default_range, evaluate
+
+
+def test_evaluate_falls_back_to_scalars():
+    x = numpy.array([-1.0, 0.0, 4.0])
+    numpy.testing.assert_array_equal(evaluate(numpy.sqrt, x), [numpy.nan, 0.0, 2.0])
+    # math.sqrt does not broadcast and fails on a negative point
+    numpy.testing.assert_array_equal(evaluate(math.sqrt, x), [numpy.nan, 0.0, 2.0])
+    numpy.testing.assert_array_equal(evaluate(lambda v: 3.0, x), [3.0, 3.0, 3.0])
+
+
+def test_default_range():
+    assert default_range([]) == (-20.0, 20.0)
+    assert default_range([numpy.nan, 1.0]) == (-1.0, 3.0)
+    assert default_range([0.0, 10.0]) == (-5.0, 15.0)
+
+
+def test_adaptive_sample_refines_where_the_curvature_is_high():
+    x, y = adaptive_sample(lambda v: numpy.tanh(50 * v), -1, 1, points=64)
+    assert numpy.all(numpy.diff(x) > 0)
+    numpy.testing.assert_allclose(y, numpy.tanh(50 * x))
+    steps = numpy.diff(x)
+    assert steps[numpy.abs(x[:-1]) < 0.05].mean() < steps[numpy.abs(x[:-1]) > 0.5].mean() / 4
+    # a line needs no refinement
+    assert len(adaptive_sample(lambda v: 2 * v + 1, -1, 1, points=64)[0]) == 64
+
+
+def test_adaptive_sample_keeps_to_the_budget():
+    x, _ = adaptive_sample(lambda v: numpy.sin(1 / v), 1e-3, 1, points=64, max_points=500)
+    assert len(x) <= 500
+
+
+def test_decimate_keeps_the_extremes_of_each_column():
+    x = numpy.linspace(0, 1, 10001)
+    y = numpy.sin(200 * x)
+    dx, dy = decimate(x, y, 100)
+    assert len(dx) <= 200
+    assert dy.max() == y.max() and dy.min() == y.min()
+    short = numpy.arange(5.0)
+    assert decimate(short, short, 100)[0] is short
+
+
+def test_blit_manager_redraws_only_the_artists():
+    canvas = FigureCanvasAgg(Figure())
+    axes = canvas.figure.add_subplot()
+    manager = BlitManager(canvas)
+    line = manager.add(axes.plot([0, 1], [0, 1])[0])
+    assert line.get_animated()
+    draws = []
+    canvas.mpl_connect('draw_event', draws.append)
+    # without a background the figure is drawn and the background captured
+    manager.update()
+    assert len(draws) == 1 and manager.background is not None
+    line.set_ydata([1, 0])
+    manager.update()
+    assert len(draws) == 1
+    before = numpy.asarray(canvas.buffer_rgba()).copy()
+    line.set_ydata([0, 1])
+    manager.update()
+    assert not numpy.array_equal(numpy.asarray(canvas.buffer_rgba()), before)
+    manager.update(full=True)
+    assert len(draws) == 2
+    manager.remove(line)
+    assert manager.artists == []
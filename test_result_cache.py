@@ -0,0 +1,81 @@
+import os
+
+import numpy
+import pytest
+import sympy
+
+import Equations
+from EquSys import gauss, jacobi
+from equations_util import equations_to_aug_matrix, string_to_expression
+from instrumentation import Instrumentation
+from result_cache import ResultCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(str(tmp_path / 'results.sqlite'))
+    yield cache
+    cache.close()
+
+
+def test_hit_returns_stored_output(cache):
+    aug, symbols = equations_to_aug_matrix(["4*x + y = 1", "x + 3*y = 2"])
+    first = cache.solve(gauss, aug, symbols)
+    second = cache.solve(gauss, aug, symbols)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not first.cached and second.cached
+    numpy.testing.assert_allclose(second.roots, first.roots)
+
+
+def test_hit_drops_the_metrics_of_the_original_solve(cache):
+    aug, symbols = equations_to_aug_matrix(["4*x + y = 1", "x + 3*y = 2"])
+    first = cache.solve(jacobi, aug, symbols, options={'instrument': Instrumentation()})
+    second = cache.solve(jacobi, aug, symbols, options={'instrument': Instrumentation()})
+    assert first.metrics is not None and second.cached and second.metrics is None
+
+
+def test_restore_rebuilds_the_functions(cache):
+    expr = string_to_expression("x**2 - 2")
+    cache.solve(Equations.newton, expr, [1.0], restore=Equations.restore_functions)
+    out = cache.solve(Equations.newton, expr, [1.0], restore=Equations.restore_functions)
+    assert out.cached and out.function(2.0) == 2.0
+
+
+def test_keys_depend_on_every_argument():
+    expr = string_to_expression("x**2 - 2")
+    keys = {ResultCache.key(Equations.newton, expr, [1.0]),
+            ResultCache.key(Equations.newton, expr, [1.0], 1e-6),
+            ResultCache.key(Equations.newton, expr, [2.0]),
+            ResultCache.key(Equations.secant, expr, [1.0])}
+    assert len(keys) == 4
+    assert ResultCache.key(Equations.newton, expr, [1.0]) == ResultCache.key(Equations.newton, expr, [1.0], 1e-5)
+
+
+def test_least_recently_used_outputs_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / 'results.sqlite'), max_bytes=20000)
+    for i in range(20):
+        cache.solve(gauss, sympy.Matrix([[2, 1, i], [1, 3, 1]]), list(sympy.symbols('x y')))
+    assert 0 < len(cache) < 20 and cache.size() <= 20000
+    cache.invalidate(gauss)
+    assert len(cache) == 0
+
+
+def test_persists_across_sessions(tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    aug, symbols = equations_to_aug_matrix(["4*x + y = 1", "x + 3*y = 2"])
+    ResultCache(path).solve(gauss, aug, symbols)
+    assert ResultCache(path).solve(gauss, aug, symbols).cached
+    assert oct(os.stat(path).st_mode & 0o777) == oct(0o600)
+
+
+def test_refuses_a_file_others_can_write(tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    ResultCache(path).close()
+    os.chmod(path, 0o666)
+    with pytest.raises(PermissionError):
+        ResultCache(path)
+
+
+def test_uncacheable_arguments_bypass_the_cache(cache):
+    out = cache.solve(lambda f: f(), lambda: 42)
+    assert out == 42 and len(cache) == 0
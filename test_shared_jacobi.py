@@ -0,0 +1,47 @@
+import multiprocessing
+import timeit
+from concurrent.futures import CancelledError
+
+import numpy
+import pytest
+
+import shared_jacobi
+from EquSys import jacobi
+from instrumentation import Instrumentation
+
+
+def dominant_system(n, seed=0):
+    a = numpy.random.default_rng(seed).random((n, n))
+    a += numpy.diag(a.sum(axis=1) + 1)
+    return numpy.column_stack((a, numpy.ones(n)))
+
+
+def test_small_system_is_swept_serially():
+    system = dominant_system(50)
+    out = jacobi(system, list(range(50)), max_iter=500, max_err=1e-12, processes=2)
+    assert out.title == "Jacobi"
+    numpy.testing.assert_allclose(out.roots, numpy.linalg.solve(system[:, :-1], system[:, -1]), atol=1e-10)
+
+
+def test_parallel_sweeps_match_serial():
+    # the smallest dense system worth splitting
+    n = int(shared_jacobi.MIN_NONZEROS ** 0.5)
+    system = dominant_system(n)
+    serial = jacobi(system, list(range(n)), max_iter=30, max_err=1e-12, history='off')
+    parallel = jacobi(system, list(range(n)), max_iter=30, max_err=1e-12, history='off', processes=2)
+    assert parallel.title == "Jacobi (2 processes)"
+    numpy.testing.assert_allclose(parallel.roots, serial.roots, atol=1e-12)
+
+
+def test_cancelled_parallel_solve_stops_quickly():
+    n = int(shared_jacobi.MIN_NONZEROS ** 0.5)
+
+    def cancel(iteration, x, error):
+        if iteration == 3:
+            raise CancelledError()
+    begin = timeit.default_timer()
+    with pytest.raises(CancelledError):
+        jacobi(dominant_system(n), list(range(n)), max_iter=10 ** 6, max_err=0, history='off', processes=2,
+               instrument=Instrumentation([cancel]))
+    assert timeit.default_timer() - begin < 5
+    assert not multiprocessing.active_children()
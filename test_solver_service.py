@@ -0,0 +1,82 @@
+import http.client
+import json
+import threading
+from concurrent.futures import CancelledError, Future
+
+import numpy
+import pytest
+
+from solver_service import RequestError, SolverService, make_server
+
+
+@pytest.fixture
+def service():
+    service = SolverService(processes=1, batch_window=0.05)
+    yield service
+    service.close()
+
+
+def test_lone_newton_request_is_instrumented(service):
+    result = service.solve({'method': 'newton', 'expression': 'x**2 - 2', 'arguments': [1]}, 60)
+    assert abs(result['roots'][0] - 2 ** 0.5) < 1e-5
+    assert result['metrics']['counters']['iterations'] > 0
+    assert 'solver_solves_total{method="Newton-Raphson"} 1' in service.prometheus_text()
+
+
+def test_batched_newton_requests_are_recorded(service):
+    futures = [service.submit({'method': 'newton', 'expression': 'x**2 - 2', 'arguments': [start]})
+               for start in (1, 2, 3, 4)]
+    roots = [future.result(60)['roots'][0] for future in futures]
+    assert max(abs(root - 2 ** 0.5) for root in roots) < 1e-5
+    assert service.batched == 4
+    assert 'solver_solves_total{method="Newton-Raphson"} 4' in service.prometheus_text()
+
+
+def test_identical_requests_are_coalesced(service):
+    request = {'method': 'jacobi', 'equations': ['4*x + y = 1', 'x + 3*y = 2']}
+    first, second = service.submit(request), service.submit(dict(request))
+    assert first is second
+    assert service.coalesced == 1
+    first.result(60)
+
+
+@pytest.mark.parametrize('method', ['jacobi', 'gauss_seidel', 'conjugate_gradient', 'lu_decomp', 'auto'])
+def test_system_methods_match_numpy(service, method):
+    request = {'method': method, 'equations': ['4*x + y = 1', 'x + 3*y - z = 2', '-y + 5*z = 3'],
+               'max_err': 1e-10, 'max_iter': 200}
+    roots = service.solve(request, 60)['roots']
+    expected = numpy.linalg.solve([[4, 1, 0], [1, 3, -1], [0, -1, 5]], [1, 2, 3])
+    numpy.testing.assert_allclose(numpy.array(roots, dtype=numpy.float64), expected, atol=1e-8)
+
+
+def test_malformed_request():
+    with pytest.raises(RequestError):
+        SolverService.submit(None, {'method': 'no_such_method'})
+
+
+def test_cancelled_solve_resolves_the_request(service):
+    # what the pool does to the queued solves when it is shut down
+    source, target = Future(), Future()
+    service._chain(source, target)
+    source.cancel()
+    with pytest.raises(CancelledError):
+        target.result(1)
+
+
+def test_timed_out_solve_replies_504():
+    class Stalled:
+        @staticmethod
+        def solve(request, timeout):
+            return Future().result(0.01)
+
+    server = make_server(Stalled(), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+        connection.request('POST', '/solve', json.dumps({'method': 'newton'}))
+        response = connection.getresponse()
+        assert response.status == 504
+        assert 'error' in json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,39 @@
+import numpy
+import pytest
+
+from sparse_util import CSRMatrix, is_sparse
+
+DENSE = numpy.array([[4.0, 0.0, 1.0], [0.0, 0.0, 0.0], [2.0, -1.0, 3.0]])
+
+
+def test_from_coo_sums_duplicates():
+    a = CSRMatrix.from_coo([2, 0, 2, 0], [1, 0, 1, 2], [1.0, 4.0, -2.0, 1.0], (3, 3))
+    numpy.testing.assert_array_equal(a.toarray(), [[4.0, 0.0, 1.0], [0.0, 0.0, 0.0], [0.0, -1.0, 0.0]])
+    assert a.nnz == 3
+
+
+def test_round_trip_and_products():
+    a = CSRMatrix.from_dense(DENSE)
+    x = numpy.array([1.0, -2.0, 0.5])
+    numpy.testing.assert_array_equal(a.toarray(), DENSE)
+    numpy.testing.assert_allclose(a @ x, DENSE @ x)
+    numpy.testing.assert_array_equal(a.diagonal(), numpy.diag(DENSE))
+    numpy.testing.assert_array_equal(a.transpose().toarray(), DENSE.T)
+    numpy.testing.assert_array_equal(a.take_rows([2, 0]).toarray(), DENSE[[2, 0]])
+    cols, vals = a.row(1)
+    assert len(cols) == len(vals) == 0
+
+
+def test_split_augmented():
+    aug = numpy.column_stack((DENSE, [1.0, 0.0, 7.0]))
+    a, b = CSRMatrix.from_dense(aug).split_augmented()
+    numpy.testing.assert_array_equal(a.toarray(), DENSE)
+    numpy.testing.assert_array_equal(b, [1.0, 0.0, 7.0])
+
+
+def test_from_scipy():
+    scipy_sparse = pytest.importorskip('scipy.sparse')
+    m = scipy_sparse.csc_matrix(DENSE)
+    assert is_sparse(m)
+    assert not is_sparse(DENSE)
+    numpy.testing.assert_array_equal(CSRMatrix.from_any(m).toarray(), DENSE)
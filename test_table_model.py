@@ -0,0 +1,50 @@
+import numpy
+import pandas
+from PyQt5 import QtCore
+
+from table_model import ColumnarTableModel
+
+app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+FRAME = pandas.DataFrame({'x': numpy.linspace(0, 1, 2500), 'n': numpy.arange(2500), 'name': ['r'] * 2500})
+
+
+def cell(model, row, column):
+    return model.data(model.index(row, column))
+
+
+def test_cells_and_headers():
+    model = ColumnarTableModel(FRAME, block_rows=100)
+    assert model.columnCount() == 4
+    assert [model.headerData(c, QtCore.Qt.Horizontal) for c in range(4)] == ['i', 'x', 'n', 'name']
+    assert cell(model, 0, 0) == 1
+    for row in (0, 150, 999):
+        assert float(cell(model, row, 1)) == FRAME['x'][row]
+        assert cell(model, row, 2) == str(row)
+        assert cell(model, row, 3) == 'r'
+
+
+def test_rows_are_fetched_incrementally():
+    model = ColumnarTableModel(FRAME, fetch_rows=1000)
+    inserted = []
+    model.rowsInserted.connect(lambda parent, first, last: inserted.append((first, last)))
+    assert model.rowCount() == 1000
+    while model.canFetchMore():
+        model.fetchMore()
+    assert inserted == [(1000, 1999), (2000, 2499)]
+    assert model.rowCount() == 2500
+    assert float(cell(model, 2499, 1)) == 1.0
+
+
+def test_precision_and_block_eviction():
+    model = ColumnarTableModel(FRAME, block_rows=10, max_blocks=3, fetch_rows=2500)
+    changed = []
+    model.dataChanged.connect(lambda first, last: changed.append((first.row(), last.row())))
+    model.set_precision(3)
+    assert changed == [(0, 2499)]
+    assert cell(model, 1, 1) == '%.3g' % FRAME['x'][1]
+    # integer columns are not rounded
+    assert cell(model, 1234, 2) == '1234'
+    for row in range(0, 100, 10):
+        cell(model, row, 1)
+    assert len(model._blocks) == 3